@@ -19,9 +19,13 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR 
 # THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import threading, Queue, logging
+import os, sys, time, threading, Queue, logging
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
-from hotwire.gutil import call_timeout,remove_idle
+from hotwire.gutil import call_timeout,add_fd_watch,remove_idle
 from hotwire.externals.singletonmixin import Singleton
 
 _logger = logging.getLogger("hotwire.Async")
@@ -72,7 +76,64 @@ class MiniThreadPool(Singleton):
             except:
                 logging.exception("Exception in thread pool worker")
 
+def _ordered_map_worker(func, work):
+    while True:
+        item = work.get()
+        if item is None:
+            return
+        (arg, slot) = item
+        try:
+            slot.append(func(arg))
+        except:
+            slot.append(None)
+            slot.append(sys.exc_info())
+        slot[0].set()
+
+def ordered_thread_map(func, iterable, jobs, window):
+    """Like itertools.imap, but calling func from jobs worker threads, with
+at most window calls in progress or waiting to be returned.  Results are
+returned in order; an exception from func is raised when its result would
+have been."""
+    work = Queue.Queue()
+    for i in xrange(jobs):
+        thr = threading.Thread(target=_ordered_map_worker, args=(func, work), name="ordered_thread_map Thread")
+        thr.setDaemon(True)
+        thr.start()
+    # Each slot is [event, result, exc_info]
+    pending = []
+    def finish(slot):
+        slot[0].wait()
+        if len(slot) > 2:
+            raise slot[2][0], slot[2][1], slot[2][2]
+        return slot[1]
+    try:
+        for arg in iterable:
+            slot = [threading.Event()]
+            pending.append(slot)
+            work.put((arg, slot))
+            while len(pending) >= window or (pending and pending[0][0].isSet()):
+                yield finish(pending.pop(0))
+        while pending:
+            yield finish(pending.pop(0))
+    finally:
+        for i in xrange(jobs):
+            work.put(None)
+
+def estimate_size(obj):
+    """Return a rough estimate of the memory used by obj, in bytes."""
+    if isinstance(obj, basestring):
+        return len(obj)
+    try:
+        return sys.getsizeof(obj)
+    except (AttributeError, TypeError), e:
+        return 64
+
 class IterableQueue(Queue.Queue):
+    """A queue which can notify a handler in the main loop when items are
+added, and optionally bounds its size.  When bounded, producers block in
+put() until the consumer makes room; the None terminator is never blocked.
+The handler is woken through a pipe watched by the main loop, so it runs as
+soon as the main loop is free; see set_wakeup_delay()."""
     def __init__(self):
         Queue.Queue.__init__(self)
         self.__lock = threading.Lock()
@@ -80,6 +141,89 @@ class IterableQueue(Queue.Queue):
         self.__handler = None
         self.__handler_args = None
         self.__timeout_kwargs = None
+        self.__wakeup_delay = 0
+        self.__wakeup_fds = None
+        self.__wakeup_watch_id = 0
+        self.__wakeup_pending = False
+        self.__maxitems = 0
+        self.__maxbytes = 0
+        self.__bytes = 0
+        self.__closed = False
+        self.__terminated = False
+        self.__close_handler = None
+
+    def set_capacity(self, maxitems=0, maxbytes=0):
+        """Bound the queue to maxitems objects and/or an estimated maxbytes;
+        zero means unlimited.  Producers waiting for room are woken, so calling
+        this with no arguments releases any blocked producer."""
+        self.not_full.acquire()
+        try:
+            self.__maxitems = maxitems
+            self.__maxbytes = maxbytes
+            self.__bytes = 0
+            if maxbytes:
+                for item in self.queue:
+                    self.__bytes += estimate_size(item)
+            self.not_full.notifyAll()
+        finally:
+            self.not_full.release()
+
+    def get_capacity(self):
+        return (self.__maxitems, self.__maxbytes)
+
+    def set_wakeup_delay(self, msecs):
+        """Wake the handler at most once per msecs milliseconds, so that items
+        put in quick succession are handled together.  Zero, the default, wakes
+        it immediately.  Takes effect on the next connect()."""
+        self.__wakeup_delay = msecs
+
+    def set_close_handler(self, handler):
+        """Set a function to be called (from the consumer's thread) when
+        the consumer closes this queue before the producer has finished."""
+        self.__close_handler = handler
+
+    def close(self):
+        """Called by the consumer when it will read no more items.  Queued
+        items are discarded, blocked producers are woken, and any later
+        put is silently dropped."""
+        self.not_full.acquire()
+        try:
+            if self.__closed:
+                return
+            self.__closed = True
+            self.queue.clear()
+            self.__bytes = 0
+            self.not_full.notifyAll()
+            handler = (not self.__terminated) and self.__close_handler
+        finally:
+            self.not_full.release()
+        if handler:
+            handler()
+
+    def is_closed(self):
+        return self.__closed
+
+    def __is_full(self):
+        return (self.__maxitems and len(self.queue) >= self.__maxitems) \
+            or (self.__maxbytes and self.__bytes >= self.__maxbytes)
+
+    def __wait_for_room(self, block):
+        # Must be called with the mutex held
+        while self.__is_full() and not self.__closed:
+            if not block:
+                raise Queue.Full
+            self.not_full.wait()
+
+    def _put(self, item):
+        if self.__maxbytes:
+            self.__bytes += estimate_size(item)
+        self.queue.append(item)
+
+    def _get(self):
+        item = self.queue.popleft()
+        if self.__maxbytes:
+            self.__bytes -= estimate_size(item)
+        return item
 
     def connect(self, handler, *args, **kwargs):
         self.__lock.acquire()
@@ -87,6 +231,8 @@ class IterableQueue(Queue.Queue):
         self.__handler_args = args
         self.__timeout_kwargs = kwargs
         self.__handler = handler
+        if not self.__wakeup_delay:
+            self.__open_wakeup()
         self.__lock.release()
         if not self.empty():
             self.__add_idle()
@@ -98,7 +244,61 @@ class IterableQueue(Queue.Queue):
         if self.__handler_idle_id > 0:
             remove_idle(self.__handler_idle_id)
             self.__handler_idle_id = 0
+        self.__close_wakeup()
+        self.__lock.release()
+
+    def __open_wakeup(self):
+        # Must be called with the lock held.  Without a pipe, __add_idle
+        # falls back to a main loop timeout.
+        if fcntl is None:
+            return
+        try:
+            fds = os.pipe()
+        except OSError, e:
+            _logger.debug("failed to create wakeup pipe", exc_info=True)
+            return
+        for fd in fds:
+            fcntl.fcntl(fd, fcntl.F_SETFL, fcntl.fcntl(fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+            fcntl.fcntl(fd, fcntl.F_SETFD, fcntl.FD_CLOEXEC)
+        self.__wakeup_fds = fds
+        self.__wakeup_pending = False
+        self.__wakeup_watch_id = add_fd_watch(fds[0], self.__do_wakeup, **self.__timeout_kwargs)
+
+    def __close_wakeup(self):
+        # Must be called with the lock held
+        if self.__wakeup_fds is None:
+            return
+        remove_idle(self.__wakeup_watch_id)
+        self.__wakeup_watch_id = 0
+        for fd in self.__wakeup_fds:
+            os.close(fd)
+        self.__wakeup_fds = None
+
+    def __do_wakeup(self):
+        self.__lock.acquire()
+        fds = self.__wakeup_fds
+        if fds is not None:
+            try:
+                # There is at most one byte pending
+                os.read(fds[0], 1)
+            except OSError, e:
+                pass
+            self.__wakeup_pending = False
+        handler = self.__handler
         self.__lock.release()
+        if fds is None:
+            return False
+        if handler and handler(self, *self.__handler_args):
+            # Like a timeout returning True; other main loop sources get a
+            # turn before the handler runs again.
+            self.__add_idle()
+        elif self.__terminated and not self._qsize():
+            # Nothing more can arrive; give back the descriptors now rather
+            # than waiting for disconnect().
+            self.__lock.acquire()
+            self.__close_wakeup()
+            self.__lock.release()
+        return True
 
     def __do_idle(self):
         self.__lock.acquire()
@@ -110,18 +310,84 @@ class IterableQueue(Queue.Queue):
 
     def __add_idle(self):
         self.__lock.acquire()
-        if self.__handler_idle_id == 0 and self.__handler:           
-            self.__handler_idle_id = call_timeout(200, self.__do_idle, **self.__timeout_kwargs)
+        if self.__handler:
+            if self.__wakeup_fds is not None:
+                if not self.__wakeup_pending:
+                    self.__wakeup_pending = True
+                    os.write(self.__wakeup_fds[1], 'x')
+            elif self.__handler_idle_id == 0:
+                self.__handler_idle_id = call_timeout(self.__wakeup_delay, self.__do_idle, **self.__timeout_kwargs)
         self.__lock.release()
 
-    def put(self, *args):
-        Queue.Queue.put(self, *args)
+    def put(self, item, block=True):
+        self.not_full.acquire()
+        try:
+            if item is not None:
+                self.__wait_for_room(block)
+            if item is None:
+                self.__terminated = True
+            if self.__closed:
+                return
+            self._put(item)
+            self.unfinished_tasks += 1
+            self.not_empty.notify()
+        finally:
+            self.not_full.release()
         self.__add_idle()
+
+    def put_batch(self, items):
+        """Append a list of items, taking the queue lock and waking the
+        consumer only once for the whole batch.  If the queue is bounded,
+        wait until it is below capacity; the batch itself may overshoot."""
+        if not items:
+            return
+        self.not_full.acquire()
+        try:
+            self.__wait_for_room(True)
+            if self.__closed:
+                return
+            if self.__maxbytes:
+                for item in items:
+                    self.__bytes += estimate_size(item)
+            self.queue.extend(items)
+            self.unfinished_tasks += len(items)
+            self.not_empty.notify()
+        finally:
+            self.not_full.release()
+        self.__add_idle()
+
+    def get_batch(self, block=True, maxitems=0):
+        """Remove and return a list of all currently queued items, or of the
+        first maxitems of them if nonzero.  If block is True, wait until at
+        least one item is available; otherwise raise Queue.Empty if there
+        are none."""
+        self.not_empty.acquire()
+        try:
+            if not block:
+                if not self._qsize():
+                    raise Queue.Empty
+            else:
+                while not self._qsize():
+                    self.not_empty.wait()
+            if maxitems and maxitems < self._qsize():
+                items = [self._get() for i in xrange(maxitems)]
+            else:
+                items = list(self.queue)
+                self.queue.clear()
+                self.__bytes = 0
+            self.not_full.notify()
+            return items
+        finally:
+            self.not_empty.release()
+
+    def is_drained(self):
+        """Return True if the consumer has taken everything put so far.  This
+        does not take the lock; it is only a hint for batching producers."""
+        return not self.queue
         
     def iter_avail(self):
         try:
-            while True:
-                val = self.get(False)
+            for val in self.get_batch(False):
                 yield val
         except Queue.Empty, e:
             pass
@@ -135,10 +401,51 @@ class QueueIterator(object):
         self._source = source
 
     def __iter__(self):
-        item = True
-        while not (item is None):
-            item = self._source.get()
-            if not (item is None):
+        source = self._source
+        while True:
+            for item in source.get_batch():
+                if item is None:
+                    return
                 yield item
-            else:
-                break
+
+class QueueBatcher(object):
+    """Collects items destined for an IterableQueue and hands them off in
+    batches.  A batch is flushed as soon as the consumer has drained the
+    queue, so a consumer that keeps up sees items with no added latency;
+    when the consumer falls behind, the batch size doubles up to maxsize
+    (but never beyond the queue's own item bound), and halves again each
+    time the consumer is found idle.  No item is held back for more than
+    MAX_DELAY seconds once another one is put."""
+
+    MAX_DELAY = 0.05
+
+    def __init__(self, queue, maxsize=512):
+        self.__queue = queue
+        self.__batch = []
+        self.__batchsize = 1
+        self.__batchtime = 0
+        maxitems = queue.get_capacity()[0]
+        if maxitems:
+            maxsize = min(maxsize, maxitems)
+        self.__maxsize = maxsize
+
+    def put(self, item):
+        batch = self.__batch
+        batch.append(item)
+        if len(batch) >= self.__batchsize:
+            self.__batchsize = min(self.__batchsize * 2, self.__maxsize)
+            self.flush()
+        elif self.__queue.is_drained():
+            self.__batchsize = max(self.__batchsize // 2, 1)
+            self.flush()
+        elif len(batch) == 1:
+            self.__batchtime = time.time()
+        elif time.time() - self.__batchtime >= self.MAX_DELAY:
+            self.flush()
+
+    def flush(self):
+        if not self.__batch:
+            return
+        batch = self.__batch
+        self.__batch = []
+        self.__queue.put_batch(batch)
@@ -56,6 +56,35 @@ class MultiArgSpec(object):
         self.name = name
         self.min = min
 
+class ValueOption(list):
+    """A list of option aliases, like ['-j', '--jobs'], for an option which
+takes a value; e.g. -j4, -j 4, --jobs=4 or --jobs 4."""
+    def __init__(self, aliases, metavar='VALUE'):
+        super(ValueOption, self).__init__(aliases)
+        self.metavar = metavar
+
+class OptionValue(unicode):
+    """A parsed option which carries a value.  Compares equal to the
+canonical option name, so "'-j' in options" works as for flags."""
+    def __new__(cls, name, value=None):
+        inst = super(OptionValue, cls).__new__(cls, name)
+        inst.value = value
+        return inst
+
+def get_option_value(options, name, default=None):
+    """Return the value given for option name, or default if it was not specified."""
+    for opt in options:
+        if opt == name and isinstance(opt, OptionValue):
+            return opt.value
+    return default
+
+def absorb_projection(args, options, operation):
+    """Implements absorb_input_operation() for builtins taking an optional
+    property argument, which are the same as prop followed by the builtin."""
+    if operation[0] == 'project' and not args:
+        return ([operation[1]], options)
+    return None
+
 class Builtin(object):
     name = property(lambda self: self._name)
     input = property(lambda self: self._input)
@@ -76,6 +105,8 @@ class Builtin(object):
     hasmeta = property(lambda self: self._hasmeta)
     nodisplay = property(lambda self: self._nodisplay)
     threaded = property(lambda self: self._threaded)
+    batchable = property(lambda self: self._batchable, doc="""Output may be handed downstream in batches.""")
+    fusable = property(lambda self: self._fusable, doc="""Cheap per-object stage which may share a thread with adjacent fusable stages.""")
     locality = property(lambda self: self._locality)
     api_version = property(lambda self: self._api_version)
     singlevalue = property(lambda self: self._singlevalue)
@@ -95,6 +126,8 @@ class Builtin(object):
                  hasmeta=False,
                  nodisplay=False,
                  threaded=True,
+                 batchable=True,
+                 fusable=False,
                  locality='local',
                  doc=None,
                  api_version=0,
@@ -115,6 +148,8 @@ class Builtin(object):
         self._hasmeta = hasstatus or hasmeta
         self._nodisplay = nodisplay
         self._threaded = threaded
+        self._batchable = batchable
+        self._fusable = fusable
         self._locality = locality
         self._api_version = api_version
         self._singlevalue = singlevalue
@@ -132,6 +167,34 @@ class Builtin(object):
     def get_completer(self, *args, **kwargs):
         return None
 
+    def get_input_limit(self, args, options):
+        """Return the maximum number of input objects this builtin will read
+        when invoked with the given arguments, or None if it may read all of them."""
+        return None
+
+    def get_input_operation(self, args, options):
+        """If this builtin does no more than apply a simple operation to its
+        input, return a description of it which an adjacent builtin may be
+        able to absorb:
+          ('limit', count) passes the first count objects;
+          ('filter', property, regexp, flags) passes the objects whose
+            property matches regexp, compiled with the re flags;
+          ('project', property) yields the property of each object.
+        Otherwise return None."""
+        return None
+
+    def absorb_output_operation(self, args, options, operation):
+        """Return (args, options) with which this builtin yields its output
+        for args and options with operation applied, or None if it can't
+        do so with the same results."""
+        return None
+
+    def absorb_input_operation(self, args, options, operation):
+        """Return (args, options) with which this builtin gives the same
+        results as for args and options when operation is applied to its
+        input first, or None."""
+        return None
+
     def cancel(self, context):
         pass
 
@@ -149,12 +212,14 @@ Currently there are 3 possible categories of builtin:
     system_set = property(lambda self: self.__system_builtins, doc="""Set of system builtins""")
     hotwire_set = property(lambda self: self.__hotwire_builtins, doc="""Set of system builtins""")
     user_set = property(lambda self: self.__user_builtins, doc="""Set of user builtins""")
+    generation = property(lambda self: self.__generation, doc="""Incremented whenever a builtin is registered""")
 
     def __init__(self):
         self.__system_builtins = set()        
         self.__hotwire_builtins = set()
         self.__user_builtins = set()
         self.__sets = [self.__user_builtins, self.__hotwire_builtins, self.__system_builtins]
+        self.__generation = 0
 
     def __lookup_builtin(self, bset, name):
         for b in bset:
@@ -191,6 +256,7 @@ Currently there are 3 possible categories of builtin:
             bset.remove(existing)
         _logger.debug("registering %r (set: %r)", builtin, bset)
         bset.add(builtin)
+        self.__generation += 1
 
     def register_system(self, builtin):
         self.__register(self.__system_builtins, builtin)
@@ -218,12 +284,18 @@ class PyFuncBuiltin(Builtin):
             kwargs['singlevalue'] = True
         kwargs['output'] = 'any'
         kwargs['doc'] = inspect.getdoc(func)
+        self.__absorb_output = kwargs.pop('absorb_output', None)
         if self.__func_args[1] is not None:
             kwargs['argspec'] = MultiArgSpec(self.__func_args[1])
         else:
             kwargs['argspec'] = tuple(self.__func_args[0][1:])
         super(PyFuncBuiltin, self).__init__(name, **kwargs)
         self._execfunc = self.__func
+
+    def absorb_output_operation(self, args, options, operation):
+        if self.__absorb_output is None:
+            return None
+        return self.__absorb_output(args, options, operation)
     
 def _builtin(registerfunc, **kwargs):
     def builtin_wrapper(f):
@@ -244,9 +316,16 @@ def load():
     import hotwire.builtins.cd
     import hotwire.builtins.cp
     import hotwire.builtins.current
+    import hotwire.builtins.distinct
+    import hotwire.builtins.du
+    import hotwire.builtins.dupes
     import hotwire.builtins.exit
+    import hotwire.builtins.explain
     import hotwire.builtins.filter
+    import hotwire.builtins.frequent
     import hotwire.builtins.fsearch
+    import hotwire.builtins.fsindex
+    import hotwire.builtins.group
     import hotwire.builtins.head    
     import hotwire.builtins.help
     import hotwire.builtins.history
@@ -271,8 +350,10 @@ def load():
     import hotwire.builtins.pyeval
     import hotwire.builtins.pyfilter
     import hotwire.builtins.pymap
+    import hotwire.builtins.quantiles
     import hotwire.builtins.replace    
     import hotwire.builtins.rm
+    import hotwire.builtins.sample
     import hotwire.builtins.newline    
     import hotwire.builtins.sechash
     import hotwire.builtins.selection    
@@ -0,0 +1,51 @@
+# This file is part of the Hotwire Shell project API.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy 
+# of this software and associated documentation files (the "Software"), to deal 
+# in the Software without restriction, including without limitation the rights 
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies 
+# of the Software, and to permit persons to whom the Software is furnished to do so, 
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all 
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A 
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE X CONSORTIUM BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, 
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR 
+# THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+from hotwire.builtin import Builtin, BuiltinRegistry, InputStreamSchema, ArgSpec, ValueOption, get_option_value, absorb_projection
+from hotwire.sketch import HyperLogLog, iter_batches
+
+class DistinctBuiltin(Builtin):
+    __doc__ = _("""Estimate the number of unique items, optionally matching on a property, in constant memory.  The item/property must be hashable.""")
+    def __init__(self):
+        super(DistinctBuiltin, self).__init__('distinct',
+                                              input=InputStreamSchema('any'),
+                                              output=HyperLogLog,
+                                              options=[ValueOption(['-p', '--precision'], 'BITS')],
+                                              argspec=(ArgSpec('property', opt=True),))
+
+    def absorb_input_operation(self, args, options, operation):
+        return absorb_projection(args, options, operation)
+
+    def execute(self, context, args, options=[]):
+        if len(args) == 1:
+            target_prop = args[0]
+        else:
+            target_prop = None
+        precision = get_option_value(options, '-p', 14)
+        try:
+            precision = int(precision)
+        except ValueError, e:
+            raise ValueError(_("Invalid value for -p: %s") % (precision,))
+        sketch = HyperLogLog(precision)
+        for batch in iter_batches(context.input, target_prop):
+            sketch.update(batch)
+        yield sketch
+
+BuiltinRegistry.getInstance().register_hotwire(DistinctBuiltin())
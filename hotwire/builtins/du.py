@@ -0,0 +1,185 @@
+# This file is part of the Hotwire Shell project API.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy 
+# of this software and associated documentation files (the "Software"), to deal 
+# in the Software without restriction, including without limitation the rights 
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies 
+# of the Software, and to permit persons to whom the Software is furnished to do so, 
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all 
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A 
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE X CONSORTIUM BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, 
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR 
+# THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import os, sys, stat, logging, itertools
+
+import hotwire
+from hotwire.async import ordered_thread_map
+from hotwire.fs import FilePath, path_join
+from hotwire.builtin import Builtin, BuiltinRegistry, ArgSpec, ValueOption, get_option_value
+from hotwire.builtins.fileop import FileOpBuiltin
+from hotwire.sysdep.fs import Filesystem
+from hotwire.state import DiskUsageCache
+
+_logger = logging.getLogger("hotwire.builtins.Du")
+
+def _get_blocks(stbuf):
+    blocks = getattr(stbuf, 'st_blocks', None)
+    if blocks is None:
+        # Not available on Windows
+        blocks = (stbuf.st_size + 511) // 512
+    return blocks
+
+class DiskUsage(object):
+    """Disk usage totals for a directory tree.  Other attributes are those
+    of the File for the directory, so it can be rendered as one."""
+
+    path = property(lambda self: self._file.path, doc="""Path to the directory.""")
+    size = property(lambda self: self._size, doc="""Total apparent size in bytes.""")
+    blocks = property(lambda self: self._blocks, doc="""Total allocated 512-byte blocks.""")
+    files = property(lambda self: self._files, doc="""Number of files other than directories.""")
+
+    def __init__(self, fobj, size, blocks, files):
+        self._file = fobj
+        self._size = size
+        self._blocks = blocks
+        self._files = files
+
+    def __getattr__(self, name):
+        if name == '_file':
+            raise AttributeError(name)
+        return getattr(self._file, name)
+
+class DuBuiltin(FileOpBuiltin):
+    __doc__ = _("""Compute disk usage of a directory tree.""")
+
+    # Directories being scanned ahead of use, per job
+    PENDING_PER_JOB = 16
+
+    def __init__(self):
+        super(DuBuiltin, self).__init__('du',
+                                        output=DiskUsage,
+                                        argspec=(ArgSpec('directory', opt=True),),
+                                        options=[['-s', '--summarize'], ValueOption(['-j', '--jobs'], 'N')])
+
+    def execute(self, context, args, options=[]):
+        fs = Filesystem.getInstance()
+        if len(args) == 1:
+            path = FilePath(args[0], context.cwd)
+        else:
+            path = context.cwd
+        jobs = get_option_value(options, '-j', 1)
+        try:
+            jobs = int(jobs)
+        except ValueError, e:
+            raise ValueError(_("Invalid number of jobs: %s") % (jobs,))
+        if not stat.S_ISDIR(os.lstat(path).st_mode):
+            raise ValueError(_("Not a directory: %s") % (path,))
+        cache = DiskUsageCache()
+        try:
+            dirs = self.__scan_tree(path, cache, jobs)
+        finally:
+            cache.close()
+        totals = self.__compute_totals(path, dirs)
+        if '-s' in options:
+            totals = [totals[-1]]
+        for (dpath, size, blocks, files) in totals:
+            yield DiskUsage(fs.get_file_lazy(dpath), size, blocks, files)
+
+    def __scan_dir(self, item):
+        """Return the lstat() result of a directory, and the sizes of its
+        direct contents: (size, blocks, files, links, subdirs).  Files with
+        more than one link are listed in links, to be counted only once."""
+        (path, cached) = item
+        try:
+            dirstat = os.lstat(path)
+        except OSError, e:
+            return (path, None, None, False)
+        if cached is not None and cached[0] == dirstat.st_mtime:
+            return (path, dirstat, cached[1], False)
+        size = blocks = files = 0
+        links = []
+        subdirs = []
+        try:
+            names = os.listdir(path)
+        except OSError, e:
+            _logger.debug("failed to list %s", path, exc_info=True)
+            names = []
+        for name in names:
+            try:
+                stbuf = os.lstat(path_join(path, name))
+            except OSError, e:
+                continue
+            if stat.S_ISDIR(stbuf.st_mode):
+                subdirs.append(name)
+            elif stbuf.st_nlink > 1:
+                links.append((stbuf.st_dev, stbuf.st_ino, stbuf.st_size, _get_blocks(stbuf)))
+            else:
+                size += stbuf.st_size
+                blocks += _get_blocks(stbuf)
+                files += 1
+        return (path, dirstat, (size, blocks, files, links, subdirs), True)
+
+    def __scan_tree(self, root, cache, jobs):
+        # A level of the tree at a time, with unchanged directories from the cache
+        dirs = {}
+        level = [root]
+        while level:
+            items = ((dpath, cache.lookup(dpath)) for dpath in level)
+            if jobs > 1:
+                results = ordered_thread_map(self.__scan_dir, items, jobs, jobs * self.PENDING_PER_JOB)
+            else:
+                results = itertools.imap(self.__scan_dir, items)
+            level = []
+            for (dpath, dirstat, entry, changed) in results:
+                if dirstat is None:
+                    continue
+                if changed:
+                    cache.store(dpath, dirstat.st_mtime, entry)
+                dirs[dpath] = (dirstat, entry)
+                level.extend([path_join(dpath, x) for x in entry[4]])
+        return dirs
+
+    def __compute_totals(self, root, dirs):
+        """Return (path, size, blocks, files) for each directory, children
+        before their parents."""
+        links_seen = set()
+        totals = []
+        subtotals = {}
+        stack = [(root, None, False)]
+        while stack:
+            (dpath, parent, visited) = stack.pop()
+            (dirstat, (size, blocks, files, links, subdirs)) = dirs[dpath]
+            if not visited:
+                size += dirstat.st_size
+                blocks += _get_blocks(dirstat)
+                for (dev, ino, lsize, lblocks) in links:
+                    if (dev, ino) in links_seen:
+                        continue
+                    links_seen.add((dev, ino))
+                    size += lsize
+                    blocks += lblocks
+                    files += 1
+                subtotals[dpath] = [size, blocks, files]
+                stack.append((dpath, parent, True))
+                children = [path_join(dpath, x) for x in subdirs]
+                children.reverse()
+                stack.extend([(x, dpath, False) for x in children if x in dirs])
+            else:
+                (size, blocks, files) = subtotals.pop(dpath)
+                if parent is not None:
+                    parent_totals = subtotals[parent]
+                    parent_totals[0] += size
+                    parent_totals[1] += blocks
+                    parent_totals[2] += files
+                totals.append((dpath, size, blocks, files))
+        return totals
+
+BuiltinRegistry.getInstance().register_hotwire(DuBuiltin())
@@ -0,0 +1,141 @@
+# This file is part of the Hotwire Shell project API.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy 
+# of this software and associated documentation files (the "Software"), to deal 
+# in the Software without restriction, including without limitation the rights 
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies 
+# of the Software, and to permit persons to whom the Software is furnished to do so, 
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all 
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A 
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE X CONSORTIUM BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, 
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR 
+# THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import os, sys, stat, logging, hashlib, itertools
+
+import hotwire
+from hotwire.async import ordered_thread_map
+from hotwire.command import HotwireContext
+from hotwire.builtin import Builtin, BuiltinRegistry, ArgSpec, ValueOption, get_option_value
+from hotwire.builtins.fileop import FileOpBuiltin
+from hotwire.builtins.sechash import get_algorithm, hash_file
+from hotwire.state import HashCache
+
+_logger = logging.getLogger("hotwire.builtins.Dupes")
+
+class DupesBuiltin(FileOpBuiltin):
+    __doc__ = _("""Find groups of files with identical contents.""")
+
+    # Size of the blocks at the start and end of a file hashed before the whole
+    BLOCK_SIZE = 4096
+    ALGORITHM = 'sha1'
+    # Groups of same-size files being hashed ahead of output, per job
+    PENDING_PER_JOB = 4
+
+    def __init__(self):
+        super(DupesBuiltin, self).__init__('dupes',
+                                           output=list,
+                                           argspec=(ArgSpec('directory', opt=True),),
+                                           options=[['-a', '--all'], ValueOption(['-j', '--jobs'], 'N')])
+
+    def execute(self, context, args, options=[]):
+        jobs = get_option_value(options, '-j', 1)
+        try:
+            jobs = int(jobs)
+        except ValueError, e:
+            raise ValueError(_("Invalid number of jobs: %s") % (jobs,))
+        alg = get_algorithm(self.ALGORITHM)
+        walk_builtin = BuiltinRegistry.getInstance()['walk']
+        newctx = HotwireContext(context.cwd)
+        by_size = {}
+        sizes = []
+        inodes = set()
+        for fobj in walk_builtin.execute(newctx, args, options=[x for x in options if x == '-a']):
+            stbuf = fobj.stat
+            # Symbolic links have their own stat; empty files are not interesting
+            if stbuf is None or not stat.S_ISREG(stbuf.st_mode) or stbuf.st_size == 0:
+                continue
+            # Hard links to a file already seen are the same file
+            inode = (stbuf.st_dev, stbuf.st_ino)
+            if inode in inodes:
+                continue
+            inodes.add(inode)
+            if stbuf.st_size not in by_size:
+                by_size[stbuf.st_size] = []
+                sizes.append(stbuf.st_size)
+            by_size[stbuf.st_size].append(fobj)
+        buckets = (by_size[size] for size in sizes if len(by_size[size]) > 1)
+        cache = HashCache()
+        try:
+            # Cache lookups happen here, in this thread; hashing in find_dupes
+            tasks = ((bucket, [cache.lookup(f.stat, self.ALGORITHM) for f in bucket]) for bucket in buckets)
+            find_dupes = lambda task: self.__find_dupes(alg, *task)
+            if jobs > 1:
+                results = ordered_thread_map(find_dupes, tasks, jobs, jobs * self.PENDING_PER_JOB)
+            else:
+                results = itertools.imap(find_dupes, tasks)
+            for (groups, computed) in results:
+                for (stbuf, digest) in computed:
+                    cache.store(stbuf, self.ALGORITHM, digest)
+                for group in groups:
+                    yield group
+        finally:
+            cache.close()
+
+    def __hash_ends(self, alg, path, size):
+        hashval = alg()
+        f = open(path, 'rb')
+        try:
+            hashval.update(f.read(self.BLOCK_SIZE))
+            f.seek(size - self.BLOCK_SIZE)
+            hashval.update(f.read(self.BLOCK_SIZE))
+        finally:
+            f.close()
+        return hashval.digest()
+
+    def __group_by(self, func, items):
+        groups = {}
+        order = []
+        for item in items:
+            try:
+                key = func(item)
+            except EnvironmentError, e:
+                _logger.debug("failed to read %s", item[0].path, exc_info=True)
+                continue
+            if key not in groups:
+                groups[key] = []
+                order.append(key)
+            groups[key].append(item)
+        return [groups[key] for key in order if len(groups[key]) > 1]
+
+    def __find_dupes(self, alg, bucket, digests):
+        """Return the groups of identical files among bucket, which have the
+        same size, and the full digests computed along the way."""
+        size = bucket[0].stat.st_size
+        computed = []
+        def full_digest(item):
+            (fobj, digest) = item
+            if digest is None:
+                digest = hash_file(alg, fobj.path)
+                computed.append((fobj.stat, digest))
+            return digest
+        items = zip(bucket, digests)
+        # Small files are read in full anyway
+        if size > 2 * self.BLOCK_SIZE and None in digests:
+            candidates = self.__group_by(lambda item: self.__hash_ends(alg, item[0].path, size), items)
+        else:
+            candidates = [items]
+        groups = []
+        for candidate in candidates:
+            for group in self.__group_by(full_digest, candidate):
+                groups.append([fobj for (fobj, digest) in group])
+        return (groups, computed)
+
+BuiltinRegistry.getInstance().register_hotwire(DupesBuiltin())
@@ -19,9 +19,116 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR 
 # THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import os, sys
+import os, sys, re
 
-from hotwire.builtin import Builtin
+from hotwire.builtin import Builtin, ValueOption, OptionValue, get_option_value
+from hotwire.fs import FilePredicate
+
+try:
+    import pwd
+except ImportError, e:
+    pwd = None
+
+# Options for conditions on files, see get_file_predicate()
+FILE_PREDICATE_OPTIONS = [ValueOption(['-n', '--name'], 'GLOB'),
+                          ValueOption(['-r', '--regexp'], 'REGEXP'),
+                          ValueOption(['-t', '--type'], 'TYPE'),
+                          ValueOption(['-s', '--size'], 'SIZE'),
+                          ValueOption(['-m', '--mtime'], 'DAYS'),
+                          ValueOption(['-o', '--owner'], 'USER')]
+# Further options for recursive traversals
+TREE_PREDICATE_OPTIONS = [ValueOption(['-d', '--max-depth'], 'N'),
+                          ValueOption(['-p', '--prune'], 'GLOB')]
+
+_size_units = {'k': 1024, 'K': 1024, 'M': 1024**2, 'G': 1024**3, 'T': 1024**4}
+
+def _parse_size(text):
+    unit = _size_units.get(text[-1:])
+    if unit is None:
+        return int(text)
+    return int(float(text[:-1]) * unit)
+
+def _parse_owner(text):
+    if text.isdigit():
+        return int(text)
+    if pwd is None:
+        raise ValueError(_("Unknown user: %s") % (text,))
+    try:
+        return pwd.getpwnam(text).pw_uid
+    except KeyError, e:
+        raise ValueError(_("Unknown user: %s") % (text,))
+
+def _parse_bound(text, parse):
+    # find(1) style: +N for more than N, -N for less than N
+    sign = 0
+    if text[:1] == '+':
+        sign = 1
+    elif text[:1] == '-':
+        sign = -1
+    if sign:
+        text = text[1:]
+    return (sign, parse(text))
+
+def _parse_option(opt, parse, *args):
+    try:
+        return parse(opt.value, *args)
+    except ValueError, e:
+        raise ValueError(_("Invalid value for %s: %s") % (opt, opt.value))
+
+def get_file_predicate(options):
+    """Return a FilePredicate for the FILE_PREDICATE_OPTIONS and
+    TREE_PREDICATE_OPTIONS given in options, or None if there are none.
+    Each option but -t and -d may be repeated."""
+    names = []
+    regexps = []
+    sizes = []
+    mtimes = []
+    owners = []
+    prunes = []
+    types = None
+    max_depth = None
+    found = False
+    for opt in options:
+        if not isinstance(opt, OptionValue):
+            continue
+        if opt == '-n':
+            names.append(opt.value)
+        elif opt == '-r':
+            regexps.append(opt.value)
+        elif opt == '-t':
+            types = opt.value
+        elif opt == '-s':
+            sizes.append(_parse_option(opt, _parse_bound, _parse_size))
+        elif opt == '-m':
+            mtimes.append(_parse_option(opt, _parse_bound, float))
+        elif opt == '-o':
+            owners.append(_parse_owner(opt.value))
+        elif opt == '-p':
+            prunes.append(opt.value)
+        elif opt == '-d':
+            max_depth = _parse_option(opt, int)
+            if max_depth < 1:
+                raise ValueError(_("Invalid value for %s: %s") % (opt, opt.value))
+        else:
+            continue
+        found = True
+    if not found:
+        return None
+    return FilePredicate(names=names, regexps=regexps, types=types, sizes=sizes, mtimes=mtimes,
+                         owners=owners, prunes=prunes, max_depth=max_depth)
+
+def absorb_filter_operation(args, options, operation):
+    """Implements absorb_output_operation() for builtins yielding File
+    objects and taking FILE_PREDICATE_OPTIONS; filter on basename becomes
+    the -r option."""
+    if operation[0] != 'filter' or '-r' in options:
+        return None
+    (kind, prop, regexp, flags) = operation
+    if prop != 'basename' or flags & ~(re.IGNORECASE | re.UNICODE):
+        return None
+    if flags & re.IGNORECASE:
+        regexp = '(?i)' + regexp
+    return (args, list(options) + [OptionValue('-r', regexp)])
 
 class FileOpBuiltin(Builtin):
     def _note_modified_paths(self, context, paths):
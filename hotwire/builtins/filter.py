@@ -38,7 +38,13 @@ class FilterBuiltin(Builtin):
                                             input=InputStreamSchema('any'),
                                             output='identity',
                                             options=[['-s', '--stringify'], ['-i', '--ignore-case'],['-v', '--invert-match']],
-                                            argspec=('regexp', ArgSpec('property', opt=True)))
+                                            argspec=('regexp', ArgSpec('property', opt=True)),
+                                            fusable=True)
+
+    def get_input_operation(self, args, options):
+        if len(args) != 2 or '-v' in options:
+            return None
+        return ('filter', args[1], args[0], (('-i' in options) and re.IGNORECASE or 0) | re.UNICODE)
 
     def execute(self, context, args, options=[]):     
         if len(args) == 2:
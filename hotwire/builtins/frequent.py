@@ -0,0 +1,56 @@
+# This file is part of the Hotwire Shell project API.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy 
+# of this software and associated documentation files (the "Software"), to deal 
+# in the Software without restriction, including without limitation the rights 
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies 
+# of the Software, and to permit persons to whom the Software is furnished to do so, 
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all 
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A 
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE X CONSORTIUM BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, 
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR 
+# THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+from hotwire.builtin import Builtin, BuiltinRegistry, InputStreamSchema, ArgSpec, ValueOption, get_option_value, absorb_projection
+from hotwire.sketch import SpaceSaving, iter_batches
+
+class FrequentBuiltin(Builtin):
+    __doc__ = _("""Find the most frequent items, optionally matching on a property, in constant memory.
+Yields a list of (count, item) like uniq -c, most frequent first; counts may be overestimated.""")
+
+    # Counters kept per item reported
+    COUNTERS_PER_ITEM = 10
+
+    def __init__(self):
+        super(FrequentBuiltin, self).__init__('frequent',
+                                              input=InputStreamSchema('any'),
+                                              output=list,
+                                              options=[ValueOption(['-n', '--count'], 'N')],
+                                              argspec=(ArgSpec('property', opt=True),))
+
+    def absorb_input_operation(self, args, options, operation):
+        return absorb_projection(args, options, operation)
+
+    def execute(self, context, args, options=[]):
+        if len(args) == 1:
+            target_prop = args[0]
+        else:
+            target_prop = None
+        count = get_option_value(options, '-n', 10)
+        try:
+            count = int(count)
+        except ValueError, e:
+            raise ValueError(_("Invalid value for -n: %s") % (count,))
+        sketch = SpaceSaving(max(count, 1) * self.COUNTERS_PER_ITEM)
+        for batch in iter_batches(context.input, target_prop):
+            sketch.update(batch)
+        yield sketch.top(count)
+
+BuiltinRegistry.getInstance().register_hotwire(FrequentBuiltin())
@@ -19,16 +19,18 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR 
 # THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import os, sys, logging, re
+import os, sys, logging, re, mmap, codecs, locale, itertools
 
 import hotwire
 import hotwire.fs
-from hotwire.fs import FilePath, file_is_valid_utf8, open_text_file
+from hotwire.fs import FilePath, file_is_valid_utf8, open_text_file, path_join
 
+from hotwire.async import ordered_thread_map
 from hotwire.command import HotwireContext
-from hotwire.builtin import Builtin, BuiltinRegistry, ArgSpec
+from hotwire.builtin import Builtin, BuiltinRegistry, ArgSpec, ValueOption, get_option_value
 from hotwire.builtins.fileop import FileOpBuiltin
 from hotwire.sysdep.fs import Filesystem, FileStatError
+from hotwire.trigramindex import TrigramIndex, required_trigrams
 
 _logger = logging.getLogger("hotwire.builtins.FSearch")
 
@@ -48,13 +50,124 @@ class FileStringMatch(object):
         self._match_start = match_start
         self._match_end = match_end
 
+_REGEXP_SPECIAL = frozenset('.^$*+?{}[]\\|()\n')
+# Characters on which a byte-level regexp may behave differently from the
+# re.UNICODE one; files without them are searched as bytes.
+_nonascii_re = re.compile(r'[\x1c-\x1f\x80-\xff]')
+
+class _FileSearcher(object):
+    """Searches the lines of one file at a time for a regular expression.
+Files are mapped into memory and scanned as bytes; only matching lines are
+decoded.  Safe for use from several threads at once."""
+
+    BINARY_CHECK_SIZE = 8192
+
+    def __init__(self, regexp, ignorecase):
+        self.__encoding = locale.getdefaultlocale()[1] or 'utf-8'
+        self.__regexp = re.compile(regexp, (ignorecase and re.IGNORECASE or 0) | re.UNICODE)
+        # A substring search for the literal is exact if the encoding never
+        # splits a character into bytes which could be part of another one.
+        encname = codecs.lookup(self.__encoding).name
+        bytes_compatible = encname in ('utf-8', 'ascii') or encname.startswith('iso8859') or encname.startswith('cp125')
+        try:
+            ascii_regexp = bytes_compatible and regexp.encode('ascii')
+        except UnicodeError, e:
+            ascii_regexp = None
+        if ascii_regexp:
+            self.__bytes_regexp = re.compile(ascii_regexp, ignorecase and re.IGNORECASE or 0)
+        else:
+            self.__bytes_regexp = None
+        self.__bytes_compatible = bytes_compatible
+        self.__ignorecase = ignorecase
+        self.__pattern = regexp
+        self.__literal = None
+        if bytes_compatible and not ignorecase and not (_REGEXP_SPECIAL.intersection(regexp)):
+            try:
+                self.__literal = regexp.encode(self.__encoding)
+            except UnicodeEncodeError, e:
+                pass
+
+    def get_required_trigrams(self):
+        """Trigrams which must be in any file with a match, for TrigramIndex."""
+        if not self.__bytes_compatible:
+            return set()
+        return required_trigrams(self.__pattern, self.__ignorecase, self.__encoding)
+
+    def search(self, path):
+        try:
+            f = open(path, 'rb')
+        except IOError, e:
+            return []
+        try:
+            try:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, EnvironmentError), e:
+                # Empty files, or things which can't be mapped
+                return []
+            try:
+                if buf.find('\0', 0, self.BINARY_CHECK_SIZE) >= 0:
+                    return []
+                if self.__literal:
+                    return self.__search_literal(path, buf)
+                if self.__bytes_regexp is not None and not _nonascii_re.search(buf):
+                    return self.__search_lines(path, buf, self.__bytes_regexp)
+                return self.__search_lines(path, buf, self.__regexp)
+            finally:
+                buf.close()
+        finally:
+            f.close()
+
+    def __search_literal(self, path, buf):
+        results = []
+        literal = self.__literal
+        line_num = 0
+        counted = 0
+        pos = buf.find(literal)
+        while pos >= 0:
+            start = buf.rfind('\n', 0, pos) + 1
+            end = buf.find('\n', pos)
+            if end < 0:
+                end = len(buf)
+            line_num += buf[counted:start].count('\n')
+            counted = start
+            try:
+                line = unicode(buf[start:end], self.__encoding)
+                match_start = len(unicode(buf[start:pos], self.__encoding))
+            except UnicodeDecodeError, e:
+                break
+            results.append(FileStringMatch(path, line, line_num, match_start, match_start + len(self.__regexp.pattern)))
+            pos = buf.find(literal, end)
+        return results
+
+    def __search_lines(self, path, buf, regexp):
+        results = []
+        is_unicode = regexp is self.__regexp
+        for i,line in enumerate(iter(buf.readline, '')):
+            if is_unicode:
+                try:
+                    line = unicode(line, self.__encoding)
+                except UnicodeDecodeError, e:
+                    break
+            match = regexp.search(line)
+            if match:
+                if line.endswith('\n'):
+                    line = line[:-1]
+                if not is_unicode:
+                    line = unicode(line, 'ascii')
+                results.append(FileStringMatch(path, line, i, match.start(), match.end()))
+        return results
+
 class FSearchBuiltin(FileOpBuiltin):
     __doc__ = _("""Search directory tree for files matching a regular expression.""")
+
+    # Files being searched ahead of output, per job
+    PENDING_PER_JOB = 16
+
     def __init__(self):
         super(FSearchBuiltin, self).__init__('fsearch',
                                              output=FileStringMatch,
                                              argspec=('regexp', ArgSpec('directory', opt=True)),                                             
-                                             options=[['-i', '--ignore-case']])
+                                             options=[['-i', '--ignore-case'], ValueOption(['-j', '--jobs'], 'N')])
 
     def execute(self, context, args, options=[]):       
         regexp = args[0]
@@ -63,20 +176,46 @@ class FSearchBuiltin(FileOpBuiltin):
         else:
             path = context.cwd
         regexp = args[0]
-        comp_regexp = re.compile(regexp, (('-i' in options) and re.IGNORECASE or 0) | re.UNICODE)
-        walk_builtin = BuiltinRegistry.getInstance()['walk']
-        newctx = HotwireContext(context.cwd)
-        for fobj in walk_builtin.execute(newctx, [path]):
-            fp = None
-            try:
-                fp = open_text_file(fobj.path) 
-                for i,line in enumerate(fp):
-                    match = comp_regexp.search(line)
-                    if match:
-                        yield FileStringMatch(fobj.path, line[:-1], i, match.start(), match.end())
-                fp.close()
-            except OSError, e:
-                pass
-            except UnicodeDecodeError, e:
-                pass
+        searcher = _FileSearcher(regexp, '-i' in options)
+        jobs = get_option_value(options, '-j', 1)
+        try:
+            jobs = int(jobs)
+        except ValueError, e:
+            raise ValueError(_("Invalid number of jobs: %s") % (jobs,))
+        paths = self.__indexed_paths(path_join(context.cwd, path), searcher)
+        if paths is None:
+            walk_builtin = BuiltinRegistry.getInstance()['walk']
+            newctx = HotwireContext(context.cwd)
+            paths = (fobj.path for fobj in walk_builtin.execute(newctx, [path]))
+        search = lambda path: self.__search_logged(searcher, path)
+        if jobs > 1:
+            results = ordered_thread_map(search, paths, jobs, jobs * self.PENDING_PER_JOB)
+        else:
+            results = itertools.imap(search, paths)
+        for matches in results:
+            for match in matches:
+                yield match
+
+    def __indexed_paths(self, path, searcher):
+        trigrams = searcher.get_required_trigrams()
+        if not trigrams:
+            return None
+        index = TrigramIndex.find(path)
+        if index is None:
+            return None
+        try:
+            if not index.is_fresh():
+                _logger.debug("index for %s is out of date", index.root)
+                return None
+            return index.query(path, trigrams)
+        finally:
+            index.close()
+
+    def __search_logged(self, searcher, path):
+        try:
+            return searcher.search(path)
+        except EnvironmentError, e:
+            _logger.debug("failed to search %s", path, exc_info=True)
+            return []
+
 BuiltinRegistry.getInstance().register_hotwire(FSearchBuiltin())
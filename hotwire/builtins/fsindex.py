@@ -0,0 +1,56 @@
+# This file is part of the Hotwire Shell project API.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy 
+# of this software and associated documentation files (the "Software"), to deal 
+# in the Software without restriction, including without limitation the rights 
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies 
+# of the Software, and to permit persons to whom the Software is furnished to do so, 
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all 
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A 
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE X CONSORTIUM BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, 
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR 
+# THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import os, sys
+
+import hotwire
+import hotwire.fs
+from hotwire.fs import FilePath
+
+from hotwire.builtin import Builtin, BuiltinRegistry, ArgSpec
+from hotwire.builtins.fileop import FileOpBuiltin
+from hotwire.trigramindex import TrigramIndex
+
+class FSIndexBuiltin(FileOpBuiltin):
+    __doc__ = _("""Create or update the index fsearch uses for a directory tree.""")
+    def __init__(self):
+        super(FSIndexBuiltin, self).__init__('fsindex',
+                                             argspec=(ArgSpec('directory', opt=True),),
+                                             options=[['-d', '--delete']])
+
+    def execute(self, context, args, options=[]):
+        if len(args) == 1:
+            path = FilePath(args[0], context.cwd)
+        else:
+            path = context.cwd
+        path = path.rstrip('/') or '/'
+        if '-d' in options:
+            index = TrigramIndex.find(path)
+            if index is None or index.root != path:
+                raise ValueError(_("No index for %s") % (path,))
+            index.remove()
+        else:
+            index = TrigramIndex.create(path)
+            try:
+                index.update()
+            finally:
+                index.close()
+        return []
+BuiltinRegistry.getInstance().register_hotwire(FSIndexBuiltin())
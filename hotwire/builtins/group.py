@@ -0,0 +1,139 @@
+# This file is part of the Hotwire Shell project API.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy 
+# of this software and associated documentation files (the "Software"), to deal 
+# in the Software without restriction, including without limitation the rights 
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies 
+# of the Software, and to permit persons to whom the Software is furnished to do so, 
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all 
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A 
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE X CONSORTIUM BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, 
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR 
+# THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import time
+from operator import attrgetter
+
+from hotwire.builtin import Builtin, BuiltinRegistry, InputStreamSchema, MultiArgSpec, ValueOption, OptionValue, get_option_value
+
+class GroupResult(object):
+    """Aggregated values for a group of objects with equal key properties."""
+    def __init__(self, fields, values, partial=False):
+        self._fields = fields
+        for (field, value) in zip(fields, values):
+            setattr(self, field, value)
+        self.partial = partial
+
+    def __repr__(self):
+        return 'GroupResult(%s)' % (', '.join(['%s=%r' % (field, getattr(self, field)) for field in self._fields]),)
+
+_SUM = 'sum'
+_MIN = 'min'
+_MAX = 'max'
+_AVG = 'avg'
+
+class GroupBuiltin(Builtin):
+    __doc__ = _("""Aggregate input objects grouped by one or more properties, in one pass.
+Yields an object per group with the key properties and the requested
+aggregates, named like count, sum_size or max_mtime.  As in SQL, aggregates
+skip None values, and are None for a group with no other values.  With -i,
+partial results for all groups are yielded every SECONDS.""")
+
+    # Keyed by the canonical option name, the first alias
+    _AGGREGATES = {'-s': _SUM, '--min': _MIN, '--max': _MAX, '--avg': _AVG}
+
+    def __init__(self):
+        super(GroupBuiltin, self).__init__('group',
+                                           input=InputStreamSchema('any'),
+                                           output=GroupResult,
+                                           options=[['-c', '--count'],
+                                                    ValueOption(['-s', '--sum'], 'PROPERTY'),
+                                                    ValueOption(['--min'], 'PROPERTY'),
+                                                    ValueOption(['--max'], 'PROPERTY'),
+                                                    ValueOption(['--avg'], 'PROPERTY'),
+                                                    ValueOption(['-i', '--interval'], 'SECONDS')],
+                                           argspec=MultiArgSpec('property', min=1))
+
+    def __results(self, fields, order, groups, nkeys, count, aggregates, partial):
+        for key in order:
+            state = groups[key]
+            if nkeys == 1:
+                values = [key]
+            else:
+                values = list(key)
+            if count:
+                values.append(state[0])
+            for (i, kind, getter) in aggregates:
+                value = state[i]
+                if kind is _AVG and value is not None:
+                    value = value[0] / float(value[1])
+                values.append(value)
+            yield GroupResult(fields, values, partial)
+
+    def execute(self, context, args, options=[]):
+        keyget = attrgetter(*args)
+        count = '-c' in options
+        fields = [arg.replace('.', '_') for arg in args]
+        if count:
+            fields.append('count')
+        # (index into group state, kind, getter); state[0] is the count, and
+        # the state of an average is [total, number of values]
+        aggregates = []
+        for opt in options:
+            if isinstance(opt, OptionValue) and opt in self._AGGREGATES:
+                kind = self._AGGREGATES[opt]
+                aggregates.append((len(aggregates) + 1, kind, attrgetter(opt.value)))
+                fields.append('%s_%s' % (kind, opt.value.replace('.', '_')))
+        interval = get_option_value(options, '-i')
+        if interval is not None:
+            try:
+                interval = float(interval)
+            except ValueError, e:
+                raise ValueError(_("Invalid value for -i: %s") % (interval,))
+            next_partial = time.time() + interval
+        groups = {}
+        # keep order of first appearance
+        order = []
+        for item in context.input:
+            key = keyget(item)
+            state = groups.get(key)
+            if state is None:
+                state = [0] + [None] * len(aggregates)
+                groups[key] = state
+                order.append(key)
+            state[0] += 1
+            for (i, kind, getter) in aggregates:
+                value = getter(item)
+                if value is None:
+                    continue
+                current = state[i]
+                if kind is _AVG:
+                    if current is None:
+                        state[i] = [value, 1]
+                    else:
+                        current[0] += value
+                        current[1] += 1
+                elif current is None:
+                    state[i] = value
+                elif kind is _SUM:
+                    state[i] = current + value
+                elif kind is _MIN:
+                    if value < current:
+                        state[i] = value
+                elif value > current:
+                    state[i] = value
+            if interval is not None and time.time() >= next_partial:
+                for result in self.__results(fields, order, groups, len(args), count, aggregates, True):
+                    yield result
+                next_partial = time.time() + interval
+        for result in self.__results(fields, order, groups, len(args), count, aggregates, False):
+            yield result
+
+BuiltinRegistry.getInstance().register_hotwire(GroupBuiltin())
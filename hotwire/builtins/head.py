@@ -22,35 +22,58 @@
 import os,sys,pickle
 
 from hotwire.fs import path_join, open_text_file
-from hotwire.builtin import builtin_hotwire, InputStreamSchema
-
-@builtin_hotwire(input=InputStreamSchema('any',optional=True),
-                 options_passthrough=True,
-                 idempotent=True)
-def head(context, *files):
-    _("""Return a subset of items from start of input stream.""")
-    count = 10
-    countidx = -1
-    # Create a copy so we can delete from it safely
-    files = list(files)
-    for i,arg in enumerate(files):
-        if arg.startswith('-'):
-            count = int(arg[1:])
-            countidx = i
-            break
-    if countidx >= 0:
-        del files[countidx]
-    if context.input is not None:
-        for i,value in enumerate(context.input):
-            if i >= count:
-                break
-            yield value
-    for fpath in files:
-        fpath = path_join(context.cwd, fpath)
-        f = None
-        f = open_text_file(fpath)
-        for i,line in enumerate(f):
-            if i>= count:
-                break
-            yield line
-        f.close()
+from hotwire.builtin import Builtin, BuiltinRegistry, InputStreamSchema, MultiArgSpec
+
+class HeadBuiltin(Builtin):
+    __doc__ = _("""Return a subset of items from start of input stream.""")
+    def __init__(self):
+        super(HeadBuiltin, self).__init__('head',
+                                          input=InputStreamSchema('any', optional=True),
+                                          output='any',
+                                          argspec=MultiArgSpec('path'),
+                                          options_passthrough=True,
+                                          idempotent=True)
+
+    def __parse_count(self, args):
+        for i,arg in enumerate(args):
+            if arg.startswith('-'):
+                return (int(arg[1:]), i)
+        return (10, -1)
+
+    def get_input_limit(self, args, options):
+        try:
+            return self.__parse_count(args)[0]
+        except ValueError, e:
+            return None
+
+    def get_input_operation(self, args, options):
+        try:
+            (count, countidx) = self.__parse_count(args)
+        except ValueError, e:
+            return None
+        # Paths are read after the input
+        if len(args) > (countidx >= 0 and 1 or 0) or count < 0:
+            return None
+        return ('limit', count)
+
+    def execute(self, context, args, options=[]):
+        (count, countidx) = self.__parse_count(args)
+        # Create a copy so we can delete from it safely
+        files = list(args)
+        if countidx >= 0:
+            del files[countidx]
+        if context.input is not None:
+            for i,value in enumerate(context.input):
+                if i >= count:
+                    break
+                yield value
+        for fpath in files:
+            fpath = path_join(context.cwd, fpath)
+            f = open_text_file(fpath)
+            for i,line in enumerate(f):
+                if i >= count:
+                    break
+                yield line
+            f.close()
+
+BuiltinRegistry.getInstance().register_hotwire(HeadBuiltin())
@@ -31,7 +31,8 @@ class IterBuiltin(Builtin):
                                           output='any',
                                           argspec=None,
                                           idempotent=True,
-                                          threaded=False)
+                                          threaded=False,
+                                          fusable=True)
 
     def execute(self, context, args, options=[]):
         for item in context.input:
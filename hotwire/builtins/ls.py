@@ -24,6 +24,7 @@ from itertools import imap
 
 from hotwire.builtin import builtin_hotwire, InputStreamSchema, MultiArgSpec
 from hotwire.fs import FilePath
+from hotwire.builtins.fileop import FILE_PREDICATE_OPTIONS, get_file_predicate, absorb_filter_operation
 from hotwire.sysdep.fs import Filesystem,File
 from hotwire.util import xmap
 
@@ -34,12 +35,14 @@ _logger = logging.getLogger("hotwire.builtins.ls")
                  output=File,
                  idempotent=True,
                  argspec=MultiArgSpec('paths'),
-                 options=[['-l', '--long'],['-a', '--all'],['-i', '--input']])
+                 options=[['-l', '--long'],['-a', '--all'],['-i', '--input']] + FILE_PREDICATE_OPTIONS,
+                 absorb_output=absorb_filter_operation)
 def ls(context, *args):
     _("""List contents of a directory.""")
     show_all = '-a' in context.options
     long_fmt = '-l' in context.options
     process_input = '-i' in context.options
+    predicate = get_file_predicate(context.options)
     fs = Filesystem.getInstance()
         
     if process_input and input is not None:
@@ -47,19 +50,22 @@ def ls(context, *args):
         args.extend(context.input)        
         
     if len(args) == 0:
-        for x in fs.ls_dir(context.cwd, show_all):
+        for x in fs.ls_dir(context.cwd, show_all, predicate):
             yield x
     elif len(args) == 1:
         path = FilePath(args[0], context.cwd)
         fobj = fs.get_file_sync(path)
         if fobj.is_directory:
-            for x in fs.ls_dir(path, show_all):
+            for x in fs.ls_dir(path, show_all, predicate):
                 yield x
-        else:
+        elif predicate is None or predicate.match(path):
             yield fobj
             return      
     else:
         # Generate list of sorted File objects from arguments 
-        for x in sorted(xmap(lambda arg: fs.get_file_sync(FilePath(arg, context.cwd)), args), 
+        paths = [FilePath(arg, context.cwd) for arg in args]
+        if predicate is not None:
+            paths = [path for path in paths if predicate.match(path)]
+        for x in sorted(xmap(fs.get_file_sync, paths), 
                         lambda a,b: locale.strcoll(a.path, b.path)):
             yield x
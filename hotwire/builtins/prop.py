@@ -33,7 +33,13 @@ class PropBuiltin(Builtin):
                                           idempotent=True,
                                           argspec=(ArgSpec('name'),),
                                           options=[['-t', '--tuple']],
-                                          threaded=True)
+                                          threaded=True,
+                                          fusable=True)
+
+    def get_input_operation(self, args, options):
+        if '-t' in options:
+            return None
+        return ('project', args[0])
 
     def execute(self, context, args, options=[]):
         prop = args[0]            
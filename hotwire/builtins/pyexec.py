@@ -0,0 +1,153 @@
+# This file is part of the Hotwire Shell project API.
+
+# Copyright (C) 2007 Colin Walters <walters@verbum.org>
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy 
+# of this software and associated documentation files (the "Software"), to deal 
+# in the Software without restriction, including without limitation the rights 
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies 
+# of the Software, and to permit persons to whom the Software is furnished to do so, 
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all 
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A 
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE X CONSORTIUM BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, 
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR 
+# THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import os,sys,itertools,logging
+import cPickle
+
+try:
+    import multiprocessing
+    have_multiprocessing = True
+except ImportError, e:
+    have_multiprocessing = False
+
+from hotwire.builtin import Builtin, get_option_value
+
+_logger = logging.getLogger("hotwire.builtins.PyExec")
+
+def _compile_execute(content):
+    code = compile(content, '<input>', 'exec')
+    locals = {}
+    exec code in locals
+    return locals['execute']
+
+def _run_execute(execute, context, input):
+    custom_out = execute(context, input)
+    if custom_out is None:
+        return
+    if hasattr(custom_out, '__iter__'):
+        for o in custom_out:
+            yield o
+    else:
+        yield custom_out
+
+_worker_compiled = {}
+def _pool_execute(content, data):
+    """Evaluate a pickled batch of input in a worker process.  Returns the
+pickled list of results, or None if the batch should be evaluated in the
+parent instead (for example, if the results can't be pickled)."""
+    try:
+        batch = cPickle.loads(data)
+        # Worker processes live only as long as one command, so this is bounded
+        execute = _worker_compiled.get(content)
+        if execute is None:
+            execute = _worker_compiled[content] = _compile_execute(content)
+        results = list(_run_execute(execute, None, batch))
+        return cPickle.dumps(results, cPickle.HIGHEST_PROTOCOL)
+    except Exception, e:
+        return None
+
+class PyExecBuiltin(Builtin):
+    """Base class for builtins which run a Python expression over their input.
+Subclasses provide CONTENT, the source of a generator function
+execute(context, input), and POOL_CONTENT, used in worker processes when
+run with -j.  Results from the pool are passed through _pool_results()."""
+
+    POOL_BATCH_SIZE = 256
+
+    def _pool_results(self, batch, results):
+        return results
+
+    def execute(self, context, args, options=[]):
+        execute = _compile_execute(self.CONTENT % (args[0],))
+        jobs = get_option_value(options, '-j', 1)
+        try:
+            jobs = int(jobs)
+        except ValueError, e:
+            raise ValueError(_("Invalid number of jobs: %s") % (jobs,))
+        if jobs > 1 and context.input is not None and have_multiprocessing:
+            results = self.__execute_pool(context, execute, self.POOL_CONTENT % (args[0],),
+                                          jobs, '-u' in options)
+        else:
+            results = _run_execute(execute, context, context.input)
+        for o in results:
+            yield o
+
+    def __finish_batch(self, context, execute, batch, result):
+        if result is not None:
+            while not result.ready():
+                if context.cancelled:
+                    return []
+                result.wait(1)
+            data = result.get()
+            if data is not None:
+                return self._pool_results(batch, cPickle.loads(data))
+        # Evaluate in-process; this also raises any error from the expression.
+        return list(_run_execute(execute, context, batch))
+
+    def __execute_pool(self, context, execute, pool_content, jobs, unordered):
+        pool = multiprocessing.Pool(jobs)
+        context.attribs['pool'] = pool
+        # Keep a few batches per worker in flight
+        window = jobs * 2
+        pending = []
+        input = iter(context.input)
+        while not context.cancelled:
+            batch = list(itertools.islice(input, self.POOL_BATCH_SIZE))
+            if batch:
+                try:
+                    data = cPickle.dumps(batch, cPickle.HIGHEST_PROTOCOL)
+                except Exception, e:
+                    _logger.debug("batch not picklable, evaluating in-process: %s", e)
+                    data = None
+                if data is not None:
+                    result = pool.apply_async(_pool_execute, (pool_content, data))
+                else:
+                    result = None
+                pending.append((batch, result))
+            while pending:
+                if unordered:
+                    done = [p for p in pending if p[1] is None or p[1].ready()]
+                elif pending[0][1] is None or pending[0][1].ready():
+                    done = pending[:1]
+                else:
+                    done = []
+                if not done:
+                    if batch and len(pending) < window:
+                        break
+                    done = pending[:1]
+                doneids = set(map(id, done))
+                pending = [p for p in pending if id(p) not in doneids]
+                for (donebatch, result) in done:
+                    for o in self.__finish_batch(context, execute, donebatch, result):
+                        yield o
+            if not batch:
+                break
+
+    def __terminate_pool(self, context):
+        pool = context.attribs.pop('pool', None)
+        if pool is not None:
+            pool.terminate()
+
+    def cancel(self, context):
+        self.__terminate_pool(context)
+
+    def cleanup(self, context):
+        self.__terminate_pool(context)
@@ -19,41 +19,34 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR 
 # THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import os,sys,re,subprocess,sha,tempfile
+from hotwire.builtin import BuiltinRegistry, InputStreamSchema, OutputStreamSchema, ArgSpec, ValueOption
+from hotwire.builtins.pyexec import PyExecBuiltin
 
-from hotwire.builtin import Builtin, BuiltinRegistry, InputStreamSchema, OutputStreamSchema, ArgSpec
-
-from hotwire.fs import path_join
-from hotwire.sysdep.fs import Filesystem
-
-class PyFilterBuiltin(Builtin):
+class PyFilterBuiltin(PyExecBuiltin):
     __doc__ = _("""Filter object list using Python code.""")
  
-    PYFILTER_CONTENT = '''
+    CONTENT = '''
 import os,sys,re
 def execute(context, input):
   for it in input:
     if %s:
       yield it''' 
+    # Workers return the indices of matching objects, so we pass on the originals
+    POOL_CONTENT = '''
+import os,sys,re
+def execute(context, input):
+  for _hotwire_idx,it in enumerate(input):
+    if %s:
+      yield _hotwire_idx''' 
     def __init__(self):
         super(PyFilterBuiltin, self).__init__('py-filter',
                                               argspec=(ArgSpec('expression'),),
                                               input=InputStreamSchema('any'),
-                                              output='identity')
-
-    def execute(self, context, args, options=[]):
-        buf = self.PYFILTER_CONTENT % (args[0],)
-        code = compile(buf, '<input>', 'exec')
-        locals = {}
-        exec code in locals
-        execute = locals['execute']
-        custom_out = execute(context, context.input)
-        if custom_out is None:
-            return
-        if hasattr(custom_out, '__iter__'):
-            for o in custom_out:
-                yield o
-        else:
-            yield custom_out
+                                              output='identity',
+                                              options=[ValueOption(['-j', '--jobs'], 'N'), ['-u', '--unordered']],
+                                              fusable=True)
+
+    def _pool_results(self, batch, results):
+        return [batch[i] for i in results]
 
 BuiltinRegistry.getInstance().register_hotwire(PyFilterBuiltin())
@@ -19,40 +19,24 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR 
 # THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import os,sys,re,subprocess,sha,tempfile
+from hotwire.builtin import BuiltinRegistry, InputStreamSchema, OutputStreamSchema, ArgSpec, ValueOption
+from hotwire.builtins.pyexec import PyExecBuiltin
 
-from hotwire.builtin import Builtin, BuiltinRegistry, InputStreamSchema, OutputStreamSchema, ArgSpec
-
-from hotwire.fs import path_join
-from hotwire.sysdep.fs import Filesystem
-
-class PyMapBuiltin(Builtin):
+class PyMapBuiltin(PyExecBuiltin):
     __doc__ = _("""Process objects using Python code.""")
  
-    PYMAP_CONTENT = '''
+    CONTENT = '''
 import os,sys,re
 def execute(context, input):
   for it in input:
     yield %s''' 
+    POOL_CONTENT = CONTENT
     def __init__(self):
         super(PyMapBuiltin, self).__init__('py-map',
                                            argspec=(ArgSpec('expression'),),
                                            input=InputStreamSchema('any', optional=True),
-                                           output=OutputStreamSchema('any'))
-
-    def execute(self, context, args, options=[]):
-        buf = self.PYMAP_CONTENT % (args[0],)
-        code = compile(buf, '<input>', 'exec')
-        locals = {}
-        exec code in locals
-        execute = locals['execute']
-        custom_out = execute(context, context.input)
-        if custom_out is None:
-            return
-        if hasattr(custom_out, '__iter__'):
-            for o in custom_out:
-                yield o
-        else:
-            yield custom_out
+                                           output=OutputStreamSchema('any'),
+                                           options=[ValueOption(['-j', '--jobs'], 'N'), ['-u', '--unordered']],
+                                           fusable=True)
 
 BuiltinRegistry.getInstance().register_hotwire(PyMapBuiltin())
@@ -0,0 +1,55 @@
+# This file is part of the Hotwire Shell project API.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy 
+# of this software and associated documentation files (the "Software"), to deal 
+# in the Software without restriction, including without limitation the rights 
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies 
+# of the Software, and to permit persons to whom the Software is furnished to do so, 
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all 
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A 
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE X CONSORTIUM BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, 
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR 
+# THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+from hotwire.builtin import Builtin, BuiltinRegistry, InputStreamSchema, ArgSpec, ValueOption, get_option_value, absorb_projection
+from hotwire.sketch import QuantileSketch, iter_batches
+
+class QuantilesBuiltin(Builtin):
+    __doc__ = _("""Estimate quantiles of input items, optionally of a property, in constant memory.
+The fractions displayed may be given as a comma-separated list, like -q 0.5,0.95.""")
+    def __init__(self):
+        super(QuantilesBuiltin, self).__init__('quantiles',
+                                               input=InputStreamSchema('any'),
+                                               output=QuantileSketch,
+                                               options=[ValueOption(['-q', '--fractions'], 'LIST')],
+                                               argspec=(ArgSpec('property', opt=True),))
+
+    def absorb_input_operation(self, args, options, operation):
+        return absorb_projection(args, options, operation)
+
+    def execute(self, context, args, options=[]):
+        if len(args) == 1:
+            target_prop = args[0]
+        else:
+            target_prop = None
+        fractions = get_option_value(options, '-q')
+        if fractions is None:
+            fractions = QuantileSketch.DEFAULT_FRACTIONS
+        else:
+            try:
+                fractions = tuple(map(float, fractions.split(',')))
+            except ValueError, e:
+                raise ValueError(_("Invalid value for -q: %s") % (fractions,))
+        sketch = QuantileSketch(fractions=fractions)
+        for batch in iter_batches(context.input, target_prop):
+            sketch.update(batch)
+        yield sketch
+
+BuiltinRegistry.getInstance().register_hotwire(QuantilesBuiltin())
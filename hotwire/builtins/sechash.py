@@ -19,34 +19,95 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR 
 # THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import os,sys,md5,sha
+
+import os,sys,hashlib
+
+try:
+    import pyblake2
+    have_pyblake2 = True
+except ImportError, e:
+    have_pyblake2 = False
 
 import hotwire
-from hotwire.builtin import builtin_hotwire, InputStreamSchema
+from hotwire.async import ordered_thread_map
+from hotwire.builtin import builtin_hotwire, InputStreamSchema, ValueOption, get_option_value
 from hotwire.fs import FilePath
 from hotwire.sysdep.fs import Filesystem
+from hotwire.state import HashCache
+
+_READ_SIZE = 1024 * 1024
+# Files hashed ahead of output, per job
+_PENDING_PER_JOB = 4
+
+def get_algorithm(name):
+    """Return a constructor for the named hash algorithm."""
+    try:
+        hashlib.new(name)
+        return lambda: hashlib.new(name)
+    except ValueError, e:
+        pass
+    if have_pyblake2 and name in ('blake2b', 'blake2s'):
+        return getattr(pyblake2, name)
+    raise ValueError(_("Unknown hash algorithm: %s") % (name,))
+
+def hash_file(alg, fpath):
+    hashval = alg()
+    # hashlib releases the GIL while hashing large buffers
+    stream = open(fpath, 'rb')
+    try:
+        buf = stream.read(_READ_SIZE)
+        while buf:
+            hashval.update(buf)
+            buf = stream.read(_READ_SIZE)
+    finally:
+        stream.close()
+    return hashval.hexdigest()
 
 @builtin_hotwire(idempotent=True,
                  input=InputStreamSchema('any', optional=True),
                  output=str,                   
-                 options=[['-5', '--md5'],])
+                 options=[['-5', '--md5'], ValueOption(['-a', '--algorithm'], 'NAME'),
+                          ValueOption(['-j', '--jobs'], 'N')])
 def sechash(context, *files):
     _("""Create a secure hash (default SHA1) from objects or file arguments.""")
-    alg = ('-5' in context.options) and md5 or sha  
+    if '-5' in context.options:
+        algname = 'md5'
+    else:
+        algname = get_option_value(context.options, '-a', 'sha1').lower()
+    alg = get_algorithm(algname)
+    jobs = get_option_value(context.options, '-j', 1)
+    try:
+        jobs = int(jobs)
+    except ValueError, e:
+        raise ValueError(_("Invalid number of jobs: %s") % (jobs,))
     fs = Filesystem.getInstance()
     if (not files) and context.input:
         for val in context.input:
             valstr = str(val)
-            hashval = alg.new()
+            hashval = alg()
             hashval.update(valstr)
             yield hashval.hexdigest()
-    for arg in files:
+    if not files:
+        return
+    cache = HashCache()
+    def lookup(arg):
         fpath = FilePath(arg, context.cwd)
-        stream = open(fpath)
-        hashval = alg.new()
-        buf = stream.read(4096)
-        while buf:
-            hashval.update(buf)
-            buf = stream.read(4096)
-        stream.close()
-        yield hashval.hexdigest()
+        stbuf = os.stat(fpath)
+        return (fpath, stbuf, cache.lookup(stbuf, algname))
+    def compute(item):
+        (fpath, stbuf, digest) = item
+        if digest is not None:
+            return (stbuf, digest, True)
+        return (stbuf, hash_file(alg, fpath), False)
+    items = (lookup(arg) for arg in files)
+    if jobs > 1:
+        results = ordered_thread_map(compute, items, jobs, jobs * _PENDING_PER_JOB)
+    else:
+        results = (compute(item) for item in items)
+    try:
+        for (stbuf, digest, cached) in results:
+            if not cached:
+                cache.store(stbuf, algname, digest)
+            yield digest
+    finally:
+        cache.close()
@@ -20,39 +20,170 @@
 # THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 
+import heapq, tempfile, logging
+import cPickle
+from operator import attrgetter
+
+from hotwire.async import estimate_size
 from hotwire.text import MarkupText
-from hotwire.builtin import Builtin, BuiltinRegistry, InputStreamSchema, ArgSpec, MultiArgSpec 
+from hotwire.builtin import Builtin, BuiltinRegistry, InputStreamSchema, ArgSpec, MultiArgSpec, ValueOption, OptionValue, get_option_value
+
+_logger = logging.getLogger("hotwire.builtins.Sort")
+
+class _ReverseKey(object):
+    """Inverts the ordering of a sort key, for merging in reverse."""
+    __slots__ = ['key']
+    def __init__(self, key):
+        self.key = key
+
+    def __lt__(self, other):
+        return other.key < self.key
 
-class SortKey(object):
-    def __init__(self, proplist):
-        super(SortKey, self).__init__()
-        self.proplist = proplist
+    def __eq__(self, other):
+        return self.key == other.key
 
-    def __call__(self, x):
-        li = []
-        for prop in self.proplist:
-            li.append(getattr(x,prop))
-        return li
+    def __ne__(self, other):
+        return self.key != other.key
 
 class SortBuiltin(Builtin):
     __doc__ = _("""Sort input objects by property (if defined) or using default python sorting""")
+
+    # Default estimated size of input held in memory before sorted runs are
+    # written to temporary files, in megabytes
+    MAX_MEMORY = 64
+    # Most temporary files merged at once; more runs are merged in passes
+    MERGE_FILES = 64
+
     def __init__(self):
         super(SortBuiltin, self).__init__('sort',
                                             input=InputStreamSchema('any'),
                                             output='identity',
-                                            options=[['-r', '--reverse']],
+                                            options=[['-r', '--reverse'], ValueOption(['-n', '--top'], 'K'),
+                                                     ValueOption(['-m', '--max-memory'], 'MB')],
                                             argspec=MultiArgSpec('property', min=0))
 
+    def __get_int_option(self, options, name, default):
+        value = get_option_value(options, name, default)
+        if value is None:
+            return None
+        try:
+            return int(value)
+        except ValueError, e:
+            raise ValueError(_("Invalid value for %s: %s") % (name, value))
+
+    def absorb_output_operation(self, args, options, operation):
+        if operation[0] != 'limit':
+            return None
+        count = operation[1]
+        try:
+            top = self.__get_int_option(options, '-n', None)
+        except ValueError, e:
+            return None
+        if top is not None:
+            count = min(count, top)
+        options = [opt for opt in options if opt != '-n']
+        options.append(OptionValue('-n', unicode(count)))
+        return (args, options)
+
     def execute(self, context, args, options=[]):     
         reversesearch = '-r' in options
-        outlist = list(context.input)
         if len(args) == 0:
-            outlist.sort(reverse = reversesearch)
-        elif len(args) == 1:
-            outlist.sort(key = lambda x: getattr(x, args[0]), reverse = reversesearch)
+            key = None
+        else:
+            key = attrgetter(*args)
+        top = self.__get_int_option(options, '-n', None)
+        if top is not None:
+            # Only the first K are kept, in a heap
+            if reversesearch:
+                outlist = heapq.nlargest(top, context.input, key=key)
+            else:
+                outlist = heapq.nsmallest(top, context.input, key=key)
         else:
-            outlist.sort(key = SortKey(args), reverse = reversesearch)
+            max_memory = self.__get_int_option(options, '-m', self.MAX_MEMORY) * 1024 * 1024
+            outlist = self.__external_sort(context.input, key, reversesearch, max_memory)
         for arg in outlist:
             yield arg
 
+    def __write_run(self, items):
+        f = tempfile.TemporaryFile(prefix='hotwire-sort')
+        try:
+            for item in items:
+                cPickle.dump(item, f, cPickle.HIGHEST_PROTOCOL)
+        except:
+            f.close()
+            raise
+        f.seek(0)
+        return f
+
+    def __read_run(self, f):
+        while True:
+            try:
+                yield cPickle.load(f)
+            except EOFError, e:
+                f.close()
+                return
+
+    def __merge_entries(self, run, key, reversesearch):
+        for (seq, item) in run:
+            if key:
+                k = key(item)
+            else:
+                k = item
+            if reversesearch:
+                k = _ReverseKey(k)
+            # seq keeps the merge stable, and the items from being compared
+            yield (k, seq, item)
+
+    def __merge_runs(self, sources, key, reversesearch):
+        merged = heapq.merge(*map(lambda x: self.__merge_entries(x, key, reversesearch), sources))
+        for (k, seq, item) in merged:
+            yield (seq, item)
+
+    def __external_sort(self, input, key, reversesearch, max_memory):
+        """Sort input, writing sorted runs to temporary files when the items
+        held in memory exceed max_memory bytes, and merging them at the end,
+        at most MERGE_FILES at a time."""
+        def sortkey(x):
+            if key:
+                return key(x[1])
+            return x[1]
+        runs = []
+        buf = []
+        bufsize = 0
+        can_spill = True
+        try:
+            for (seq, item) in enumerate(input):
+                buf.append((seq, item))
+                bufsize += estimate_size(item)
+                if can_spill and bufsize > max_memory:
+                    buf.sort(key=sortkey, reverse=reversesearch)
+                    try:
+                        runs.append(self.__write_run(buf))
+                    except (cPickle.PicklingError, TypeError), e:
+                        _logger.debug("input is not picklable, sorting in memory", exc_info=True)
+                        can_spill = False
+                        continue
+                    buf = []
+                    bufsize = 0
+            buf.sort(key=sortkey, reverse=reversesearch)
+            if not runs:
+                for (seq, item) in buf:
+                    yield item
+                return
+            while len(runs) > self.MERGE_FILES:
+                _logger.debug("merging %d of %d sorted runs", self.MERGE_FILES, len(runs))
+                group = runs[:self.MERGE_FILES]
+                merged = self.__write_run(self.__merge_runs(map(self.__read_run, group), key, reversesearch))
+                runs = runs[self.MERGE_FILES:] + [merged]
+                for f in group:
+                    f.close()
+            _logger.debug("merging %d sorted runs", len(runs) + 1)
+            sources = map(self.__read_run, runs)
+            sources.append(buf)
+            for (seq, item) in self.__merge_runs(sources, key, reversesearch):
+                yield item
+        finally:
+            for f in runs:
+                f.close()
+
 BuiltinRegistry.getInstance().register_hotwire(SortBuiltin())
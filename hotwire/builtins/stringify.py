@@ -29,7 +29,8 @@ class StringifyBuiltin(Builtin):
         super(StringifyBuiltin, self).__init__('stringify',
                                                input=InputStreamSchema('any'),
                                                output=str,
-                                               argspec=None)
+                                               argspec=None,
+                                               fusable=True)
 
     def execute(self, context, args, options=[]):
         if len(args) != 0:
@@ -75,6 +75,7 @@ class SysBuiltin(Builtin):
                                                                                      'x-filedescriptor/special', 
                                                                                      'bytearray/chunked']),
                                          hasstatus=True,
+                                         batchable=False,
                                          argspec=MultiArgSpec('args'),
                                          options_passthrough=True)
 
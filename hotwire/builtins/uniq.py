@@ -19,43 +19,285 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR 
 # THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-from hotwire.builtin import Builtin, BuiltinRegistry, InputStreamSchema, ArgSpec
+
+import heapq, itertools, tempfile, logging
+import cPickle
+
+from hotwire.async import estimate_size
+from hotwire.builtin import Builtin, BuiltinRegistry, InputStreamSchema, ArgSpec, ValueOption, get_option_value, absorb_projection
+
+_logger = logging.getLogger("hotwire.builtins.Uniq")
+
+def _read_records(f):
+    f.seek(0)
+    while True:
+        try:
+            yield cPickle.load(f)
+        except EOFError, e:
+            f.close()
+            return
+
+class _BloomFilter(object):
+    """A set of values in fixed memory, which may wrongly claim to contain
+    a value it was never given, but never the reverse."""
+    HASHES = 3
+
+    def __init__(self, size):
+        super(_BloomFilter, self).__init__()
+        self.__bits = bytearray(size)
+        self.__nbits = size * 8
+
+    def __positions(self, value):
+        h1 = hash(value)
+        h2 = hash((value,)) | 1
+        return [(h1 + i * h2) % self.__nbits for i in xrange(self.HASHES)]
+
+    def add(self, value):
+        for pos in self.__positions(value):
+            self.__bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, value):
+        for pos in self.__positions(value):
+            if not self.__bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
 
 class UniqBuiltin(Builtin):
     __doc__ = _("""Let through only unique items dropping duplicates, optionally matching on a property.  The item/property being matched must be immutable (string, tuple etc).""")
+
+    # Default estimated size of distinct values held in memory before they
+    # are partitioned into temporary files, in megabytes
+    MAX_MEMORY = 64
+    # Rough per-value overhead of the table of distinct values
+    ENTRY_SIZE = 100
+    PARTITIONS = 16
+    # Partitions too large for memory are split again, this many times
+    MAX_DEPTH = 4
+    # Smallest filter of values seen, in bytes, once values are partitioned
+    MIN_FILTER_SIZE = 64 * 1024
+
     def __init__(self):
         super(UniqBuiltin, self).__init__('uniq',
                                             input=InputStreamSchema('any'),
                                             output='any',
-                                            options=[['-c', '--count']],
+                                            options=[['-c', '--count'], ValueOption(['-m', '--max-memory'], 'MB')],
                                             argspec=(ArgSpec('property', opt=True),))
 
+    def absorb_input_operation(self, args, options, operation):
+        return absorb_projection(args, options, operation)
+
     def execute(self, context, args, options=[]):     
         if len(args) == 1:
             target_prop = args[0]
         else:
             target_prop = None
         count_obj = '-c' in options
+        max_memory = get_option_value(options, '-m', self.MAX_MEMORY)
+        try:
+            max_memory = int(max_memory) * 1024 * 1024
+        except ValueError, e:
+            raise ValueError(_("Invalid value for -m: %s") % (max_memory,))
+        if target_prop is not None:
+            values = (getattr(arg, target_prop) for arg in context.input)
+        else:
+            values = context.input
+        values = enumerate(values)
         order_unique_items = []
+        # Maps value to [sequence number first seen, count]
         unique_items = {}
-        for arg in context.input:
-            if target_prop is not None:
-                value = getattr(arg, target_prop)
-            else:
-                value = arg
-            if value in unique_items:
-                if count_obj:
-                    unique_items[value] += 1
+        size = 0
+        spill = False
+        for (seq, value) in values:
+            entry = unique_items.get(value)
+            if entry is not None:
+                entry[1] += 1
                 continue
-            unique_items[value] = 1
+            unique_items[value] = [seq, 1]
             if count_obj:
                 # keep order while counting
                 order_unique_items.append(value)
             else:
                 yield value
+            size += estimate_size(value) + self.ENTRY_SIZE
+            if size > max_memory:
+                spill = True
+                break
+        if spill:
+            # Records are (sequence number, count, already output, value)
+            records = ((entry[0], entry[1], not count_obj, value) for (value, entry) in unique_items.iteritems())
+            try:
+                partitions = self.__partition(records, 0)
+            except (cPickle.PicklingError, TypeError), e:
+                _logger.debug("input is not picklable, keeping it in memory", exc_info=True)
+                partitions = None
+            if partitions is not None:
+                # New values are output as they come if the filter hasn't
+                # seen them.  Values it may have seen, and not recently, are
+                # held back with any new values after them until the
+                # partitions are read to tell.
+                if count_obj:
+                    seen = None
+                else:
+                    seen = _BloomFilter(max(max_memory // 2, self.MIN_FILTER_SIZE))
+                    for value in unique_items:
+                        seen.add(value)
+                order_unique_items = unique_items = None
+                budget = max(max_memory // 4, self.MIN_FILTER_SIZE)
+                recent = set()
+                recent_size = 0
+                # [sequence number, value, whether new or None if unknown]
+                held = []
+                held_size = 0
+                unpicklable = None
+                for (seq, value) in values:
+                    if seen is None or value in recent:
+                        new = False
+                    elif value in seen:
+                        new = None
+                    else:
+                        new = True
+                    output = new and not held
+                    try:
+                        self.__write_record(partitions, (seq, 1, bool(output), value), 0)
+                    except (cPickle.PicklingError, TypeError), e:
+                        _logger.debug("input is not picklable, reading partitions back into memory", exc_info=True)
+                        unpicklable = (seq, value)
+                        break
+                    if new is False:
+                        continue
+                    size = estimate_size(value) + self.ENTRY_SIZE
+                    if recent_size > budget:
+                        recent.clear()
+                        recent_size = 0
+                    recent.add(value)
+                    recent_size += size
+                    if new:
+                        seen.add(value)
+                    if output:
+                        yield value
+                        continue
+                    held.append([seq, value, new])
+                    held_size += size
+                    if held_size > budget:
+                        for value in self.__release(partitions, held):
+                            yield value
+                        held = []
+                        held_size = 0
+                # Values still held are output by the merge, in order
+                if unpicklable is None:
+                    for (seq, count, output, value) in self.__merge_partitions(partitions, max_memory):
+                        if count_obj:
+                            yield (count, value)
+                        elif not output:
+                            yield value
+                    return
+                order_unique_items = []
+                unique_items = {}
+                for (seq, count, output, value) in self.__merge_partitions(partitions, max_memory):
+                    unique_items[value] = [seq, count]
+                    if count_obj:
+                        order_unique_items.append(value)
+                    elif not output:
+                        yield value
+                values = itertools.chain([unpicklable], values)
+            for (seq, value) in values:
+                if value in unique_items:
+                    unique_items[value][1] += 1
+                    continue
+                unique_items[value] = [seq, 1]
+                if count_obj:
+                    order_unique_items.append(value)
+                else:
+                    yield value
         if count_obj:
             for item in order_unique_items:
-                yield (unique_items[item], item)
-                        
+                yield (unique_items[item][1], item)
+
+    def __release(self, partitions, held):
+        """Yield the values of held entries which are new, in order, and
+        mark them as output.  Values not known to be new are looked for
+        earlier in the partitions they hash to."""
+        unknown = {}
+        for (seq, value, new) in held:
+            if new is None:
+                unknown[value] = seq
+        repeated = set()
+        for i in set([hash((0, value)) % self.PARTITIONS for value in unknown]):
+            f = partitions[i]
+            f.seek(0)
+            while True:
+                try:
+                    (seq, count, output, value) = cPickle.load(f)
+                except EOFError, e:
+                    break
+                if value in unknown and seq < unknown[value]:
+                    repeated.add(value)
+            f.seek(0, 2)
+        for (seq, value, new) in held:
+            if new or (new is None and value not in repeated):
+                self.__write_record(partitions, (seq, 0, True, value), 0)
+                yield value
+
+    def __write_record(self, partitions, record, depth):
+        # Pickled first, so a failure leaves nothing half written
+        data = cPickle.dumps(record, cPickle.HIGHEST_PROTOCOL)
+        partitions[hash((depth, record[3])) % self.PARTITIONS].write(data)
+
+    def __partition(self, records, depth):
+        """Write records into new temporary files by hash of value,
+        returning the files."""
+        partitions = [tempfile.TemporaryFile(prefix='hotwire-uniq') for i in xrange(self.PARTITIONS)]
+        try:
+            for record in records:
+                self.__write_record(partitions, record, depth)
+        except:
+            for f in partitions:
+                f.close()
+            raise
+        return partitions
+
+    def __reduce(self, f, depth, max_memory):
+        """Combine the records of a partition by value, returning a list of
+        runs, each a temporary file of records sorted by sequence number."""
+        records = _read_records(f)
+        unique_items = {}
+        size = 0
+        for record in records:
+            (seq, count, output, value) = record
+            entry = unique_items.get(value)
+            if entry is not None:
+                entry[0] = min(entry[0], seq)
+                entry[1] += count
+                entry[2] = entry[2] or output
+                continue
+            unique_items[value] = [seq, count, output]
+            size += estimate_size(value) + self.ENTRY_SIZE
+            if size > max_memory and len(unique_items) > self.PARTITIONS and depth < self.MAX_DEPTH:
+                _logger.debug("partition too large at depth %d, splitting", depth)
+                combined = ((entry[0], entry[1], entry[2], value) for (value, entry) in unique_items.iteritems())
+                partitions = self.__partition(itertools.chain(combined, records), depth + 1)
+                unique_items = None
+                runs = []
+                for partition in partitions:
+                    runs.extend(self.__reduce(partition, depth + 1, max_memory))
+                return runs
+        run = tempfile.TemporaryFile(prefix='hotwire-uniq')
+        for (value, entry) in sorted(unique_items.iteritems(), key=lambda x: x[1][0]):
+            cPickle.dump((entry[0], entry[1], entry[2], value), run, cPickle.HIGHEST_PROTOCOL)
+        return [run]
+
+    def __merge_partitions(self, partitions, max_memory):
+        runs = []
+        try:
+            for partition in partitions:
+                runs.extend(self.__reduce(partition, 0, max_memory))
+            # Sequence numbers are unique per value, so values aren't compared
+            for record in heapq.merge(*map(_read_records, runs)):
+                yield record
+        finally:
+            for f in runs:
+                f.close()
+            for f in partitions:
+                f.close()
 
 BuiltinRegistry.getInstance().register_hotwire(UniqBuiltin())
@@ -19,25 +19,55 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR 
 # THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import os, sys, logging, re
+
+import os, sys, logging, re, threading, Queue
 
 import hotwire
 import hotwire.fs
-from hotwire.fs import FilePath, file_is_valid_utf8, path_join
+from hotwire.fs import FilePath, file_is_valid_utf8, path_join, listdir_typed, unix_basename
 
-from hotwire.builtin import Builtin, BuiltinRegistry, ArgSpec
-from hotwire.builtins.fileop import FileOpBuiltin
-from hotwire.sysdep.fs import Filesystem, File, FileStatError
+from hotwire.builtin import Builtin, BuiltinRegistry, ArgSpec, ValueOption, get_option_value
+from hotwire.builtins.fileop import FileOpBuiltin, FILE_PREDICATE_OPTIONS, TREE_PREDICATE_OPTIONS, get_file_predicate, absorb_filter_operation
+from hotwire.sysdep.fs import Filesystem, File
 
 _logger = logging.getLogger("hotwire.builtins.Walk")
 
+class _DirListing(object):
+    """A directory to be listed by a worker thread."""
+    def __init__(self, path, depth):
+        self.path = path
+        self.depth = depth
+        self.submitted = False
+        self.result = None
+        # sys.exc_info() if listing failed other than with OSError
+        self.exc_info = None
+        self.done = threading.Event()
+
+class _WalkError(object):
+    """Passed to the consumer in place of paths when a worker fails."""
+    def __init__(self, exc_info):
+        self.exc_info = exc_info
+
 class WalkBuiltin(FileOpBuiltin):
-    __doc__ = _("""Recursively traverse directory tree.""")
+    __doc__ = _("""Recursively traverse directory tree.
+Files may be selected as with find(1), by name glob (-n), name regular
+expression (-r), type letters (-t, e.g. f, d or l), size (-s, e.g. +1M),
+modification age in days (-m, e.g. -7) or owner (-o).  Directories are
+only included with -t d.  Traversal stops at a depth (-d) or at
+directories matching a glob (-p).""")
+
+    # Maximum directories queued for or held by worker threads, per job
+    PENDING_PER_JOB = 64
+
     def __init__(self):
         super(WalkBuiltin, self).__init__('walk',
                                           output=File,
                                           argspec=(ArgSpec('directory', opt=True),),
-                                          options=[['-a', '--all']])
+                                          options=[['-a', '--all'], ValueOption(['-j', '--jobs'], 'N'),
+                                                   ['-u', '--unordered']] + FILE_PREDICATE_OPTIONS + TREE_PREDICATE_OPTIONS)
+
+    def absorb_output_operation(self, args, options, operation):
+        return absorb_filter_operation(args, options, operation)
 
     def execute(self, context, args, options=[]):
         fs = Filesystem.getInstance()
@@ -49,23 +79,169 @@ class WalkBuiltin(FileOpBuiltin):
             ignorecheck = True
         else:
             ignorecheck = False 
-        for (dirpath, subdirs, fnames) in os.walk(path):
-            filtered_dirs = []
-            if ignorecheck:
-                for i,dpath in enumerate(subdirs):
-                    try:
-                        dstat = fs.get_file_sync(dpath)
-                        if dstat.hidden:
-                            filtered_dirs.append(i)
-                    except FileStatError, e:
-                        continue
-                for c,i in enumerate(filtered_dirs):
-                    del subdirs[i-c]
-            for fname in fnames:
-                fpath = path_join(dirpath, fname)                
-                fobj = fs.get_file_sync(fpath)
-                if ignorecheck and fobj.hidden:
-                    continue
-                yield fobj
+        jobs = get_option_value(options, '-j', 1)
+        try:
+            jobs = int(jobs)
+        except ValueError, e:
+            raise ValueError(_("Invalid number of jobs: %s") % (jobs,))
+        predicate = get_file_predicate(options)
+        if jobs <= 1:
+            paths = self.__walk(fs, path, ignorecheck, predicate)
+        elif '-u' in options:
+            paths = self.__walk_unordered(fs, path, ignorecheck, predicate, jobs)
+        else:
+            paths = self.__walk_ordered(fs, path, ignorecheck, predicate, jobs)
+        for fpath in paths:
+            yield fs.get_file_lazy(fpath)
+
+    def __list_dir(self, fs, dirpath, depth, ignorecheck, predicate):
+        """List dirpath, whose entries are depth levels below the start of
+        the walk.  Returns (directories to walk, paths to output)."""
+        try:
+            (dirs, others) = listdir_typed(dirpath)
+        except OSError, e:
+            _logger.debug("failed to list %s", dirpath, exc_info=True)
+            return ([], [])
+        dirs = [path_join(dirpath, x) for x in dirs]
+        others = [path_join(dirpath, x) for x in others]
+        if ignorecheck:
+            dirs = [x for x in dirs if not fs.get_path_is_hidden(x)]
+            others = [x for x in others if not fs.get_path_is_hidden(x)]
+        if predicate is None:
+            return (dirs, others)
+        # Entries are checked here, before any File is created for them
+        matches = [x for x in others if predicate.match(x, False)]
+        if predicate.wants_dirs:
+            matches = [x for x in dirs if predicate.match(x, True)] + matches
+        if predicate.max_depth is not None and depth >= predicate.max_depth:
+            dirs = []
+        elif predicate.prunes:
+            dirs = [x for x in dirs if not predicate.is_pruned(unix_basename(x))]
+        return (dirs, matches)
+
+    def __walk(self, fs, path, ignorecheck, predicate):
+        stack = [(path, 1)]
+        while stack:
+            (dirpath, depth) = stack.pop()
+            (subdirs, files) = self.__list_dir(fs, dirpath, depth, ignorecheck, predicate)
+            subdirs.reverse()
+            stack.extend([(subdir, depth + 1) for subdir in subdirs])
+            for fpath in files:
+                yield fpath
+
+    def __start_workers(self, jobs, target, *args):
+        for i in xrange(jobs):
+            t = threading.Thread(target=target, args=args)
+            t.setDaemon(True)
+            t.start()
+
+    def __ordered_worker(self, fs, ignorecheck, predicate, work, stop):
+        while True:
+            listing = work.get()
+            if listing is None:
+                return
+            try:
+                if stop.isSet():
+                    listing.result = ([], [])
+                else:
+                    listing.result = self.__list_dir(fs, listing.path, listing.depth, ignorecheck, predicate)
+            except:
+                listing.exc_info = sys.exc_info()
+            listing.done.set()
+
+    def __walk_ordered(self, fs, path, ignorecheck, predicate, jobs):
+        # The same traversal as __walk; worker threads list directories
+        # ahead of the one currently being output.
+        work = Queue.Queue()
+        stop = threading.Event()
+        maxpending = jobs * self.PENDING_PER_JOB
+        pending = 0
+        self.__start_workers(jobs, self.__ordered_worker, fs, ignorecheck, predicate, work, stop)
+        try:
+            stack = [_DirListing(path, 1)]
+            while stack:
+                listing = stack.pop()
+                if listing.submitted:
+                    listing.done.wait()
+                    pending -= 1
+                    if listing.exc_info is not None:
+                        raise listing.exc_info[0], listing.exc_info[1], listing.exc_info[2]
+                else:
+                    listing.result = self.__list_dir(fs, listing.path, listing.depth, ignorecheck, predicate)
+                (subdirs, files) = listing.result
+                children = [_DirListing(subdir, listing.depth + 1) for subdir in subdirs]
+                # Directories earliest in the walk are needed soonest
+                for child in children:
+                    if pending >= maxpending:
+                        break
+                    child.submitted = True
+                    pending += 1
+                    work.put(child)
+                children.reverse()
+                stack.extend(children)
+                for fpath in files:
+                    yield fpath
+        finally:
+            stop.set()
+            for i in xrange(jobs):
+                work.put(None)
+
+    def __put_unless_stopped(self, queue, item, stop):
+        while not stop.isSet():
+            try:
+                queue.put(item, timeout=0.1)
+                return
+            except Queue.Full, e:
+                pass
+
+    def __unordered_worker(self, fs, ignorecheck, predicate, work, output, outstanding, stop):
+        while True:
+            item = work.get()
+            if item is None:
+                return
+            # Directories which don't fit in the work queue are walked here
+            local = [item]
+            while local and not stop.isSet():
+                (dirpath, depth) = local.pop()
+                try:
+                    (subdirs, files) = self.__list_dir(fs, dirpath, depth, ignorecheck, predicate)
+                except:
+                    self.__put_unless_stopped(output, _WalkError(sys.exc_info()), stop)
+                    break
+                if files:
+                    self.__put_unless_stopped(output, files, stop)
+                outstanding[0].acquire()
+                outstanding[1] += len(subdirs) - 1
+                finished = outstanding[1] == 0
+                outstanding[0].release()
+                for subdir in subdirs:
+                    if work.qsize() < output.maxsize:
+                        work.put((subdir, depth + 1))
+                    else:
+                        local.append((subdir, depth + 1))
+                if finished:
+                    self.__put_unless_stopped(output, None, stop)
+
+    def __walk_unordered(self, fs, path, ignorecheck, predicate, jobs):
+        work = Queue.Queue()
+        output = Queue.Queue(jobs * self.PENDING_PER_JOB)
+        stop = threading.Event()
+        # Lock, and count of directories found but not yet listed
+        outstanding = [threading.Lock(), 1]
+        work.put((path, 1))
+        self.__start_workers(jobs, self.__unordered_worker, fs, ignorecheck, predicate, work, output, outstanding, stop)
+        try:
+            while True:
+                files = output.get()
+                if files is None:
+                    break
+                if isinstance(files, _WalkError):
+                    raise files.exc_info[0], files.exc_info[1], files.exc_info[2]
+                for fpath in files:
+                    yield fpath
+        finally:
+            stop.set()
+            for i in xrange(jobs):
+                work.put(None)
 
 BuiltinRegistry.getInstance().register_hotwire(WalkBuiltin())
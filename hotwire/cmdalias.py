@@ -31,16 +31,21 @@ class Alias(object):
         self.target = target
 
 class AliasRegistry(Singleton):
+    generation = property(lambda self: self.__generation, doc="""Incremented whenever the set of aliases changes""")
+
     def __init__(self):
         self.__aliases = {}
+        self.__generation = 0
 
     def remove(self, name):
         del self.__aliases[name]
+        self.__generation += 1
     
     def insert(self, name, value):
         if not isinstance(value, Alias):
             value = Alias(name, value)
         self.__aliases[name] = value
+        self.__generation += 1
 
     def __getitem__(self, item):
         return self.__aliases[item]
@@ -26,8 +26,9 @@ from StringIO import StringIO
 import hotwire.fs
 from hotwire.fs import path_normalize, unix_basename, FilePath, open_text_file
 from hotwire.sysdep.fs import Filesystem, File
-from hotwire.async import IterableQueue, MiniThreadPool
-from hotwire.builtin import BuiltinRegistry, Builtin, ArgSpec, MultiArgSpec
+from hotwire.async import IterableQueue, QueueBatcher, MiniThreadPool
+from hotwire.builtin import BuiltinRegistry, Builtin, ArgSpec, MultiArgSpec, ValueOption, OptionValue
+from hotwire.cmdalias import AliasRegistry
 import hotwire.util
 from hotwire.util import quote_arg, assert_strings_equal, class_is_assignable
 from hotwire.gutil import call_idle,call_timeout
@@ -102,6 +103,19 @@ class CommandContext(object):
         self.input_is_first = False
         self.pipeline = None
         self.cwd = hotwire.get_cwd()
+        self.hotwire = hotwire
+        self.refresh()
+        self.__auxstreams = {}
+        self.__metadata_handler = None
+        # Private attributes to be used by the builtin
+        self.attribs = {}
+        self.options = []
+        self.cancelled = False
+
+    def refresh(self):
+        """Update the snapshot of the shell state which may change between
+        parsing and execution."""
+        hotwire = self.hotwire
         self.gtk_event_time = hotwire.get_gtk_event_time()
         try:
             self.current_output_metadata = hotwire.get_current_output_metadata()
@@ -112,13 +126,6 @@ class CommandContext(object):
             _logger.debug("no current output!")
             self.current_output_metadata = None
             self.current_output_ref = None
-        self.hotwire = hotwire
-        self.__auxstreams = {}
-        self.__metadata_handler = None
-        # Private attributes to be used by the builtin
-        self.attribs = {}
-        self.options = []
-        self.cancelled = False
         
     def snapshot_current_output(self, selected=False):
         if self.current_output_ref is None:
@@ -157,10 +164,16 @@ class CommandContext(object):
         if self.__metadata_handler:
             self.__metadata_handler(metatype, flags, value)
 
+# Default bound for the queue between two threaded pipeline stages, in
+# objects and estimated bytes.  See Pipeline.set_edge_capacity().
+DEFAULT_EDGE_CAPACITY = (10000, 64*1024*1024)
+
 class CommandQueue(IterableQueue):
     def __init__(self):
         IterableQueue.__init__(self)
         self.opt_type = None
+        # (maxitems, maxbytes) to enforce once the pipeline runs asynchronously
+        self.requested_capacity = None
 
     def negotiate(self, out_fmts, in_fmts):
         _logger.debug("negotiating stream; out_fmts: %s in_fmts: %s", out_fmts, in_fmts)
@@ -171,6 +184,8 @@ class CommandQueue(IterableQueue):
                 break
             
     def cancel(self):
+        # Release a producer blocked on a full queue
+        self.set_capacity()
         self.put(None)
         
 class CommandFileQueue(object):
@@ -193,6 +208,32 @@ class CommandFileQueue(object):
         self.__f.close()
         self.__f = None
 
+class CommandFusedStream(object):
+    """Implements command queue protocol by running the producing
+    command in the consumer's thread."""
+    def __init__(self, command):
+        self.__command = command
+        self.__gen = None
+        self.opt_type = None
+
+    def negotiate(self, out_fmts, in_fmts):
+        pass
+
+    def __iter__(self):
+        if self.__gen is None:
+            self.__gen = self.__command.execute_fused()
+        return self.__gen
+
+    def cancel(self):
+        self.__command.cancel()
+
+    def close(self):
+        if self.__gen is None:
+            # The consumer never read from us; we still need to complete.
+            self.__command.complete_fused()
+        else:
+            self.__gen.close()
+
 class CommandAuxStream(object):
     def __init__(self, command, schema):
         self.command = command
@@ -237,6 +278,8 @@ class Command(object):
         self.__thread = None
         self.__executing_sync = None
         self._cancelled = False
+        self._output_closed = False
+        self.__fused_complete = False
         self.__tokens = tokens
 
     def set_pipeline(self, pipeline):
@@ -261,6 +304,9 @@ class Command(object):
         self.context.cancelled = True
         if self.context.input:
             self.context.input.cancel()
+        # We may be blocked waiting for room in our output
+        if hasattr(self.output, 'set_capacity'):
+            self.output.set_capacity()
         self.builtin.cancel(self.context)
 
     def get_input_opt_formats(self):
@@ -269,7 +315,21 @@ class Command(object):
     def get_output_opt_formats(self):
         return self.builtin.output_opt_formats
 
+    def __on_output_closed(self):
+        _logger.debug("output of %s closed by consumer", self)
+        self._output_closed = True
+        # Let the builtin stop promptly if it's blocked, e.g. on a subprocess
+        self.builtin.cancel(self.context)
+
+    def __close_input(self):
+        """Tell our producer we will read no more input."""
+        input = self.context.input
+        if input is not None and hasattr(input, 'close'):
+            input.close()
+
     def execute(self, force_sync, **kwargs):
+        if hasattr(self.output, 'set_close_handler'):
+            self.output.set_close_handler(self.__on_output_closed)
         if force_sync or not self.builtin.threaded:
             _logger.debug("executing sync: %s", self)
             self.__executing_sync = True
@@ -292,36 +352,79 @@ class Command(object):
     def get_tokens(self):
         return self.__tokens
 
+    def __get_exec_args(self):
+        matched_files = []
+        oldlen = 0
+        for globarg_in in self.args:
+            if isinstance(globarg_in, CommandArgument) and globarg_in.isquoted:
+                globarg = globarg_in
+                newlen = oldlen                    
+            else:
+                globarg = os.path.expanduser(globarg_in)
+                matched_files.extend(hotwire.fs.dirglob(self.context.cwd, globarg))
+                _logger.debug("glob on %s matched is: %s", globarg_in, matched_files) 
+                newlen = len(matched_files)
+            if oldlen == newlen:
+                matched_files.append(globarg)
+                newlen += 1
+            oldlen = newlen
+        target_args = [matched_files]
+        _logger.info("Execute '%s' args: %s options: %s", self.builtin, target_args, self.context.options)
+        kwargs = {}
+        if self.context.options and not self.builtin.flattened_args:
+            kwargs['options'] = self.context.options
+        if self.input is not None and self.input.opt_type and not self.in_redir:
+            kwargs['in_opt_format'] = self.input.opt_type                
+        if self.output.opt_type and not self.out_redir:
+            kwargs['out_opt_format'] = self.output.opt_type
+        if self.builtin.flattened_args:
+            target_args = target_args[0]
+        return (target_args, kwargs)
+
+    def execute_fused(self):
+        """Run this command in the calling thread, yielding its results.
+Used when the consumer of our output has been fused with us; see
+Pipeline.__fuse_components()."""
+        try:
+            if self._cancelled:
+                _logger.debug("%s cancelled, returning", self)
+                return
+            try:
+                (target_args, kwargs) = self.__get_exec_args()
+                execresult = self.builtin.execfunc(self.context, *target_args, **kwargs)
+                try:
+                    map_fn = self.map_fn
+                    for result in execresult:
+                        if self._cancelled:
+                            _logger.debug("%s cancelled, returning", self)
+                            break
+                        yield map_fn(result)
+                finally:
+                    if hasattr(execresult, 'close'):
+                        execresult.close()
+                    self.builtin.cleanup(self.context)
+            except Exception, e:
+                _logger.debug("Caught exception from fused command: %s", e, exc_info=True)
+                dispatcher.send('exception', self, e)
+        finally:
+            self.complete_fused()
+
+    def complete_fused(self):
+        """Note completion of a command run via execute_fused()."""
+        if self.__fused_complete:
+            return
+        self.__fused_complete = True
+        self.__close_input()
+        dispatcher.send('complete', self)
+
     def __run(self, *args, **kwargs):
         if self._cancelled:
             _logger.debug("%s cancelled, returning", self)
             self.output.put(self.map_fn(None))
+            self.__close_input()
             return
         try:
-            matched_files = []
-            oldlen = 0
-            for globarg_in in self.args:
-                if isinstance(globarg_in, CommandArgument) and globarg_in.isquoted:
-                    globarg = globarg_in
-                    newlen = oldlen                    
-                else:
-                    globarg = os.path.expanduser(globarg_in)
-                    matched_files.extend(hotwire.fs.dirglob(self.context.cwd, globarg))
-                    _logger.debug("glob on %s matched is: %s", globarg_in, matched_files) 
-                    newlen = len(matched_files)
-                if oldlen == newlen:
-                    matched_files.append(globarg)
-                    newlen += 1
-                oldlen = newlen
-            target_args = [matched_files]
-            _logger.info("Execute '%s' args: %s options: %s", self.builtin, target_args, self.context.options)
-            kwargs = {}
-            if self.context.options and not self.builtin.flattened_args:
-                kwargs['options'] = self.context.options
-            if self.input is not None and self.input.opt_type and not self.in_redir:
-                kwargs['in_opt_format'] = self.input.opt_type                
-            if self.output.opt_type and not self.out_redir:
-                kwargs['out_opt_format'] = self.output.opt_type
+            (target_args, kwargs) = self.__get_exec_args()
             if self.in_redir:
                 _logger.debug("input redirected, opening %s", self.in_redir)
                 self.context.input = CommandFileQueue(open_text_file(self.in_redir, 'r'))
@@ -332,8 +435,6 @@ class Command(object):
                 outfile = None
             try:
                 exectarget = self.builtin.execfunc
-                if self.builtin.flattened_args:
-                    target_args = target_args[0]
                 execresult = exectarget(self.context, *target_args, **kwargs)                
                 if self.builtin.singlevalue:
                     if outfile:
@@ -341,18 +442,37 @@ class Command(object):
                     else:
                         self.output.put(execresult)
                 else:
-                    for result in execresult:
-                        # if it has status, let it do its own cleanup
-                        if self._cancelled and not self.builtin.hasstatus:
-                            _logger.debug("%s cancelled, returning", self)
-                            self.output.put(self.map_fn(None))
-                            dispatcher.send('complete', self)
-                            return
-                        if outfile and (result is not None):
-                            result = unicode(result)
-                            outfile.write(result)
-                        else:                        
-                            self.output.put(self.map_fn(result))
+                    if self.builtin.batchable and hasattr(self.output, 'put_batch'):
+                        batcher = QueueBatcher(self.output)
+                        put = batcher.put
+                    else:
+                        batcher = None
+                        put = self.output.put
+                    map_fn = self.map_fn
+                    try:
+                        for result in execresult:
+                            # if it has status, let it do its own cleanup
+                            if self._cancelled and not self.builtin.hasstatus:
+                                _logger.debug("%s cancelled, returning", self)
+                                if batcher:
+                                    batcher.flush()
+                                self.output.put(self.map_fn(None))
+                                self.__close_input()
+                                dispatcher.send('complete', self)
+                                return
+                            if self._output_closed and not self.builtin.hasstatus:
+                                _logger.debug("%s output closed, stopping", self)
+                                if hasattr(execresult, 'close'):
+                                    execresult.close()
+                                break
+                            if outfile and (result is not None):
+                                result = unicode(result)
+                                outfile.write(result)
+                            else:                        
+                                put(map_fn(result))
+                    finally:
+                        if batcher:
+                            batcher.flush()
             finally:
                 if outfile:
                     outfile.close()
@@ -364,6 +484,7 @@ class Command(object):
             else:
                 dispatcher.send('exception', self, e)
         self.output.put(self.map_fn(None))
+        self.__close_input()
         dispatcher.send('complete', self)
         
     def get_executing_sync(self):
@@ -373,7 +494,10 @@ class Command(object):
         def unijoin(args):
             return ' '.join(map(unicode, args))
         args = [self.builtin.name]
-        args.extend(self.context.options)
+        for opt in self.context.options:
+            args.append(opt)
+            if isinstance(opt, OptionValue) and opt.value is not None:
+                args.append(quote_arg(opt.value))
         for cmdarg in self.args:
             if isinstance(cmdarg, CommandArgument) and cmdarg.isquoted:
                 args.append(quote_arg(cmdarg))                
@@ -388,6 +512,11 @@ class Command(object):
 class PipelineParseException(Exception):
     pass
 
+class PipelineResolveException(PipelineParseException):
+    """Raised when a command name matches nothing, which may change
+    without the pipeline text changing, as files are added."""
+    pass
+
 class ParsedToken(object):
     def __init__(self, text, start, end=None, was_unquoted=False, quoted=False):
         self.text = text 
@@ -476,7 +605,9 @@ class Pipeline(object):
                  output_type='unknown', locality=None,
                  idempotent=False,
                  undoable=False,
-                 singlevalue=False):
+                 singlevalue=False,
+                 rewrites=[],
+                 text=None):
         super(Pipeline, self).__init__()
         self.__executing_sync = False
         self.__components = components
@@ -489,6 +620,8 @@ class Pipeline(object):
         self.__undoable = undoable
         self._is_singlevalue = singlevalue
         self.__output_type = output_type
+        self.__rewrites = rewrites
+        self.__text = text
         self.__undo = []
         self.__cmd_metadata_lock = threading.Lock()
         self.__idle_emit_cmd_metadata_id = 0
@@ -501,6 +634,12 @@ class Pipeline(object):
     def get_state(self):
         return self.__state     
 
+    def refresh_context(self):
+        """Update the execution context snapshot of each command; used
+        when a pipeline is executed some time after it was parsed."""
+        for cmd in self.__components:
+            cmd.context.refresh()
+
     def disconnect(self):
         for cmd in self.__components:
             cmd.disconnect()
@@ -521,6 +660,10 @@ class Pipeline(object):
                 dispatcher.connect(self.__on_cmd_metadata, 'metadata', cmd)
                 self.__cmd_metaidx[cmd] = meta_idx
                 meta_idx += 1                
+        if force_sync:
+            fused = set()
+        else:
+            fused = self.__fuse_components()
         prev_opt_formats = []
         for cmd in self.__components:
             if cmd.input:
@@ -534,10 +677,63 @@ class Pipeline(object):
         else:
             last_opt_fmts = []
         last.output.negotiate(last_opt_fmts, opt_formats)
+        if not force_sync:
+            self.__apply_edge_capacities(fused)
         for i,cmd in enumerate(self.__components[:-1]):
+            if i in fused:
+                continue
             cmd.execute(force_sync)
         last.execute(force_sync)
+
+    def __fuse_components(self):
+        """Find runs of adjacent fusable commands ending in a threaded one,
+        and make each producer in a run execute inside its consumer's
+        thread instead of getting its own thread and queue.  Returns the
+        set of indices of commands which were fused into their consumer."""
+        fused = set()
+        threaded_tail = False
+        for i in xrange(len(self.__components)-1, 0, -1):
+            cmd = self.__components[i]
+            prev = self.__components[i-1]
+            if i not in fused:
+                # cmd ends a (potential) run; the run must not execute in the mainloop
+                threaded_tail = cmd.builtin.threaded
+            if not (threaded_tail and cmd.builtin.fusable and prev.builtin.fusable):
+                continue
+            if prev.out_redir or cmd.in_redir:
+                continue
+            _logger.debug("fusing %s into %s", prev, cmd)
+            cmd.set_input(CommandFusedStream(prev), is_first=cmd.context.input_is_first)
+            fused.add(i-1)
+        return fused
         
+    def __apply_edge_capacities(self, fused):
+        for i,cmd in enumerate(self.__components):
+            # A producer running in the main thread must never block; the
+            # consumer either hasn't started yet or is the main loop itself.
+            if not cmd.builtin.threaded or cmd.out_redir or i in fused:
+                continue
+            output = cmd.output
+            if not hasattr(output, 'set_capacity'):
+                continue
+            (maxitems, maxbytes) = getattr(output, 'requested_capacity', None) or DEFAULT_EDGE_CAPACITY
+            # If the consumer will only ever read N objects, don't let the
+            # producer get further ahead than that.
+            if i < len(self.__components)-1:
+                consumer = self.__components[i+1]
+                if not consumer.in_redir:
+                    limit = consumer.builtin.get_input_limit(consumer.args, consumer.context.options)
+                    if limit is not None:
+                        limit = max(limit, 1)
+                        maxitems = maxitems and min(maxitems, limit) or limit
+            _logger.debug("bounding output of %s to %s %s", cmd, maxitems, maxbytes)
+            output.set_capacity(maxitems, maxbytes)
+
+    def set_edge_capacity(self, idx, maxitems=0, maxbytes=0):
+        """Set the bound on the output queue of the command at index idx.
+        It takes effect when the pipeline is executed asynchronously."""
+        self.__components[idx].output.requested_capacity = (maxitems, maxbytes)
+
     def validate_state_transition(self, state):
         if self.__state == 'waiting':
             return state in ('executing', 'exception')
@@ -680,6 +876,11 @@ class Pipeline(object):
         # FIXME - remove this is_first bit
         self.__components[0].set_input(queue, is_first=True)
 
+    def get_rewrites(self):
+        """Return a list of (before, after) pairs of command text, for each
+        pair of commands merged into one when the pipeline was created."""
+        return self.__rewrites
+
     def get_locality(self):
         return self.__locality
 
@@ -699,19 +900,33 @@ class Pipeline(object):
     @staticmethod
     def __parse_option_or_arg(opts, arg, raise_on_invalid=True):
         """If argument string is an option, parse it into components and canonicalize it.
-Otherwise, return arg."""
+Otherwise, return arg.  An option taking a value is returned as an OptionValue;
+if the value wasn't attached to the option, its value is None and the caller
+should take it from the next argument."""
+        longval = None
         if arg.startswith('--'):
-            args = [arg[1:]] # we re-add the '-' below
+            longarg = arg[1:] # we re-add the '-' below
+            if '=' in longarg:
+                (longarg, longval) = longarg.split('=', 1)
+            args = [longarg]
         elif arg.startswith('-') and len(arg) >= 2:
             args = list(arg[1:])
         else:
             return False
         results = []
-        for arg in args:
+        for i,arg in enumerate(args):
             found = False
             if opts is not None:
                 for aliases in opts:
                     if '-'+arg in aliases:
+                        if isinstance(aliases, ValueOption):
+                            if len(args) == 1:
+                                value = longval
+                            else:
+                                # Short option; the rest of the cluster is the value
+                                value = ''.join(args[i+1:]) or None
+                            results.append(OptionValue(aliases[0], value))
+                            return results
                         results.append(aliases[0])
                         found = True
                         break
@@ -732,19 +947,25 @@ Otherwise, return arg."""
 
     @staticmethod
     def tokenize(text, context=None, assertfn=None, accept_partial=False, internal=False):
-        result = []
+        for (token, checkpoint) in Pipeline._tokenize_from(text, accept_partial=accept_partial, internal=internal):
+            yield token
+
+    @staticmethod
+    def _tokenize_from(text, offset=0, curpos=0, accept_partial=False, internal=False):
+        """Tokenize text starting at offset, yielding (token, checkpoint) pairs.
+The checkpoint is an (offset, curpos) pair from which lexing may later be
+resumed with the same result, or None if the lexer state doesn't allow it."""
         _logger.debug("parsing '%s'", text)
         
-        (countstream, parser) = Pipeline.mkparser(text)
+        (countstream, parser) = Pipeline.mkparser(text[offset:])
         
-        def mktoken(text, *args, **kwargs):
+        def mktoken(text, start, end=None, **kwargs):
             if internal:
                 return ParsedToken(text, -1, **kwargs)
-            return ParsedToken(text, *args, **kwargs)
+            return ParsedToken(text, start, end=end, **kwargs)
         
         is_initial = True
         first_token = None
-        curpos = 0
         while True:
             try:
                 (token, quoted) = parser.get_token_info()
@@ -759,7 +980,7 @@ Otherwise, return arg."""
                 if arg:
                     token = mktoken(arg, curpos+1, was_unquoted=True)
                     _logger.debug("handling unclosed quote, returning %s", token)
-                    yield token
+                    yield (token, None)
                     return
                 else:
                     _logger.debug("handling unclosed quote, but token was empty")
@@ -769,21 +990,29 @@ Otherwise, return arg."""
             if token is None:
                 break 
             is_initial = False
-            end = countstream.get_count()
+            count = offset + countstream.get_count()
+            end = count
             if not quoted and token in ('|', '<', '>', '>>'):
                 if token == '|':
-                    yield hotwire.script.PIPE
+                    result = hotwire.script.PIPE
                 elif token == '>':
-                    yield hotwire.script.REDIR_OUT
+                    result = hotwire.script.REDIR_OUT
                 elif token == '>>':
-                    yield hotwire.script.REDIR_OUT_APPEND
+                    result = hotwire.script.REDIR_OUT_APPEND
                 elif token == '<':
-                    yield hotwire.script.REDIR_IN           
+                    result = hotwire.script.REDIR_IN           
             else:
                 if end-curpos > len(token):
                     end = curpos+len(token)
-                yield mktoken(token, curpos, end=end, quoted=quoted)
+                result = mktoken(token, curpos, end=end, quoted=quoted)
             curpos = end
+            # Between tokens, and with no lookahead pushed back, the lexer
+            # state depends only on what it has read so far.
+            if parser.state == ' ' and not parser.pushback:
+                checkpoint = (count, curpos)
+            else:
+                checkpoint = None
+            yield (result, checkpoint)
         
     @staticmethod
     def create(context, resolver, *tokens, **kwargs):
@@ -834,7 +1063,7 @@ Otherwise, return arg."""
                         (b, cmdargs) = resolver.resolve(builtin_token.text, context)
                         _logger.debug("resolved: %r to %r %r", builtin_token.text, b, cmdargs)
                         if not b:
-                            raise PipelineParseException(_('No matches for %s') % (builtin_token.text,))
+                            raise PipelineResolveException(_('No matches for %s') % (builtin_token.text,))
                     else:
                         b = BuiltinRegistry.getInstance()['sys']
                         cmdargs = [ParsedToken(builtin_token.text, builtin_token.start, end=builtin_token.end)]
@@ -883,9 +1112,13 @@ Otherwise, return arg."""
             raise_on_invalid_options = not (b.options_passthrough or accept_partial)
             _logger.debug("raise: %r valid options %r, argument/option pool: %r", raise_on_invalid_options,
                           builtin_opts, cmdargs)
+            pending_value = None
             for token in cmdargs:
                 arg = CommandArgument(token.text, quoted=token.quoted)
-                if token.text == u'--':
+                if pending_value is not None:
+                    options.append(OptionValue(pending_value, arg))
+                    pending_value = None
+                elif token.text == u'--':
                     options_ended = True
                 elif options_ended:
                     expanded_cmdargs.append(arg)
@@ -893,9 +1126,15 @@ Otherwise, return arg."""
                     argopts = Pipeline.__parse_option_or_arg(builtin_opts, token.text, 
                                                              raise_on_invalid=raise_on_invalid_options)
                     if argopts:
+                        if isinstance(argopts[-1], OptionValue) and argopts[-1].value is None:
+                            pending_value = argopts.pop()
                         options.extend(argopts)
                     else:
                         expanded_cmdargs.append(arg)
+            if pending_value is not None:
+                if not accept_partial:
+                    raise PipelineParseException(_("Option %s requires a value") % (pending_value,))
+                options.append(pending_value)
                         
             argspec = b.argspec
             if argspec is False or accept_partial:
@@ -985,6 +1224,13 @@ Otherwise, return arg."""
 
         if undoable is None:
             undoable = False
+        if accept_partial or not kwargs.get('optimize', True):
+            text = None
+            rewrites = []
+        else:
+            # Rewriting modifies the commands; keep what was typed for display
+            text = string.join(map(lambda x: x.__str__(), components), ' | ')
+            rewrites = Pipeline.__optimize(components)
         pipeline = Pipeline(components,
                             input_type=pipeline_input_type,
                             input_optional=pipeline_input_optional,
@@ -992,7 +1238,9 @@ Otherwise, return arg."""
                             locality=prev_locality,
                             undoable=undoable,
                             idempotent=idempotent,
-                            singlevalue=pipeline_singlevalue)
+                            singlevalue=pipeline_singlevalue,
+                            rewrites=rewrites,
+                            text=text)
         _logger.debug("Parsed pipeline %s (%d components, input %s, output %s)",
                       pipeline, len(components),
                       pipeline.get_input_type(),
@@ -1000,9 +1248,62 @@ Otherwise, return arg."""
         return pipeline 
 
     @staticmethod
-    def parse(text, context=None, resolver=None, accept_partial=False):
-        tokens = list(Pipeline.tokenize(text, context, accept_partial=accept_partial))
-        return Pipeline.create(context, resolver, accept_partial=accept_partial, *tokens)
+    def __rewrite(producer, consumer):
+        """Try to replace the commands producer | consumer by one with the
+        same results.  Returns the command kept, or None."""
+        if producer.out_redir or consumer.in_redir:
+            return None
+        operation = consumer.builtin.get_input_operation(consumer.args, consumer.context.options)
+        if operation is not None:
+            result = producer.builtin.absorb_output_operation(producer.args, producer.context.options, operation)
+            if result is not None:
+                (producer.args, producer.context.options) = result
+                return producer
+        if producer.in_redir:
+            return None
+        operation = producer.builtin.get_input_operation(producer.args, producer.context.options)
+        if operation is not None:
+            result = consumer.builtin.absorb_input_operation(consumer.args, consumer.context.options, operation)
+            if result is not None:
+                (consumer.args, consumer.context.options) = result
+                consumer.set_input(producer.input, is_first=producer.context.input_is_first)
+                consumer.set_input_type(producer.context.input_type)
+                return consumer
+        return None
+
+    @staticmethod
+    def __optimize(components):
+        """Merge adjacent commands where one builtin can absorb the other's
+        operation with the same results; see Builtin.get_input_operation().
+        Modifies components in place, returning a list of descriptions
+        of the rewrites."""
+        rewrites = []
+        i = 1
+        while i < len(components):
+            producer = components[i-1]
+            consumer = components[i]
+            before = u'%s | %s' % (unicode(producer), unicode(consumer))
+            kept = Pipeline.__rewrite(producer, consumer)
+            if kept is None:
+                i += 1
+                continue
+            after = unicode(kept)
+            _logger.debug("rewrote %s as %s", before, after)
+            rewrites.append((before, after))
+            components[i-1:i+1] = [kept]
+            if i < len(components) and not components[i].in_redir:
+                components[i].set_input(kept.output)
+            # The merged command may absorb its new neighbours
+            i = max(i - 1, 1)
+        return rewrites
+
+    @staticmethod
+    def parse(text, context=None, resolver=None, accept_partial=False, tokenizer=None, optimize=True):
+        if tokenizer is not None:
+            tokens = tokenizer.tokenize(text, accept_partial=accept_partial)
+        else:
+            tokens = list(Pipeline.tokenize(text, context, accept_partial=accept_partial))
+        return Pipeline.create(context, resolver, accept_partial=accept_partial, optimize=optimize, *tokens)
     
     def __iter__(self):
         for component in self.__components:
@@ -1011,8 +1312,60 @@ Otherwise, return arg."""
     def __getitem__(self, i):
         return self.__components[i]
 
+    def get_plan(self):
+        """The pipeline as executed, after any rewrites; str() gives
+        the pipeline as parsed."""
+        return string.join(map(lambda x: x.__str__(), self.__components), ' | ')
+
     def __str__(self):
-        return string.join(map(lambda x: x.__str__(), self.__components), ' | ')        
+        if self.__text is not None:
+            return self.__text
+        return self.get_plan()
+
+def _common_prefix_len(a, b):
+    # Bisect using slice comparisons, which are much faster than a Python loop
+    lo = 0
+    hi = min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+class IncrementalTokenizer(object):
+    """Tokenizes successive versions of an edited line, returning the same
+tokens as Pipeline.tokenize(), but re-lexes only from the last token
+boundary before the first changed character."""
+    def __init__(self):
+        super(IncrementalTokenizer, self).__init__()
+        self.__text = None
+        self.__accept_partial = None
+        self.__results = [] # (token, checkpoint) pairs from Pipeline._tokenize_from()
+
+    def tokenize(self, text, accept_partial=False):
+        if not isinstance(text, unicode):
+            text = unicode(text, 'utf-8')
+        keep = 0
+        (offset, curpos) = (0, 0)
+        if self.__text is not None and accept_partial == self.__accept_partial:
+            unchanged = _common_prefix_len(self.__text, text)
+            for i,(token, checkpoint) in enumerate(self.__results):
+                if checkpoint is None:
+                    continue
+                if checkpoint[0] > unchanged:
+                    break
+                keep = i+1
+                (offset, curpos) = checkpoint
+        # Forget our state in case tokenizing raises
+        self.__text = None
+        results = self.__results[:keep]
+        results.extend(Pipeline._tokenize_from(text, offset, curpos, accept_partial=accept_partial))
+        self.__results = results
+        self.__text = text
+        self.__accept_partial = accept_partial
+        return [token for (token, checkpoint) in results]
 
 class PipelineLanguage(object):
     """Abstract class representing a supported input language."""
@@ -1129,10 +1482,51 @@ class PerlLanguage(PipelineLanguage):
 PipelineLanguageRegistry.getInstance().register(PerlLanguage())                
 
 class PipelineFactory(object):
+    """Creates pipelines from text.  Since the shell reparses its input on
+every change, recent results are cached; the cache is flushed when the set
+of builtins or aliases, or $PATH, changes.  Command names which resolved to
+nothing are not cached, since they may be installed at any time."""
+
+    CACHE_SIZE = 50
+
     def __init__(self, context, resolver=None):
         super(PipelineFactory, self).__init__()
         self.__context = context
         self.__resolver = resolver
+        self.__cache = {} # key -> Pipeline or PipelineParseException
+        self.__cache_lru = []
+        self.__cache_stamp = None
+        self.__tokenizer = IncrementalTokenizer()
+
+    def __get_cache_stamp(self):
+        return (BuiltinRegistry.getInstance().generation,
+                AliasRegistry.getInstance().generation,
+                os.environ.get('PATH'))
+
+    def __cache_lookup(self, key):
+        stamp = self.__get_cache_stamp()
+        if stamp != self.__cache_stamp:
+            self.__cache = {}
+            self.__cache_lru = []
+            self.__cache_stamp = stamp
+            return None
+        result = self.__cache.get(key)
+        if result is None:
+            return None
+        self.__cache_lru.remove(key)
+        self.__cache_lru.append(key)
+        # A pipeline may only be executed once
+        if isinstance(result, Pipeline) and result.get_state() != 'waiting':
+            return None
+        return result
+
+    def __cache_store(self, key, result):
+        if key in self.__cache:
+            self.__cache_lru.remove(key)
+        self.__cache[key] = result
+        self.__cache_lru.append(key)
+        while len(self.__cache_lru) > self.CACHE_SIZE:
+            del self.__cache[self.__cache_lru.pop(0)]
         
     def __make_lang_pipeline(self, lang, ispiped, resolve, cmdtext):
         if ispiped:
@@ -1149,6 +1543,25 @@ class PipelineFactory(object):
         return pipeline      
         
     def parse(self, text, curlang=None, resolve=True, **kwargs):
+        key = (text, curlang.uuid, self.__context.get_cwd(), resolve, tuple(sorted(kwargs.items())))
+        result = self.__cache_lookup(key)
+        if result is None:
+            try:
+                result = self.__parse(text, curlang, resolve, **kwargs)
+            except PipelineResolveException, e:
+                raise
+            except PipelineParseException, e:
+                self.__cache_store(key, e)
+                raise
+            self.__cache_store(key, result)
+        elif isinstance(result, PipelineParseException):
+            raise result
+        else:
+            _logger.debug("using cached parse of %r", text)
+            result.refresh_context()
+        return result
+
+    def __parse(self, text, curlang, resolve, **kwargs):
         # If input is not HotwirePipe, pass it through
         if curlang.uuid != '62270c40-a94a-44dd-aaa0-689f882acf34':
             return self.__make_lang_pipeline(curlang, False, resolve, text)
@@ -1179,4 +1592,5 @@ class PipelineFactory(object):
         # Try parsing as HotwirePipe
         if ispiped:
             text = 'current | ' + text
-        return Pipeline.parse(text, context=self.__context, resolver=(resolve and self.__resolver or None), **kwargs)
+        return Pipeline.parse(text, context=self.__context, resolver=(resolve and self.__resolver or None),
+                              tokenizer=self.__tokenizer, **kwargs)
@@ -19,14 +19,14 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR 
 # THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import os,sys,re,stat,logging
+import os,sys,re,stat,logging,threading,bisect,locale
 import posixpath
 
 import hotwire
 from hotwire.builtin import BuiltinRegistry
 from hotwire.cmdalias import Alias, AliasRegistry
 from hotwire.async import MiniThreadPool
-from hotwire.fs import FilePath,iterd,iterd_sorted,path_normalize,path_expanduser,unix_basename
+from hotwire.fs import FilePath,iterd,iterd_sorted,path_join,path_normalize,path_expanduser,unix_basename
 from hotwire.sysdep.fs import Filesystem
 from hotwire.externals.singletonmixin import Singleton
 from hotwire.gutil import call_idle
@@ -122,6 +122,90 @@ class BuiltinCompleter(Completer):
                 compl = self._match(alias, text, builtin)
                 if compl: yield compl
 
+class PathExecutables(Singleton):
+    """A table of the executables in each $PATH directory, like a shell's
+command hash.  Each directory is listed (and its files stat'd) once, and
+again only when its mtime changes; prefix lookups bisect a sorted name list.
+A chmod does not change the directory mtime, so a name missing from the
+index is also checked directly."""
+    def __init__(self):
+        super(PathExecutables, self).__init__()
+        self.__lock = threading.Lock()
+        # dpath -> (mtime, sorted names, names in locale order, name -> rank in it, name -> File)
+        self.__dirs = {}
+        MiniThreadPool.getInstance().run(self.__index_path)
+
+    def __index_path(self):
+        for dpath in Filesystem.getInstance().get_path_generator():
+            self.__get_dir(dpath)
+
+    def __index_dir(self, dpath, mtime):
+        _logger.debug("indexing executables in %s", dpath)
+        files = {}
+        if os.access(dpath, os.X_OK):
+            fs = Filesystem.getInstance()
+            try:
+                for fpath in iterd(dpath):
+                    fobj = fs.get_file_lazy(fpath)
+                    if fobj.is_executable and not fobj.is_directory:
+                        files[unix_basename(fpath)] = fobj
+            except OSError, e:
+                _logger.debug("failed to index %s", dpath, exc_info=True)
+        collated = sorted(files.iterkeys(), locale.strcoll)
+        ranks = dict(zip(collated, xrange(len(collated))))
+        return (mtime, sorted(collated), collated, ranks, files)
+
+    def __get_dir(self, dpath):
+        try:
+            mtime = os.stat(dpath).st_mtime
+        except OSError, e:
+            return None
+        self.__lock.acquire()
+        entry = self.__dirs.get(dpath)
+        self.__lock.release()
+        if entry is not None and entry[0] == mtime:
+            return entry
+        entry = self.__index_dir(dpath, mtime)
+        self.__lock.acquire()
+        self.__dirs[dpath] = entry
+        self.__lock.release()
+        return entry
+
+    def lookup_prefix(self, prefix):
+        """Yield File objects for the executables on $PATH whose name starts
+        with prefix, in $PATH order and sorted by locale within a directory."""
+        for dpath in Filesystem.getInstance().get_path_generator():
+            entry = self.__get_dir(dpath)
+            if entry is None:
+                continue
+            (mtime, names, collated, ranks, files) = entry
+            if prefix and prefix not in files:
+                fobj = self.__lookup_unindexed(dpath, prefix)
+                if fobj is not None:
+                    yield fobj
+            start = end = bisect.bisect_left(names, prefix)
+            while end < len(names) and names[end].startswith(prefix):
+                end += 1
+            if end - start == len(names):
+                matches = collated
+            else:
+                matches = sorted(names[start:end], key=ranks.__getitem__)
+            for name in matches:
+                yield files[name]
+
+    def __lookup_unindexed(self, dpath, name):
+        fpath = path_join(dpath, name)
+        if not os.access(fpath, os.X_OK):
+            return None
+        fobj = Filesystem.getInstance().get_file_lazy(fpath)
+        if fobj.is_directory or not fobj.is_executable:
+            return None
+        # Made executable since the directory was indexed; index it again next time
+        self.__lock.acquire()
+        self.__dirs.pop(dpath, None)
+        self.__lock.release()
+        return fobj
+
 class VerbCompleter(Completer):
     def __init__(self):
         super(VerbCompleter, self).__init__()
@@ -144,17 +228,8 @@ class VerbCompleter(Completer):
                 if fobj.is_directory or fobj.is_executable:
                     yield completion
         else:
-            fs = Filesystem.getInstance()           
-            for dpath in fs.get_path_generator():
-                if not os.access(dpath, os.X_OK):
-                    continue
-                for fpath in iterd_sorted(dpath):
-                    fname = unix_basename(fpath)
-                    if not fname.startswith(text_prefix):
-                        continue
-                    fobj = fs.get_file_sync(fpath)
-                    if fobj.is_executable:
-                        yield _mkfile_completion(text, fpath, fobj)
+            for fobj in PathExecutables.getInstance().lookup_prefix(text_prefix):
+                yield _mkfile_completion(text, fobj.path, fobj)
 
 class TokenCompleter(Completer):
     def __init__(self):
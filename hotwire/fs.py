@@ -19,7 +19,7 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR 
 # THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import os, sys, fnmatch, stat, shutil
+import os, sys, re, time, fnmatch, stat, shutil
 import posixpath, locale, urllib, codecs
 
 import hotwire
@@ -27,6 +27,12 @@ from hotwire.async import MiniThreadPool
 from hotwire.externals.glob2 import iglob
 from hotwire.sysdep import is_windows, is_unix
 
+try:
+    import scandir
+    have_scandir = True
+except ImportError, e:
+    have_scandir = False
+
 def dirglob(dir, pat):
     for result in iglob(pat, dir):
         yield result
@@ -149,6 +155,120 @@ def iterd(dpath, fpath=False):
         for fname in entries:
             yield path_join(dpath, fname)
         
+def listdir_typed(dpath):
+    """Return a pair (dirs, others) of the entry names in directory dpath,
+    split by whether each is a directory.  Symbolic links to directories
+    are in neither, matching os.walk.  Where the scandir module is available
+    the type comes from readdir() and most entries need no stat() at all."""
+    dirs = []
+    others = []
+    if have_scandir:
+        for entry in scandir.scandir(dpath):
+            if entry.is_dir(follow_symlinks=False):
+                dirs.append(entry.name)
+            elif not (entry.is_symlink() and entry.is_dir()):
+                others.append(entry.name)
+        return (dirs, others)
+    for name in os.listdir(dpath):
+        try:
+            stbuf = os.lstat(os.path.join(dpath, name))
+        except OSError, e:
+            continue
+        if stat.S_ISDIR(stbuf.st_mode):
+            dirs.append(name)
+        elif not (stat.S_ISLNK(stbuf.st_mode) and os.path.isdir(os.path.join(dpath, name))):
+            others.append(name)
+    return (dirs, others)
+
+_type_tests = {'f': stat.S_ISREG, 'd': stat.S_ISDIR, 'l': stat.S_ISLNK, 'p': stat.S_ISFIFO,
+               's': stat.S_ISSOCK, 'b': stat.S_ISBLK, 'c': stat.S_ISCHR}
+
+class FilePredicate(object):
+    """Conditions on files in the style of find(1).  Names are checked
+    first, and lstat() is only called when a condition needs it, so entries
+    can be rejected before any File is created.
+
+    types is a string of find(1) type letters.  sizes and mtimes are lists
+    of (sign, value) bounds: for a sign of 1 the size or age in days must be
+    greater than value, -1 less, and 0 equal (age rounded down).  Entries
+    match any of names (globs), any of regexps, and any of owners (uids).
+    Directories matching one of prunes aren't entered, nor deeper than
+    max_depth levels below the start."""
+    def __init__(self, names=(), regexps=(), types=None, sizes=(), mtimes=(), owners=(),
+                 prunes=(), max_depth=None):
+        if types:
+            for t in types:
+                if t not in _type_tests:
+                    raise ValueError(_("Invalid file type: %s") % (t,))
+        self.names = list(names)
+        self.regexps = [re.compile(regexp, re.UNICODE) for regexp in regexps]
+        self.types = types or None
+        self.sizes = list(sizes)
+        self.mtimes = list(mtimes)
+        self.owners = set(owners)
+        self.prunes = list(prunes)
+        self.max_depth = max_depth
+        self.now = time.time()
+        self.wants_dirs = bool(types) and 'd' in types
+        self.needs_stat = bool(self.sizes or self.mtimes or self.owners or
+                               (types and types != 'd'))
+
+    def is_pruned(self, name):
+        """Whether the directory named name shouldn't be entered."""
+        for pattern in self.prunes:
+            if fnmatch.fnmatch(name, pattern):
+                return True
+        return False
+
+    def match_name(self, name):
+        if self.names:
+            for pattern in self.names:
+                if fnmatch.fnmatch(name, pattern):
+                    break
+            else:
+                return False
+        if self.regexps:
+            for regexp in self.regexps:
+                if regexp.search(name):
+                    break
+            else:
+                return False
+        return True
+
+    def match_stat(self, stbuf):
+        mode = stbuf.st_mode
+        if self.types:
+            for t in self.types:
+                if _type_tests[t](mode):
+                    break
+            else:
+                return False
+        for (sign, value) in self.sizes:
+            if cmp(stbuf.st_size, value) != sign:
+                return False
+        for (sign, value) in self.mtimes:
+            age = (self.now - stbuf.st_mtime) / 86400
+            if sign == 0:
+                age = int(age)
+            if cmp(age, value) != sign:
+                return False
+        if self.owners and stbuf.st_uid not in self.owners:
+            return False
+        return True
+
+    def match(self, path, isdir=None):
+        """Whether the file at path matches; isdir may be given if known
+        from a directory listing, to avoid a stat() for type only."""
+        if not self.match_name(unix_basename(path)):
+            return False
+        if not self.needs_stat and (isdir is not None or not self.types):
+            return not self.types or isdir
+        try:
+            stbuf = os.lstat(path)
+        except OSError, e:
+            return False
+        return self.match_stat(stbuf)
+
 def iterd_sorted(dpath, **kwargs):
     for v in sorted(iterd(dpath, **kwargs), locale.strcoll):
         yield v
@@ -38,7 +38,17 @@ def call_timeout(timeout, func, *args, **kwargs):
         logger = logging
     return gobject.timeout_add(timeout, lambda: _run_logging(func, logger, *args), **kwargs)
 
+def add_fd_watch(fd, func, *args, **kwargs):
+    """Call func from the main loop whenever fd is readable, for as long as
+    it returns True."""
+    if 'logger' in kwargs:
+        logger = kwargs['logger']
+        del kwargs['logger']
+    else:
+        logger = logging
+    return gobject.io_add_watch(fd, gobject.IO_IN, lambda fd, condition: _run_logging(func, logger, *args), **kwargs)
+
 def remove_idle(handle_id):
     return gobject.source_remove(handle_id)
 
-__all__ = ['call_timeout', 'remove_idle']
+__all__ = ['call_timeout', 'add_fd_watch', 'remove_idle']
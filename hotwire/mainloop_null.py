@@ -33,7 +33,10 @@ def _run_logging(f, logger, *args):
 def call_timeout(timeout, func, *args, **kwargs):
     return 1
 
+def add_fd_watch(fd, func, *args, **kwargs):
+    return 1
+
 def remove_idle(handle_id):
     return None
 
-__all__ = ['call_timeout', 'remove_idle']
+__all__ = ['call_timeout', 'add_fd_watch', 'remove_idle']
@@ -0,0 +1,271 @@
+# This file is part of the Hotwire Shell project API.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy 
+# of this software and associated documentation files (the "Software"), to deal 
+# in the Software without restriction, including without limitation the rights 
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies 
+# of the Software, and to permit persons to whom the Software is furnished to do so, 
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all 
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A 
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE X CONSORTIUM BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, 
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR 
+# THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+"""Constant memory summaries of object streams."""
+
+import math, random, heapq, itertools
+
+# Number of items read from a stream at a time
+BATCH_SIZE = 1024
+
+_MASK64 = (1 << 64) - 1
+
+def iter_batches(iterable, prop=None, size=BATCH_SIZE):
+    """Yield lists of up to size items from iterable, or of their
+    property prop if given."""
+    iterable = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterable, size))
+        if not batch:
+            return
+        if prop is not None:
+            batch = [getattr(item, prop) for item in batch]
+        yield batch
+
+class HyperLogLog(object):
+    """Estimates the number of distinct hashable values, in 2**precision
+bytes.  The relative standard error is about 1.04/sqrt(2**precision)."""
+
+    def __init__(self, precision=14):
+        if not (4 <= precision <= 18):
+            raise ValueError(_("Precision must be between 4 and 18: %s") % (precision,))
+        self.precision = precision
+        self._registers = bytearray(1 << precision)
+
+    def update(self, values):
+        regs = self._registers
+        shift = 64 - self.precision
+        low = (1 << shift) - 1
+        for value in values:
+            # Spread the bits of the builtin hash (splitmix64 finalizer)
+            h = hash(value) & _MASK64
+            h = ((h ^ (h >> 30)) * 0xbf58476d1ce4e5b9) & _MASK64
+            h = ((h ^ (h >> 27)) * 0x94d049bb133111eb) & _MASK64
+            h ^= h >> 31
+            idx = h >> shift
+            rank = shift - (h & low).bit_length() + 1
+            if rank > regs[idx]:
+                regs[idx] = rank
+
+    def merge(self, other):
+        if other.precision != self.precision:
+            raise ValueError(_("Can't merge sketches of different precision"))
+        regs = self._registers
+        for idx, rank in enumerate(other._registers):
+            if rank > regs[idx]:
+                regs[idx] = rank
+
+    def __get_count(self):
+        m = len(self._registers)
+        histogram = [0] * 66
+        for rank in self._registers:
+            histogram[rank] += 1
+        total = sum(n * 2.0 ** -rank for (rank, n) in enumerate(histogram) if n)
+        if m >= 128:
+            alpha = 0.7213 / (1 + 1.079 / m)
+        else:
+            alpha = {16: 0.673, 32: 0.697, 64: 0.709}[m]
+        estimate = alpha * m * m / total
+        zeros = histogram[0]
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting is more accurate for small cardinalities
+            estimate = m * math.log(float(m) / zeros)
+        return int(round(estimate))
+
+    count = property(__get_count, doc="""Estimated number of distinct values.""")
+    error = property(lambda self: 1.04 / math.sqrt(len(self._registers)), doc="""Relative standard error of count.""")
+
+    def __repr__(self):
+        return 'HyperLogLog(count=%d, error=%.2f%%)' % (self.count, self.error * 100)
+
+class QuantileSketch(object):
+    """Estimates quantiles of a stream of ordered values (KLL sketch).
+Holds O(k) values; rank error is roughly 1.7/k of the stream length."""
+
+    DEFAULT_FRACTIONS = (0.5, 0.9, 0.99)
+
+    def __init__(self, k=200, fractions=DEFAULT_FRACTIONS, rng=random):
+        self.k = k
+        self.fractions = fractions
+        self.count = 0
+        self.min = None
+        self.max = None
+        self._random = rng
+        self._compactors = []
+        self._size = 0
+        self.__grow()
+
+    def __capacity(self, level):
+        depth = len(self._compactors) - level - 1
+        return int(math.ceil(self.k * (2.0 / 3) ** depth)) + 1
+
+    def __grow(self):
+        self._compactors.append([])
+        self._maxsize = sum(self.__capacity(level) for level in xrange(len(self._compactors)))
+
+    def __compress(self):
+        for level in xrange(len(self._compactors)):
+            items = self._compactors[level]
+            if len(items) < self.__capacity(level):
+                continue
+            if level + 1 == len(self._compactors):
+                self.__grow()
+            # Promote every other value, from a random offset, at double weight
+            items.sort()
+            end = len(items) - len(items) % 2
+            offset = self._random.random() < 0.5 and 1 or 0
+            self._compactors[level + 1].extend(items[offset:end:2])
+            del items[:end]
+            self._size = sum(map(len, self._compactors))
+            if self._size < self._maxsize:
+                break
+
+    def update(self, values):
+        values = list(values)
+        if not values:
+            return
+        lo = min(values)
+        hi = max(values)
+        if self.min is None or lo < self.min:
+            self.min = lo
+        if self.max is None or hi > self.max:
+            self.max = hi
+        self.count += len(values)
+        items = self._compactors[0]
+        for value in values:
+            items.append(value)
+            self._size += 1
+            if self._size >= self._maxsize:
+                self.__compress()
+
+    def quantiles(self, fractions):
+        """Return the estimated value at each of fractions, between 0 and 1."""
+        if not self.count:
+            return [None for fraction in fractions]
+        weighted = []
+        for level, items in enumerate(self._compactors):
+            weight = 1 << level
+            weighted.extend((value, weight) for value in items)
+        weighted.sort(key=lambda x: x[0])
+        total = sum(weight for (value, weight) in weighted)
+        results = []
+        for fraction in fractions:
+            if fraction <= 0:
+                results.append(self.min)
+                continue
+            if fraction >= 1:
+                results.append(self.max)
+                continue
+            target = fraction * total
+            rank = 0
+            for (value, weight) in weighted:
+                rank += weight
+                if rank >= target:
+                    break
+            results.append(value)
+        return results
+
+    def quantile(self, fraction):
+        return self.quantiles((fraction,))[0]
+
+    def __repr__(self):
+        fields = ['count=%d' % (self.count,), 'min=%r' % (self.min,)]
+        for (fraction, value) in zip(self.fractions, self.quantiles(self.fractions)):
+            fields.append('p%g=%r' % (fraction * 100, value))
+        fields.append('max=%r' % (self.max,))
+        return 'QuantileSketch(%s)' % (', '.join(fields),)
+
+class SpaceSaving(object):
+    """Tracks the most frequent hashable values in capacity counters.  Any
+value occurring more than 1/capacity of the time is kept, and its count is
+overestimated by at most the smallest count."""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.count = 0
+        self._counts = {}
+        self._errors = {}
+        # Entries are (count, sequence, value); stale ones are skipped
+        self._heap = []
+        self._seq = itertools.count()
+
+    def update(self, values):
+        batch = {}
+        for value in values:
+            batch[value] = batch.get(value, 0) + 1
+        for value, n in batch.iteritems():
+            self.add(value, n)
+
+    def add(self, value, n=1):
+        self.count += n
+        counts = self._counts
+        heap = self._heap
+        if value in counts:
+            counts[value] += n
+        elif len(counts) < self.capacity:
+            counts[value] = n
+            self._errors[value] = 0
+        else:
+            while True:
+                (least, seq, evicted) = heapq.heappop(heap)
+                if counts.get(evicted) == least:
+                    break
+            del counts[evicted]
+            del self._errors[evicted]
+            counts[value] = least + n
+            self._errors[value] = least
+        heapq.heappush(heap, (counts[value], self._seq.next(), value))
+        if len(heap) > 4 * self.capacity + 64:
+            self._heap = [(c, self._seq.next(), v) for (v, c) in counts.iteritems()]
+            heapq.heapify(self._heap)
+
+    def error(self, value):
+        """Return the maximum overestimate of the count of value."""
+        return self._errors.get(value)
+
+    def top(self, n=None):
+        """Return up to n (count, value) pairs, most frequent first."""
+        items = sorted(self._counts.iteritems(), key=lambda x: x[1], reverse=True)
+        if n is not None:
+            items = items[:n]
+        return [(count, value) for (value, count) in items]
+
+def reservoir_sample(iterable, k, rng=random):
+    """Return a uniform random sample of k items from iterable, in one pass
+over it, skipping between replacements (Li's algorithm L)."""
+    iterable = iter(iterable)
+    sample = list(itertools.islice(iterable, k))
+    if len(sample) < k or k == 0:
+        return sample
+    def log_uniform():
+        u = rng.random()
+        while u == 0.0:
+            u = rng.random()
+        return math.log(u)
+    # Log of the largest of k uniform variates
+    logw = log_uniform() / k
+    while True:
+        skip = int(math.floor(log_uniform() / math.log(-math.expm1(logw))))
+        for item in itertools.islice(iterable, skip, skip + 1):
+            sample[rng.randrange(k)] = item
+            break
+        else:
+            return sample
+        logw += log_uniform() / k
@@ -19,7 +19,7 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR 
 # THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import os,sys,logging,time,datetime,threading
+import os,sys,logging,time,datetime,threading,marshal
 try:
     import sqlite3
 except:
@@ -295,4 +295,114 @@ class ViewState(gobject.GObject):
             _viewstateinstance = ViewState()
         return _viewstateinstance
 
-__all__ = ['History','Preferences', 'ViewState']      
+class HashCache(object):
+    """Persistent cache of file content hashes, keyed by the file's
+    (dev, inode, size, mtime) and hash algorithm.  Each instance has its own
+    connection, so it can be used from a builtin's thread.  Stored digests
+    are written in short transactions, so concurrent users of the cache do
+    not wait on each other's write lock."""
+
+    # Stored digests are written after this many stores, or seconds
+    COMMIT_STORES = 500
+    COMMIT_INTERVAL = 2
+
+    def __init__(self):
+        super(HashCache, self).__init__()
+        path = _get_state_path('hashcache.sqlite')
+        _logger.debug("opening connection to hash cache db: %s", path)
+        self.__conn = sqlite3.connect(path, isolation_level=None)
+        self.__pending = []
+        self.__committed = time.time()
+        cursor = self.__conn.cursor()
+        # One entry per file and algorithm; a changed file replaces its entry
+        cursor.execute('''CREATE TABLE IF NOT EXISTS Hashes (dev INTEGER, ino INTEGER, algorithm TEXT, size INTEGER, mtime REAL, digest TEXT,
+                          PRIMARY KEY (dev, ino, algorithm))''')
+
+    def lookup(self, stbuf, algorithm):
+        cursor = self.__conn.cursor()
+        result = cursor.execute('''SELECT digest FROM Hashes WHERE dev = ? AND ino = ? AND algorithm = ? AND size = ? AND mtime = ?''',
+                                (stbuf.st_dev, stbuf.st_ino, algorithm, stbuf.st_size, stbuf.st_mtime)).fetchone()
+        if result is None:
+            return None
+        return str(result[0])
+
+    def store(self, stbuf, algorithm, digest):
+        """Record a digest; it is saved by a later store(), commit() or
+        close()."""
+        self.__pending.append((stbuf.st_dev, stbuf.st_ino, algorithm, stbuf.st_size, stbuf.st_mtime, digest))
+        if len(self.__pending) >= self.COMMIT_STORES or time.time() - self.__committed >= self.COMMIT_INTERVAL:
+            self.commit()
+
+    def commit(self):
+        self.__committed = time.time()
+        if not self.__pending:
+            return
+        cursor = self.__conn.cursor()
+        cursor.execute('''BEGIN TRANSACTION''')
+        try:
+            cursor.executemany('''INSERT OR REPLACE INTO Hashes VALUES (?, ?, ?, ?, ?, ?)''', self.__pending)
+        except:
+            cursor.execute('''ROLLBACK''')
+            raise
+        cursor.execute('''COMMIT''')
+        self.__pending = []
+
+    def close(self):
+        self.commit()
+        self.__conn.close()
+
+class DiskUsageCache(object):
+    """Persistent cache of the direct contents of directories, as scanned by
+    du, keyed on directory path and valid while its mtime is unchanged.  Each
+    instance has its own connection.  Stored entries are written in short
+    transactions, as for HashCache."""
+
+    # Stored entries are written after this many stores, or seconds
+    COMMIT_STORES = 500
+    COMMIT_INTERVAL = 2
+
+    def __init__(self):
+        super(DiskUsageCache, self).__init__()
+        path = _get_state_path('diskusage.sqlite')
+        _logger.debug("opening connection to disk usage db: %s", path)
+        self.__conn = sqlite3.connect(path, isolation_level=None)
+        self.__pending = []
+        self.__committed = time.time()
+        cursor = self.__conn.cursor()
+        # entry is the marshalled scan result
+        cursor.execute('''CREATE TABLE IF NOT EXISTS Directories (path TEXT PRIMARY KEY, mtime REAL, entry BLOB)''')
+
+    def lookup(self, path):
+        """Return (mtime, entry) for path, or None."""
+        cursor = self.__conn.cursor()
+        result = cursor.execute('''SELECT mtime, entry FROM Directories WHERE path = ?''', (path,)).fetchone()
+        if result is None:
+            return None
+        return (result[0], marshal.loads(str(result[1])))
+
+    def store(self, path, mtime, entry):
+        """Record a directory; it is saved by a later store(), commit() or
+        close()."""
+        self.__pending.append((path, mtime, buffer(marshal.dumps(entry))))
+        if len(self.__pending) >= self.COMMIT_STORES or time.time() - self.__committed >= self.COMMIT_INTERVAL:
+            self.commit()
+
+    def commit(self):
+        self.__committed = time.time()
+        if not self.__pending:
+            return
+        cursor = self.__conn.cursor()
+        cursor.execute('''BEGIN TRANSACTION''')
+        try:
+            cursor.executemany('''INSERT OR REPLACE INTO Directories VALUES (?, ?, ?)''', self.__pending)
+        except:
+            cursor.execute('''ROLLBACK''')
+            raise
+        cursor.execute('''COMMIT''')
+        self.__pending = []
+
+    def close(self):
+        self.commit()
+        self.__conn.close()
+
+__all__ = ['History','Preferences', 'ViewState', 'HashCache', 'DiskUsageCache']      
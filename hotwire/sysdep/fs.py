@@ -20,6 +20,8 @@
 # THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import os,sys,shutil,stat,logging,tempfile,urllib
+
+import gobject
 from cStringIO import StringIO
 
 import hotwire
@@ -41,14 +43,29 @@ class BaseFilesystem(object):
         self._trashdir = os.path.expanduser('~/.Trash')
         self.makedirs_p(self._trashdir)
 
-    def ls_dir(self, dir, show_all):
+    def ls_dir(self, dir, show_all, predicate=None):
         for x in iterd_sorted(dir):
-            fobj = self.get_file_sync(x)
+            if predicate is not None and not predicate.match(x):
+                continue
+            fobj = self.get_file_lazy(x)
             if show_all or (not fobj.hidden):  
                 yield fobj
 
     def get_basename_is_ignored(self, bn):
         return False
+
+    def get_basename_is_hidden(self, bn):
+        """Whether a file named bn is hidden, or None if that can't be
+        determined from the name alone."""
+        return None
+
+    def get_path_is_hidden(self, path):
+        """Whether the file at path is hidden, looking only at its name
+        where the filesystem allows."""
+        hidden = self.get_basename_is_hidden(unix_basename(path))
+        if hidden is None:
+            hidden = self.get_file_lazy(path).hidden
+        return hidden
     
     def get_monitor(self, path, cb):
         raise NotImplementedError()
@@ -65,6 +82,28 @@ class BaseFilesystem(object):
         f = self.fileklass(path, fs=self)
         f.get_stat_sync()
         return f
+
+    def get_file_lazy(self, path):
+        """Return a File for path without accessing the filesystem, for
+        paths known to exist (e.g. from a directory listing).  Attributes
+        are fetched on first access."""
+        return self.fileklass(path, fs=self)
+
+    def prefetch_files(self, files, attrs=('stat', 'icon')):
+        """Fetch the given attribute groups of each File in a worker thread.
+        A change is signalled for each file from the mainloop when done."""
+        MiniThreadPool.getInstance().run(self.__prefetch_files, args=(files, attrs))
+
+    @log_except(_logger)
+    def __prefetch_files(self, files, attrs):
+        for f in files:
+            f.prefetch(*attrs)
+        call_idle(self.__idle_emit_files_changed, files, priority=gobject.PRIORITY_LOW)
+
+    @log_except(_logger)
+    def __idle_emit_files_changed(self, files):
+        for f in files:
+            dispatcher.send(sender=f)
         
     def launch_open_file(self, path, cwd=None):
         raise NotImplementedError()
@@ -164,14 +203,19 @@ class FileStatError(Exception):
 
 class File(object):
     """An extended crossplatform stat() container, essentially.  
-    Extra data retrieved includes symbolic link target (if applicable) and icon."""
+    Extra data retrieved includes symbolic link target (if applicable) and icon.
+    Each group of attributes (see prefetch()) is retrieved on first access."""
     
     path = property(lambda self: self._path, doc="""Complete path to file, expressed in Hotwire notation (always forward slashes)""")
-    uri = property(lambda self: self._uri, doc="""URI notation for file""")
+    uri = property(lambda self: self._get_uri(), doc="""URI notation for file""")
     basename = property(lambda self: self._basename, doc="""Name of file (without directory component)""")
     size = property(lambda self: self._get_size(), doc="""Size in bytes of file, or None if unknown""")
-    hidden = property(lambda self: self._hidden, doc="""Whether or not this file is normally visible in directory listings""")
-    icon = property(lambda self: self._icon, doc="""Icon name (internal Hotwire/GTK+ representation)""")
+    hidden = property(lambda self: self._ensure('hidden') or self._hidden, doc="""Whether or not this file is normally visible in directory listings""")
+    icon = property(lambda self: self._ensure('icon') or self._icon, doc="""Icon name (internal Hotwire/GTK+ representation)""")
+    stat = property(lambda self: self._ensure('stat') or self._stat, doc="""Result of lstat(), or None on error""")
+    target_stat = property(lambda self: self._ensure('stat') or self._target_stat, doc="""Result of stat() for a symbolic link, or None""")
+    stat_error = property(lambda self: self._ensure('stat') or self._stat_error, doc="""Error message if the file couldn't be stat'd""")
+    xaccess = property(lambda self: self._ensure('xaccess') or self._xaccess, doc="""Whether the file may be executed by the current user""")
     is_directory = property(lambda self: self.test_directory(), doc="""Whether or not this object represents a directory""")
     is_executable = property(lambda self: self._is_executable(), doc="""Whether or not this object represents an OS-executable file""")
     is_link = property(lambda self: self._is_link(), doc="""Whether or not this object represents a symbolic link""")
@@ -181,23 +225,58 @@ class File(object):
     mtime = property(lambda self: self._get_mtime(), doc="""Modification time, in seconds since the epoch""")
     mimetype = property(lambda self: self._get_mime(), doc="""MIME type""")
 
-    __slots__ = ['fs', 'stat', 'xaccess', 'icon_error', '_permstring', 'target_stat', 'stat_error']
+    # Attribute group -> (bit in _fetched, method retrieving it)
+    _ATTR_GROUPS = {'stat': (1, '_do_get_stat'),
+                    'xaccess': (2, '_do_get_xaccess'),
+                    'hidden': (4, '_do_get_hidden'),
+                    'icon': (8, '_do_get_icon')}
+
+    __slots__ = ['fs', '_path', '_uri', '_basename', '_fetched', '_stat', '_target_stat', '_stat_error',
+                 '_xaccess', '_hidden', '_icon', 'icon_error', '_permstring']
     def __init__(self, path, fs=None):
         super(File, self).__init__()
         if not isinstance(path, unicode):
             path = unicode(path, 'utf-8')
         self._path = path
-        self._uri = 'file://' + urllib.pathname2url(path.encode(sys.getfilesystemencoding()))
+        self._uri = None
         self._basename = unix_basename(path)
         self.fs = fs
-        self.stat = None
-        self.xaccess = None
+        self._fetched = 0
+        self._stat = None
+        self._xaccess = None
         self._hidden = None
         self._icon = None
         self.icon_error = False
         self._permstring = None
-        self.target_stat = None
-        self.stat_error = None
+        self._target_stat = None
+        self._stat_error = None
+
+    def _ensure(self, group):
+        # Always returns None, so it can be chained with "or" in properties.
+        # The bit is set after fetching, so a concurrent reader in another
+        # thread may fetch again, but never sees a partial result.
+        (bit, fetch) = self._ATTR_GROUPS[group]
+        if not (self._fetched & bit):
+            getattr(self, fetch)()
+            self._fetched |= bit
+
+    def prefetch(self, *groups):
+        """Retrieve the given groups of attributes now if not already done;
+        valid groups are 'stat', 'xaccess', 'hidden' and 'icon'."""
+        for group in groups:
+            self._ensure(group)
+
+    def is_fetched(self, *groups):
+        """Whether all of the given attribute groups have been retrieved."""
+        for group in groups:
+            if not (self._fetched & self._ATTR_GROUPS[group][0]):
+                return False
+        return True
+
+    def _get_uri(self):
+        if self._uri is None:
+            self._uri = 'file://' + urllib.pathname2url(self._path.encode(sys.getfilesystemencoding()))
+        return self._uri
         
     def __cmp__(self, o):
         if isinstance(o, File):
@@ -284,27 +363,27 @@ class File(object):
         MiniThreadPool.getInstance().run(self.__get_stat_signal)
         
     def get_stat_sync(self):
+        """Retrieve stat attributes now, raising FileStatError on failure.
+        Other attributes are still retrieved on demand."""
         self._do_get_stat(rethrow=True)
-        self._do_get_xaccess()
-        self._do_get_hidden()
-        self._do_get_icon()
+        self._fetched |= self._ATTR_GROUPS['stat'][0]
 
     def _do_get_stat(self, rethrow=False):
         try:
-            self.stat = hasattr(os, 'lstat') and os.lstat(self.path) or os.stat(self.path)
-            if stat.S_ISLNK(self.stat[stat.ST_MODE]):
+            self._stat = hasattr(os, 'lstat') and os.lstat(self.path) or os.stat(self.path)
+            if stat.S_ISLNK(self._stat[stat.ST_MODE]):
                 try:
-                    self.target_stat = os.stat(self.path)
+                    self._target_stat = os.stat(self.path)
                 except OSError, e:
-                    self.target_stat = None		
+                    self._target_stat = None		
         except OSError, e:
             _logger.debug("Failed to stat '%s': %s", self.path, e)
-            self.stat_error = str(e)
+            self._stat_error = str(e)
             if rethrow:
                 raise FileStatError(e)
             
     def _do_get_xaccess(self):
-        self.xaccess = os.access(self.path, os.X_OK)
+        self._xaccess = os.access(self.path, os.X_OK)
         
     def _do_get_hidden(self):
         pass 
@@ -320,6 +399,7 @@ class File(object):
     @log_except(_logger)
     def __get_stat_signal(self):
         self.get_stat_sync()
+        self.prefetch('xaccess', 'hidden', 'icon')
         call_idle(self.__idle_emit_changed, priority=gobject.PRIORITY_LOW)        
         
     @log_except(_logger)
@@ -39,13 +39,17 @@ class GnomeVfsFile(UnixFile):
     """A File implementation based on the GnomeVFS virtual filesystem.
 Important members include the "vfsstat" and "uri"."""
     
-    __slots__ = ['vfsstat', 'target_vfsstat']
+    __slots__ = ['_vfsstat', '_target_vfsstat', '_target_vfsstat_error']
+    
+    vfsstat = property(lambda self: self._ensure('stat') or self._vfsstat)
+    target_vfsstat = property(lambda self: self._ensure('stat') or self._target_vfsstat)
+    target_vfsstat_error = property(lambda self: self._ensure('stat') or self._target_vfsstat_error)
 
     def __init__(self, path, **kwargs):
         super(GnomeVfsFile, self).__init__(path, **kwargs)
-        self.vfsstat = None
-        self.target_vfsstat = None
-        self.target_vfsstat_error = None 
+        self._vfsstat = None
+        self._target_vfsstat = None
+        self._target_vfsstat_error = None 
 
     def test_directory(self, follow_link=True):
         if not self.vfsstat:
@@ -87,16 +91,16 @@ Important members include the "vfsstat" and "uri"."""
             
     def _do_get_stat(self, rethrow=False):
         try:
-            self.vfsstat = gnomevfs.get_file_info(self.uri, gnomevfs.FILE_INFO_GET_MIME_TYPE | gnomevfs.FILE_INFO_FORCE_FAST_MIME_TYPE)
-            if self.vfsstat.type == gnomevfs.FILE_TYPE_SYMBOLIC_LINK:
+            self._vfsstat = gnomevfs.get_file_info(self.uri, gnomevfs.FILE_INFO_GET_MIME_TYPE | gnomevfs.FILE_INFO_FORCE_FAST_MIME_TYPE)
+            if self._vfsstat.type == gnomevfs.FILE_TYPE_SYMBOLIC_LINK:
                 try:
-                    self.target_vfsstat = gnomevfs.get_file_info(self.uri, gnomevfs.FILE_INFO_GET_MIME_TYPE | gnomevfs.FILE_INFO_FOLLOW_LINKS)
+                    self._target_vfsstat = gnomevfs.get_file_info(self.uri, gnomevfs.FILE_INFO_GET_MIME_TYPE | gnomevfs.FILE_INFO_FOLLOW_LINKS)
                 except Exception, e:
                     _logger.debug("Failed to get file info for target of '%s'", self.uri, exc_info=True)
-                    self.target_vfsstat_error = str(e)
+                    self._target_vfsstat_error = str(e)
         except Exception, e:
             _logger.debug("Failed to get file info for '%s'", self.uri, exc_info=True)
-            self.stat_error = str(e)
+            self._stat_error = str(e)
             if rethrow:
                 raise FileStatError(e)
             
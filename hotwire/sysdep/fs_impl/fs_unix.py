@@ -40,6 +40,9 @@ class UnixFilesystem(BaseFilesystem):
         for d in os.environ['PATH'].split(u':'):
             yield d
 
+    def get_basename_is_hidden(self, bn):
+        return bn.startswith('.')
+
     def path_executable_match(self, input, file_path):
         """This function is a hack for Windows; essentially we
         allow using "python" as an exact match for "python.exe".
@@ -65,8 +65,10 @@ class Win32Filesystem(BaseFilesystem):
         super(Win32Filesystem, self).__init__()
         self.fileklass = Win32File
 
-    def ls_dir(self, dir, show_all):
+    def ls_dir(self, dir, show_all, predicate=None):
         for x in iterd_sorted(dir):
+            if predicate is not None and not predicate.match(x):
+                continue
             try:
                 if show_all:
                     yield self.get_file_sync(x)
@@ -116,7 +118,7 @@ class Win32File(File):
         
     def _do_get_xaccess(self):
         super(Win32File, self)._do_get_xaccess()
-        self.xaccess = self.xaccess and win_exec_re.search(self.path)
+        self._xaccess = self._xaccess and win_exec_re.search(self.path)
 
     def _do_get_hidden(self):
         path = self.path.encode(sys.getfilesystemencoding()).rstrip('/')#FindFiles on directories ending with '/' returns []
@@ -140,7 +142,7 @@ class Win32File(File):
                 _logger.debug("Trying our own wrapper of _stat32")
                 st = Stat32()
                 msvcrt._stat(self.path.encode(sys.getfilesystemencoding()), byref(st))
-                self.stat = (st.st_mode, st.st_ino, st.st_dev, st.st_nlink - 1, st.st_uid,
+                self._stat = (st.st_mode, st.st_ino, st.st_dev, st.st_nlink - 1, st.st_uid,
                              st.st_gid, st.st_size, st.st_atime, st.st_mtime, st.st_ctime)
             else:
                 if rethrow:
@@ -136,6 +136,21 @@ class PipelineParserTests(unittest.TestCase):
         self.assertEquals(len(pt), 2)
         self.assertEquals(pt[1].text, 'foo@bar')
 
+    def testIncremental1(self):
+        tokenizer = IncrementalTokenizer()
+        def tokinfo(tokens):
+            return [(not isinstance(t, int)) and (t.text, t.start, t.end, t.quoted, t.was_unquoted) or t for t in tokens]
+        for text in ["sys echo 'foo", "sys echo 'foo bar' baz", "sys echo 'foo bar' baz|fil",
+                     "sys echo 'foo bar' baz | filter x", "sys cat 'foo bar' baz | filter x", "sys"]:
+            try:
+                expected = tokinfo(Pipeline.tokenize(text, accept_partial=True))
+            except hotwire.command.PipelineParseException, e:
+                # e.g. an unclosed quote
+                self.assertRaises(hotwire.command.PipelineParseException,
+                                  lambda: tokenizer.tokenize(text, accept_partial=True))
+                continue
+            self.assertEquals(expected, tokinfo(tokenizer.tokenize(text, accept_partial=True)))
+
 class PipelineInstantiateTests(unittest.TestCase):
     def setUp(self):
         self._context = HotwireContext()
@@ -197,6 +212,41 @@ class PipelineInstantiateTests(unittest.TestCase):
         self.assertRaises(hotwire.command.PipelineParseException, lambda: Pipeline.parse('fsearch --frob', self._context))
         self.assertRaises(hotwire.command.PipelineParseException, lambda: Pipeline.parse('fsearch -x', self._context))                 
 
+    def testFactoryCache1(self):
+        factory = PipelineFactory(self._context)
+        lang = PipelineLanguageRegistry.getInstance()['62270c40-a94a-44dd-aaa0-689f882acf34']
+        p = factory.parse('proc | filter -s foo', curlang=lang)
+        self.assertTrue(p is factory.parse('proc | filter -s foo', curlang=lang))
+        self.assertTrue(p is not factory.parse('proc | filter -s foo', curlang=lang, resolve=False))
+        self.assertRaises(hotwire.command.PipelineParseException, lambda: factory.parse('filter foo', curlang=lang))
+        self.assertRaises(hotwire.command.PipelineParseException, lambda: factory.parse('filter foo', curlang=lang))
+        p.execute_sync()
+        self.assertTrue(p is not factory.parse('proc | filter -s foo', curlang=lang))
+
+    def testFactoryCache2(self):
+        # A command that didn't resolve is found once it is installed
+        factory = PipelineFactory(self._context, resolver=BaseCommandResolver())
+        lang = PipelineLanguageRegistry.getInstance()['62270c40-a94a-44dd-aaa0-689f882acf34']
+        tmpd = tempfile.mkdtemp(prefix='hotwiretest')
+        oldpath = os.environ['PATH']
+        os.environ['PATH'] = tmpd
+        try:
+            self.assertRaises(hotwire.command.PipelineParseException, lambda: factory.parse('hotwiretestcmd', curlang=lang))
+            exe_path = os.path.join(tmpd, 'hotwiretestcmd')
+            open(exe_path, 'w').close()
+            os.chmod(exe_path, 0755)
+            p = factory.parse('hotwiretestcmd', curlang=lang)
+            self.assertEquals(p[0].builtin.name, 'sys')
+        finally:
+            os.environ['PATH'] = oldpath
+            shutil.rmtree(tmpd)
+
+    def testValueOptions1(self):
+        for text in ("py-map -j4 'it'", "py-map -j 4 'it'", "py-map --jobs=4 'it'", "py-map -uj 4 'it'"):
+            p = Pipeline.parse(text, self._context)
+            self.assertEquals(u"py-map -j 4 it", unicode(p).replace(u'-u ', u''))
+        self.assertRaises(hotwire.command.PipelineParseException, lambda: Pipeline.parse("py-map 'it' -j", self._context))
+
 class PipelineRunTestFramework(unittest.TestCase):
     def setUp(self):
         self._context = HotwireContext()
@@ -491,6 +541,68 @@ class PipelineRunTests(PipelineRunTestFramework):
         self.assertEquals(results[0], '22596363b3de40b06f981fb85d82312e8c0ed511')
         self.assertEquals(results[1], '84b5d4093c8ffaf2eca0feaf014a53b9f41d28ed')
         
+    def testSechashFiles1(self):
+        self._setupTree2()
+        for i in xrange(20):
+            f = open(path_join(self._tmpd, 'hash%d.txt' % (i,)), 'wb')
+            f.write('hello world %d\n' % (i,))
+            f.close()
+        args = ' '.join(map(lambda i: 'hash%d.txt' % (i,), xrange(20)))
+        p = Pipeline.parse("sechash -a sha256 " + args, self._context)
+        p.execute_sync()
+        results = list(p.get_output())
+        self.assertEquals(len(results), 20)
+        self.assertEquals(results[0], '8bfa9a398e97152beaaf385847808ad2d828c1c7251f1a45bc7697723827e7e7')
+        # Again, from the cache and in parallel
+        p = Pipeline.parse("sechash -j 4 -a sha256 " + args, self._context)
+        p.execute_sync()
+        self.assertEquals(list(p.get_output()), results)
+        f = open(path_join(self._tmpd, 'hash0.txt'), 'wb')
+        f.write('changed\n')
+        f.close()
+        p = Pipeline.parse("sechash -j 4 -a sha256 " + args, self._context)
+        p.execute_sync()
+        changed = list(p.get_output())
+        self.assertEquals(changed[0], '7f8b1dfc466b6249f06cbe55c9174df2578e7754da793fded244ef5cba2a38f1')
+        self.assertEquals(changed[1:], results[1:])
+
+    def testDupes1(self):
+        self._setupTree2()
+        content = 'hello world\n' * 1000
+        for (name, data) in [('d1', content), ('d2', content), ('d3', content[:-2] + 'x\n'),
+                             (path_join('testdir2', 'd4'), content), ('s1', 'hi'), ('s2', 'hi')]:
+            f = open(path_join(self._tmpd, name), 'wb')
+            f.write(data)
+            f.close()
+        for cmd in ["dupes", "dupes -j 2"]:
+            p = Pipeline.parse(cmd, self._context)
+            p.execute_sync()
+            results = map(lambda group: sorted(map(lambda x: unix_basename(x.path), group)), p.get_output())
+            results.sort()
+            self.assertEquals(results, [['d1', 'd2', 'd4'], ['s1', 's2']])
+
+    def testDu1(self):
+        self._setupTree2()
+        f = open(path_join(self._tmpd, 'testdir2', 'blah'), 'wb')
+        f.write('x' * 1000)
+        f.close()
+        os.link(path_join(self._tmpd, 'testdir2', 'blah'), path_join(self._tmpd, 'testdir2', 'blah2'))
+        p = Pipeline.parse("du -j 2", self._context)
+        p.execute_sync()
+        results = list(p.get_output())
+        self.assertEquals(len(results), 4)
+        self.assertEquals(results[-1].path, self._tmpd)
+        self.assertEquals(results[-1].files, 5)
+        dirsize = os.lstat(self._tmpd).st_size
+        for subdir in ['testdir', 'testdir2', 'dir with spaces']:
+            dirsize += os.lstat(path_join(self._tmpd, subdir)).st_size
+        self.assertEquals(results[-1].size, dirsize + 1000)
+        p = Pipeline.parse("du -s", self._context)
+        p.execute_sync()
+        summary = list(p.get_output())
+        self.assertEquals(len(summary), 1)
+        self.assertEquals((summary[0].size, summary[0].blocks), (results[-1].size, results[-1].blocks))
+
     def testCat1(self):
         self._setupTree2()
         outpath = path_join(self._tmpd, 'cattest.txt')
@@ -619,6 +731,21 @@ class PipelineRunTests(PipelineRunTestFramework):
         results = list(p.get_output())
         self.assertEquals([0,2,5,7,8,10], results)
 
+    def testSortTop1(self):
+        p = Pipeline.parse("py-eval '[5,2,7,8,10,0]' | iter | sort -n 3")
+        p.execute_sync()
+        self.assertEquals([0,2,5], list(p.get_output()))
+        p = Pipeline.parse("py-eval '[5,2,7,8,10,0]' | iter | sort -r -n 2")
+        p.execute_sync()
+        self.assertEquals([10,8], list(p.get_output()))
+
+    def testSortExternal1(self):
+        # A zero memory limit spills every item to its own run, merged in passes
+        p = Pipeline.parse("py-eval 'range(500, 0, -1)' | iter | py-map 'complex(it % 7, it)' | sort -m 0 real")
+        p.execute_sync()
+        results = list(p.get_output())
+        self.assertEquals(sorted(map(lambda x: complex(x % 7, x), range(500, 0, -1)), key=lambda x: x.real), results)
+
     def testUniq1(self):
         self._setupTree1()
         p = Pipeline.parse("py-eval '[1,1,2,4,5,4]' | iter | uniq")
@@ -626,6 +753,94 @@ class PipelineRunTests(PipelineRunTestFramework):
         results = list(p.get_output())
         self.assertEquals([1,2,4,5], results)
 
+    def testUniqSpill1(self):
+        # A zero memory limit partitions values into temporary files
+        p = Pipeline.parse("py-eval '[i % 50 for i in range(300, 0, -1)]' | iter | uniq -m 0 -c")
+        p.execute_sync()
+        results = list(p.get_output())
+        self.assertEquals([(6, i % 50) for i in range(300, 250, -1)], results)
+        p = Pipeline.parse("py-eval '[i % 50 for i in range(300, 0, -1)]' | iter | uniq -m 0")
+        p.execute_sync()
+        results = list(p.get_output())
+        self.assertEquals([i % 50 for i in range(300, 250, -1)], results)
+
+    def testUniqSpill2(self):
+        # An unpicklable value after the spill falls back to memory
+        p = Pipeline.parse("py-eval '(lambda f: [i % 50 == 7 and f or i % 50 for i in range(300, 0, -1)])(lambda: 0)' | iter | uniq -m 0 -c")
+        p.execute_sync()
+        results = list(p.get_output())
+        self.assertEquals([(6, i % 50) for i in range(300, 250, -1)],
+                          map(lambda x: (x[0], callable(x[1]) and 7 or x[1]), results))
+        p = Pipeline.parse("py-eval '(lambda f: [i % 50 == 7 and f or i % 50 for i in range(300, 0, -1)])(lambda: 0)' | iter | uniq -m 0")
+        p.execute_sync()
+        results = list(p.get_output())
+        self.assertEquals([i % 50 for i in range(300, 250, -1)],
+                          map(lambda x: callable(x) and 7 or x, results))
+
+    def testUniqSpill3(self):
+        # Repeats of values seen too long ago are checked on disk, and new
+        # values behind them still come out in order
+        p = Pipeline.parse("py-eval '[i % 2000 for i in range(4000)] + [2000]' | iter | uniq -m 0")
+        p.execute_sync()
+        self.assertEquals(range(2001), list(p.get_output()))
+
+    def testSketch1(self):
+        p = Pipeline.parse("py-eval 'range(1000) * 2' | iter | distinct")
+        p.execute_sync()
+        results = list(p.get_output())
+        self.assertEquals(1, len(results))
+        self.assert_(abs(results[0].count - 1000) < 30)
+        p = Pipeline.parse("py-eval 'range(100, 0, -1)' | iter | quantiles real")
+        p.execute_sync()
+        results = list(p.get_output())
+        self.assertEquals([1, 50, 90, 100], results[0].quantiles([0, 0.5, 0.9, 1]))
+        p = Pipeline.parse("py-eval '[7] * 50 + range(100)' | iter | frequent -n 1")
+        p.execute_sync()
+        results = list(p.get_output())
+        self.assertEquals(1, len(results[0]))
+        self.assertEquals(7, results[0][0][1])
+        p = Pipeline.parse("py-eval 'range(100)' | iter | sample -n 5")
+        p.execute_sync()
+        results = list(p.get_output())
+        self.assertEquals(5, len(set(results[0])))
+        self.assert_(set(results[0]) <= set(range(100)))
+
+    def testGroup1(self):
+        p = Pipeline.parse("py-eval '[complex(i % 3, i) for i in range(10)]' | iter | group real -c --sum imag --max=imag")
+        p.execute_sync()
+        results = list(p.get_output())
+        self.assertEquals([(0, 4, 18, 9), (1, 3, 12, 7), (2, 3, 15, 8)],
+                          [(r.real, r.count, r.sum_imag, r.max_imag) for r in results])
+        self.assert_(not results[0].partial)
+
+    def testGroup2(self):
+        # None values are skipped, as in SQL
+        p = Pipeline.parse("py-eval '[type(\"T\", (), {\"k\": (i % 2, 2)[i == 6], \"v\": (None, i)[i % 3 > 0]})() for i in range(7)]' | iter | group k -c --sum v --avg v --min v --max v")
+        p.execute_sync()
+        results = list(p.get_output())
+        self.assertEquals([(0, 3, 6, 3.0, 2, 4), (1, 3, 6, 3.0, 1, 5), (2, 1, None, None, None, None)],
+                          [(r.k, r.count, r.sum_v, r.avg_v, r.min_v, r.max_v) for r in results])
+
+    def testRewrite1(self):
+        p = Pipeline.parse("py-eval 'range(20, 0, -1)' | iter | sort | head -3 | head -2", self._context)
+        self.assertEquals(len(list(p)), 3)
+        self.assertEquals(len(p.get_rewrites()), 2)
+        p.execute_sync()
+        self.assertEquals(list(p.get_output()), [1, 2])
+        p = Pipeline.parse("py-eval '[3, 1, 3, 2]' | iter | prop real | uniq -c", self._context)
+        self.assertEquals(len(list(p)), 3)
+        p.execute_sync()
+        self.assertEquals(list(p.get_output()), [(2, 3), (1, 1), (1, 2)])
+        # A filter not on the name can't be done during traversal
+        p = Pipeline.parse("walk | filter foo path", self._context)
+        self.assertEquals(len(list(p)), 2)
+        p = Pipeline.parse("walk | filter foo basename", self._context)
+        self.assertEquals(str(p), 'walk | filter foo basename')
+        self.assertEquals(p.get_plan(), 'walk -r foo')
+        p = Pipeline.parse("explain 'walk | filter foo basename'", self._context)
+        p.execute_sync()
+        self.assertEquals(list(p.get_output()), ['walk -r foo', 'walk | filter foo basename => walk -r foo'])
+
     def testHead1(self):
         self._setupTree1()
         p = Pipeline.parse("py-eval '[5,2,7,8,10,0,34]' | iter | head -5")
@@ -633,6 +848,107 @@ class PipelineRunTests(PipelineRunTestFramework):
         results = list(p.get_output())
         self.assertEquals([5,2,7,8,10], results)
 
+    def testBatchedStream1(self):
+        p = Pipeline.parse("py-eval 'range(5000)' | iter | py-filter 'it % 2 == 0' | py-map 'it + 1'")
+        p.execute()
+        results = list(p.get_output())
+        self.assertEquals(range(1, 5000, 2), results)
+
+    def testBoundedEdge1(self):
+        p = Pipeline.parse("py-eval 'range(1000)' | iter | py-map 'it * 2' | py-filter 'it % 3 == 0'")
+        p.set_edge_capacity(2, 5)
+        p.execute()
+        results = list(p.get_output())
+        self.assertEquals(range(0, 2000, 6), results)
+
+    def testBoundedEdgeCancel1(self):
+        p = Pipeline.parse("py-eval 'range(100000)' | iter | py-map 'it'")
+        p.set_edge_capacity(2, 10)
+        p.execute()
+        p.cancel()
+        results = list(p.get_output())
+        self.assertTrue(len(results) < 100000)
+
+    def testFusedException1(self):
+        p = Pipeline.parse("py-eval 'range(10)' | iter | py-map '10 / (it - 5)' | stringify")
+        p.execute()
+        results = list(p.get_output())
+        self.assertEquals(['-2', '-3', '-4', '-5', '-10'], results)
+        self.assertEquals('exception', p.get_state())
+        self.assertEquals('py-map', p.get_exception_info()[2].builtin.name)
+
+    def testPyMapJobs1(self):
+        p = Pipeline.parse("py-eval 'range(2000)' | iter | py-map -j 3 'it * 2'")
+        p.execute()
+        results = list(p.get_output())
+        self.assertEquals(range(0, 4000, 2), results)
+
+    def testPyFilterJobsUnordered1(self):
+        p = Pipeline.parse("py-eval 'range(2000)' | iter | py-filter -j 3 -u 'it % 3 == 0'")
+        p.execute()
+        results = list(p.get_output())
+        results.sort()
+        self.assertEquals(range(0, 2000, 3), results)
+
+    def testHeadEarlyExit1(self):
+        p = Pipeline.parse("py-eval 'xrange(1000000)' | iter | py-map 'it' | head -5")
+        p.execute()
+        results = list(p.get_output())
+        self.assertEquals([0,1,2,3,4], results)
+
+    def testFSearch1(self):
+        self._setupTree2()
+        f = open(path_join(self._tmpd, 'testdir2', 'blah'), 'w')
+        f.write('hello\nworld\nhello world')
+        f.close()
+        f = open(path_join(self._tmpd, 'testf'), 'w')
+        f.write('bin\0ary hello\n')
+        f.close()
+        p = Pipeline.parse("fsearch world", self._context)
+        p.execute_sync()
+        results = list(p.get_output())
+        self.assertEquals(len(results), 2)
+        self.assertEquals(results[0].line, 'world')
+        self.assertEquals(results[0].line_num, 1)
+        self.assertEquals(results[1].line, 'hello world')
+        self.assertEquals((results[1].match_start, results[1].match_end), (6, 11))
+        p = Pipeline.parse("fsearch -j 2 'w.r'", self._context)
+        p.execute_sync()
+        self.assertEquals(map(lambda x: (x.line, x.match_start), p.get_output()),
+                          map(lambda x: (x.line, x.match_start), results))
+
+    def testFSearchIndex1(self):
+        self._setupTree2()
+        f = open(path_join(self._tmpd, 'testdir2', 'blah'), 'w')
+        f.write('hello\nworld\nhello world')
+        f.close()
+        p = Pipeline.parse("fsindex", self._context)
+        p.execute_sync()
+        try:
+            p = Pipeline.parse("fsearch 'wor+ld'", self._context)
+            p.execute_sync()
+            results = list(p.get_output())
+            self.assertEquals(map(lambda x: (x.path, x.line_num), results),
+                              [(path_join(self._tmpd, 'testdir2', 'blah'), 1),
+                               (path_join(self._tmpd, 'testdir2', 'blah'), 2)])
+            # A file modified in place is searched without reindexing
+            f = open(path_join(self._tmpd, 'testf'), 'w')
+            f.write('world')
+            f.close()
+            p = Pipeline.parse("fsearch world", self._context)
+            p.execute_sync()
+            self.assertEquals(len(list(p.get_output())), 3)
+            # A new file makes the index stale
+            f = open(path_join(self._tmpd, 'testdir2', 'newf'), 'w')
+            f.write('world')
+            f.close()
+            p = Pipeline.parse("fsearch world", self._context)
+            p.execute_sync()
+            self.assertEquals(len(list(p.get_output())), 4)
+        finally:
+            p = Pipeline.parse("fsindex -d", self._context)
+            p.execute_sync()
+
         
 def suite():
     loader = unittest.TestLoader()
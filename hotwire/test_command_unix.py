@@ -144,3 +144,65 @@ class PipelineRunTestsUnix(PipelineRunTestFramework):
         self.assertEquals(len(results), 1)
         self.assertEquals(results[0].path, bglobpath)
         
+
+    def testWalkHidden1(self):
+        self._setupTree2()
+        os.mkdir(path_join(self._tmpd, '.nosee'))
+        open(path_join(self._tmpd, '.nosee', 'blah2'), 'w').close()
+        open(path_join(self._tmpd, 'testdir2', '.nosee2'), 'w').close()
+        p = Pipeline.parse("walk", self._context)
+        p.execute_sync()
+        results = list(p.get_output())
+        self.assertEquals(len(results), 5)
+        self.assertEquals(sorted(map(lambda x: unix_basename(x.path), results)),
+                          ['blah', 'f3test', 'otherfile', 'testf', 'testf2'])
+        self.assert_(results[0].stat is not None)
+
+    def testWalkJobs1(self):
+        self._setupTree2()
+        os.mkdir(path_join(self._tmpd, 'testdir2', 'sub'))
+        open(path_join(self._tmpd, 'testdir2', 'sub', 'blah3'), 'w').close()
+        os.symlink(path_join(self._tmpd, 'testdir2'), path_join(self._tmpd, 'testlink'))
+        p = Pipeline.parse("walk | prop path", self._context)
+        p.execute_sync()
+        results = list(p.get_output())
+        self.assertEquals(len(results), 6)
+        p = Pipeline.parse("walk -j 3 | prop path", self._context)
+        p.execute_sync()
+        self.assertEquals(list(p.get_output()), results)
+        p = Pipeline.parse("walk -j 3 -u | prop path", self._context)
+        p.execute_sync()
+        self.assertEquals(sorted(p.get_output()), sorted(results))
+
+    def testWalkJobsError1(self):
+        self._setupTree2()
+        # Listing this directory fails in a worker thread; the error must
+        # reach the pipeline rather than leave it waiting.
+        badpath = os.path.join(str(self._tmpd), 'testdir2', 'bad\xff')
+        open(badpath, 'w').close()
+        try:
+            for args in ['', '-j 3', '-j 3 -u']:
+                p = Pipeline.parse("walk %s" % (args,), self._context)
+                self.assertRaises(UnicodeDecodeError, p.execute_sync)
+        finally:
+            # tearDown can't remove it either
+            os.unlink(badpath)
+
+    def testWalkPredicate1(self):
+        self._setupTree2()
+        os.mkdir(path_join(self._tmpd, 'testdir2', 'sub'))
+        f = open(path_join(self._tmpd, 'testdir2', 'sub', 'blah3'), 'w')
+        f.write('hello')
+        f.close()
+        def walk_basenames(args):
+            p = Pipeline.parse("walk %s | prop basename" % (args,), self._context)
+            p.execute_sync()
+            return sorted(p.get_output())
+        self.assertEquals(walk_basenames("-n 'test*'"), ['testf', 'testf2'])
+        self.assertEquals(walk_basenames("-t d"), ['dir with spaces', 'sub', 'testdir', 'testdir2'])
+        self.assertEquals(walk_basenames("-d 1"), ['f3test', 'otherfile', 'testf', 'testf2'])
+        self.assertEquals(walk_basenames("-p testdir2"), ['f3test', 'otherfile', 'testf', 'testf2'])
+        self.assertEquals(walk_basenames("-s +0 -j 2"), ['blah3'])
+        p = Pipeline.parse("ls -n 'test*' | prop basename", self._context)
+        p.execute_sync()
+        self.assertEquals(sorted(p.get_output()), ['testdir', 'testdir2', 'testf', 'testf2'])
@@ -83,6 +83,37 @@ class CompletionTests(unittest.TestCase):
             verbs = list(self.vc.completions('this does not exist', "."))
             self.assertEquals(len(verbs), 0)
 
+    def testPathExecutables1(self):
+        self._setupTree1()
+        oldpath = os.environ['PATH']
+        os.environ['PATH'] = self._tmpd
+        try:
+            verbs = list(self.vc.completions('test', "."))
+            self.assertEquals(len(verbs), 1)
+            self.assertEquals(verbs[0].target.path, self._test_exe_path)
+            exe2_path = path_join(self._tmpd, 'testf2')
+            open(exe2_path, 'w').close()
+            os.chmod(exe2_path, 0744)
+            # Force a visible directory mtime change
+            st = os.stat(self._tmpd)
+            os.utime(self._tmpd, (st.st_atime, st.st_mtime + 1))
+            verbs = list(self.vc.completions('test', "."))
+            self.assertEquals(len(verbs), 2)
+            self.assertEquals(verbs[1].target.path, exe2_path)
+            # chmod leaves the directory mtime alone
+            exe3_path = path_join(self._tmpd, 'testf3')
+            open(exe3_path, 'w').close()
+            st = os.stat(self._tmpd)
+            os.utime(self._tmpd, (st.st_atime, st.st_mtime + 1))
+            verbs = list(self.vc.completions('testf3', "."))
+            self.assertEquals(len(verbs), 0)
+            os.chmod(exe3_path, 0744)
+            verbs = list(self.vc.completions('testf3', "."))
+            self.assertEquals(len(verbs), 1)
+            self.assertEquals(verbs[0].target.path, exe3_path)
+        finally:
+            os.environ['PATH'] = oldpath
+
     def testCwd(self):
         self._setupTree1()
         result = self.cc.sync_complete(self.pc, 'testf', self._tmpd)
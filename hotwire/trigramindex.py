@@ -0,0 +1,340 @@
+# This file is part of the Hotwire Shell project API.
+
+# Permission is hereby granted, free of charge, to any person obtaining a copy 
+# of this software and associated documentation files (the "Software"), to deal 
+# in the Software without restriction, including without limitation the rights 
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell copies 
+# of the Software, and to permit persons to whom the Software is furnished to do so, 
+# subject to the following conditions:
+
+# The above copyright notice and this permission notice shall be included in all 
+# copies or substantial portions of the Software.
+
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR IMPLIED,
+# INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY, FITNESS FOR A 
+# PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE X CONSORTIUM BE 
+# LIABLE FOR ANY CLAIM, DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT, 
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR 
+# THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+
+import os, sys, stat, logging, mmap, zlib, array, string, hashlib, time
+import sre_parse, sre_constants
+try:
+    import sqlite3
+except:
+    from pysqlite2 import dbapi2 as sqlite3
+
+from hotwire.fs import path_join, listdir_typed
+from hotwire.sysdep.fs import Filesystem
+
+_logger = logging.getLogger("hotwire.TrigramIndex")
+
+# Indexing folds ASCII case only, independent of the current locale.
+_ascii_lower = string.maketrans(string.ascii_uppercase, string.ascii_lowercase)
+
+def _trigram_int(gram):
+    return (ord(gram[0]) << 16) | (ord(gram[1]) << 8) | ord(gram[2])
+
+def _trigrams(data):
+    """Return the set of trigrams in data, as ints; trigrams spanning lines
+    are omitted, as fsearch matches a line at a time."""
+    grams = set()
+    for line in set(data.translate(_ascii_lower).split('\n')):
+        grams.update([line[i:i+3] for i in xrange(len(line) - 2)])
+    return set(map(_trigram_int, grams))
+
+def _literal_runs(subpattern, ignorecase):
+    """Return a list of literal strings, all of which appear in any match of
+    the parsed regular expression subpattern."""
+    runs = []
+    current = []
+    def flush():
+        if current:
+            runs.append(u''.join(current))
+            del current[:]
+    for (op, av) in subpattern:
+        if op == sre_constants.LITERAL:
+            c = unichr(av)
+            # Under re.UNICODE, some non-ASCII characters compare equal to
+            # these ASCII ones ignoring case.
+            if c == u'\n' or (ignorecase and (av > 127 or c in u'kKiI')):
+                flush()
+            else:
+                current.append(c)
+        elif op == sre_constants.AT:
+            # Zero-width
+            continue
+        else:
+            flush()
+            if op == sre_constants.SUBPATTERN:
+                runs.extend(_literal_runs(av[-1], ignorecase))
+            elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] >= 1:
+                runs.extend(_literal_runs(av[2], ignorecase))
+            elif op == sre_constants.BRANCH:
+                runs.append(map(lambda x: _literal_runs(x, ignorecase), av[1]))
+    flush()
+    return runs
+
+def required_trigrams(regexp, ignorecase, encoding):
+    """Return the set of trigrams (as ints) which must appear in a file, as
+    encoded in encoding, with a line matching regexp.  The set is empty if
+    nothing can be inferred, including when the pattern has characters
+    encoding cannot represent."""
+    try:
+        parsed = sre_parse.parse(regexp, ignorecase and sre_constants.SRE_FLAG_IGNORECASE or 0)
+    except sre_constants.error, e:
+        return set()
+    ignorecase = bool(parsed.pattern.flags & sre_constants.SRE_FLAG_IGNORECASE)
+    def trigrams_for(runs):
+        result = set()
+        for run in runs:
+            if isinstance(run, list):
+                # A branch; only what all alternatives require
+                alternatives = map(trigrams_for, run)
+                result.update(reduce(set.intersection, alternatives))
+            else:
+                result.update(_trigrams(run.encode(encoding)))
+        return result
+    try:
+        return trigrams_for(_literal_runs(parsed, ignorecase))
+    except UnicodeEncodeError, e:
+        return set()
+
+def _get_index_path(root):
+    dirname = Filesystem.getInstance().make_conf_subdir('index')
+    return os.path.join(dirname, hashlib.md5(root.encode('utf-8')).hexdigest() + '.sqlite')
+
+class TrigramIndex(object):
+    """A persistent index from trigrams to the files under a directory tree
+which contain them, used by fsearch to avoid reading most files.  Hidden
+files are not indexed, as for walk."""
+
+    # Larger files are not indexed, and are always searched
+    MAX_FILE_SIZE = 64 * 1024 * 1024
+    BINARY_CHECK_SIZE = 8192
+    # Files between writes of the posting lists during update()
+    FLUSH_FILES = 2000
+
+    root = property(lambda self: self.__root)
+
+    def __init__(self, root, path):
+        super(TrigramIndex, self).__init__()
+        self.__root = root
+        self.__path = path
+        self.__conn = sqlite3.connect(path, isolation_level=None)
+        cursor = self.__conn.cursor()
+        cursor.execute('''CREATE TABLE IF NOT EXISTS Meta (keyName TEXT UNIQUE, keyValue)''')
+        # trigrams is the compressed array of the file's trigrams, or NULL if not indexed
+        cursor.execute('''CREATE TABLE IF NOT EXISTS Files (fid INTEGER PRIMARY KEY AUTOINCREMENT, path TEXT UNIQUE,
+                          dev INTEGER, ino INTEGER, size INTEGER, mtime REAL, trigrams BLOB)''')
+        cursor.execute('''CREATE INDEX IF NOT EXISTS FilesUnindexed ON Files (fid) WHERE trigrams IS NULL''')
+        cursor.execute('''CREATE TABLE IF NOT EXISTS Directories (path TEXT PRIMARY KEY, mtime REAL)''')
+        # fids is the sorted array of ids of files containing the trigram
+        cursor.execute('''CREATE TABLE IF NOT EXISTS Postings (trigram INTEGER PRIMARY KEY, fids BLOB)''')
+        cursor.execute('''INSERT OR IGNORE INTO Meta VALUES ('root', ?)''', (root,))
+
+    @staticmethod
+    def create(root):
+        return TrigramIndex(root, _get_index_path(root))
+
+    @staticmethod
+    def find(path):
+        """Return the index covering path, or None."""
+        fs = Filesystem.getInstance()
+        root = path.rstrip('/') or '/'
+        while True:
+            ipath = _get_index_path(root)
+            if os.path.exists(ipath):
+                return TrigramIndex(root, ipath)
+            (parent, name) = os.path.split(root)
+            if parent == root or fs.get_basename_is_hidden(name) is not False:
+                # The index wouldn't include anything under a hidden directory
+                return None
+            root = parent
+
+    def remove(self):
+        self.__conn.close()
+        os.unlink(self.__path)
+
+    def close(self):
+        self.__conn.close()
+
+    def is_fresh(self):
+        """Whether no files have been added, removed or renamed since the last
+        update(); this compares directory modification times.  Files modified
+        in place are noticed by query()."""
+        cursor = self.__conn.cursor()
+        count = 0
+        for (dpath, mtime) in cursor.execute('''SELECT path, mtime FROM Directories'''):
+            count += 1
+            try:
+                if os.stat(dpath).st_mtime != mtime:
+                    return False
+            except OSError, e:
+                return False
+        return count > 0
+
+    def __walk(self):
+        fs = Filesystem.getInstance()
+        stack = [self.__root]
+        while stack:
+            dirpath = stack.pop()
+            try:
+                dirstat = os.stat(dirpath)
+                (dirs, others) = listdir_typed(dirpath)
+            except OSError, e:
+                _logger.debug("failed to list %s", dirpath, exc_info=True)
+                continue
+            yield (dirpath, dirstat, None)
+            for name in others:
+                fpath = path_join(dirpath, name)
+                if not fs.get_path_is_hidden(fpath):
+                    yield (dirpath, None, fpath)
+            subdirs = [path_join(dirpath, x) for x in dirs]
+            subdirs.reverse()
+            stack.extend([x for x in subdirs if not fs.get_path_is_hidden(x)])
+
+    def __read_trigrams(self, fpath, stbuf):
+        if stbuf.st_size > self.MAX_FILE_SIZE:
+            return None
+        if stbuf.st_size == 0:
+            return set()
+        try:
+            f = open(fpath, 'rb')
+            try:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                try:
+                    if buf.find('\0', 0, self.BINARY_CHECK_SIZE) >= 0:
+                        # fsearch skips binary files
+                        return set()
+                    return _trigrams(buf[:])
+                finally:
+                    buf.close()
+            finally:
+                f.close()
+        except (IOError, EnvironmentError, ValueError), e:
+            _logger.debug("failed to read %s", fpath, exc_info=True)
+            return None
+
+    def __flush(self, cursor, added, removed):
+        for trigram in set(added).union(removed):
+            row = cursor.execute('''SELECT fids FROM Postings WHERE trigram = ?''', (trigram,)).fetchone()
+            fids = set()
+            if row:
+                fids.update(array.array('i', str(row[0])))
+            fids.difference_update(removed.get(trigram, ()))
+            fids.update(added.get(trigram, ()))
+            if fids:
+                blob = buffer(array.array('i', sorted(fids)).tostring())
+                cursor.execute('''INSERT OR REPLACE INTO Postings VALUES (?, ?)''', (trigram, blob))
+            else:
+                cursor.execute('''DELETE FROM Postings WHERE trigram = ?''', (trigram,))
+        added.clear()
+        removed.clear()
+
+    def __file_trigrams(self, blob):
+        if blob is None:
+            return ()
+        return array.array('i', zlib.decompress(str(blob)))
+
+    def update(self):
+        """Bring the index up to date with the files under the root, reading
+        only those whose (dev, inode, size, mtime) changed."""
+        cursor = self.__conn.cursor()
+        known = {}
+        for row in cursor.execute('''SELECT path, fid, dev, ino, size, mtime FROM Files'''):
+            known[row[0]] = (row[1], tuple(row[2:]))
+        cursor.execute('''BEGIN TRANSACTION''')
+        cursor.execute('''DELETE FROM Directories''')
+        added = {}
+        removed = {}
+        pending = 0
+        for (dirpath, dirstat, fpath) in self.__walk():
+            if fpath is None:
+                cursor.execute('''INSERT INTO Directories VALUES (?, ?)''', (dirpath, dirstat.st_mtime))
+                continue
+            try:
+                # Follow links, as fsearch does
+                stbuf = os.stat(fpath)
+            except OSError, e:
+                continue
+            if not stat.S_ISREG(stbuf.st_mode):
+                continue
+            key = (stbuf.st_dev, stbuf.st_ino, stbuf.st_size, stbuf.st_mtime)
+            prev = known.pop(fpath, None)
+            if prev is not None:
+                (fid, prevkey) = prev
+                if prevkey == key:
+                    continue
+                row = cursor.execute('''SELECT trigrams FROM Files WHERE fid = ?''', (fid,)).fetchone()
+                for trigram in self.__file_trigrams(row[0]):
+                    removed.setdefault(trigram, set()).add(fid)
+            trigrams = self.__read_trigrams(fpath, stbuf)
+            if trigrams is None:
+                blob = None
+            else:
+                blob = buffer(zlib.compress(array.array('i', sorted(trigrams)).tostring()))
+            if prev is not None:
+                cursor.execute('''UPDATE Files SET dev=?, ino=?, size=?, mtime=?, trigrams=? WHERE fid = ?''',
+                               key + (blob, fid))
+            else:
+                cursor.execute('''INSERT INTO Files VALUES (NULL, ?, ?, ?, ?, ?, ?)''', (fpath,) + key + (blob,))
+                fid = cursor.lastrowid
+            for trigram in trigrams or ():
+                added.setdefault(trigram, set()).add(fid)
+            pending += 1
+            if pending >= self.FLUSH_FILES:
+                self.__flush(cursor, added, removed)
+                pending = 0
+        for (fpath, (fid, prevkey)) in known.iteritems():
+            row = cursor.execute('''SELECT trigrams FROM Files WHERE fid = ?''', (fid,)).fetchone()
+            for trigram in self.__file_trigrams(row[0]):
+                removed.setdefault(trigram, set()).add(fid)
+            cursor.execute('''DELETE FROM Files WHERE fid = ?''', (fid,))
+        self.__flush(cursor, added, removed)
+        cursor.execute('''INSERT OR REPLACE INTO Meta VALUES ('updated', ?)''', (time.time(),))
+        cursor.execute('''COMMIT''')
+
+    def query(self, path, trigrams):
+        """Return the paths of files under path which may contain all of
+        the given trigrams, in the order they were first indexed.  Files
+        whose (dev, inode, size, mtime) changed since the last update() are
+        also returned, as their indexed trigrams may be stale; this stats
+        the indexed files under path, but reads none of them."""
+        cursor = self.__conn.cursor()
+        postings = []
+        for trigram in trigrams:
+            row = cursor.execute('''SELECT fids FROM Postings WHERE trigram = ?''', (trigram,)).fetchone()
+            if row is None:
+                postings = [()]
+                break
+            postings.append(array.array('i', str(row[0])))
+        # Intersect starting with the rarest trigram
+        postings.sort(key=len)
+        candidates = None
+        for fids in postings:
+            if candidates is None:
+                candidates = set(fids)
+            else:
+                candidates.intersection_update(fids)
+            if not candidates:
+                break
+        prefix = path.rstrip('/') + '/'
+        if candidates is None:
+            rows = cursor.execute('''SELECT path FROM Files ORDER BY fid''').fetchall()
+            return [row[0] for row in rows if row[0].startswith(prefix)]
+        paths = []
+        for row in cursor.execute('''SELECT fid, path, trigrams IS NULL, dev, ino, size, mtime FROM Files ORDER BY fid''').fetchall():
+            if not row[1].startswith(prefix):
+                continue
+            if row[0] in candidates or row[2]:
+                paths.append(row[1])
+                continue
+            try:
+                stbuf = os.stat(row[1])
+            except OSError, e:
+                continue
+            if (stbuf.st_dev, stbuf.st_ino, stbuf.st_size, stbuf.st_mtime) != tuple(row[3:]):
+                paths.append(row[1])
+        return paths
@@ -248,6 +248,9 @@ class CommandExecutionHeader(gtk.VBox):
             status_str = self.__objects.get_status_str()
             if status_str is None:
                 status_str = _('%d objects') % (ocount,)
+            rates = self.__objects.get_rates()
+            if rates and self.get_state() == 'executing':
+                status_str += _(', %d/s shown of %d/s') % rates
         else:
             status_str = None
             
@@ -0,0 +1,382 @@
+# This file is part of the Hotwire Shell user interface.
+#   
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program; if not, write to the Free Software
+# Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+
+import array, logging
+
+import gtk, gobject
+
+from hotwire.gutil import call_idle
+from hotwire.logutil import log_except
+
+_logger = logging.getLogger("hotwire.ui.ObjectList")
+
+class ObjectListModel(gtk.GenericTreeModel):
+    """A list model with one object per row, for renderers which display
+rows computed from a single Python object.  Objects are kept in arrival order
+in a plain list, so appending is O(1).  While the model is sorted, a separate
+array maps each row to its object.  Objects appended to a sorted model are
+held back until flush(), which merges them into that array in one pass;
+flush() is also called from the main loop after any append.  Changing the
+sort rebuilds the array.  Rows are found from their
+object through a map keyed on object identity, and a binary search for
+their position if the model is sorted; see object_changed().  Rows whose
+objects changed are checked against their neighbours by flush(), and moved
+if they no longer sort there, so the array stays sorted.
+
+Unlike gtk.ListStore wrapped in gtk.TreeModelSort, no per-row GTK structures
+are kept, and cell data is only computed when the view asks for a row.  The
+model is not a gtk.TreeSortable; sorting is driven with set_sort_func() and
+set_sort_column_id(), whose comparison functions take two objects."""
+    def __init__(self):
+        gtk.GenericTreeModel.__init__(self)
+        # Iterators refer to rows by position, using the int objects held
+        # in __rowrefs so they stay alive as long as the model.
+        self.props.leak_references = False
+        self.__objects = []
+        self.__rowrefs = []
+        self.__order = None
+        # Indexes in __objects not yet merged into __order
+        self.__pending = []
+        self.__flush_idle_id = 0
+        # id(object) -> index in __objects, or a list of indexes if the
+        # object was appended more than once
+        self.__index = {}
+        self.__changed = set()
+        self.__changed_idle_id = 0
+        # Indexes in __order whose objects changed since the last flush
+        self.__unsorted = set()
+        self.__sort_funcs = {}
+        self.__sort_column_id = None
+        self.__sort_order = gtk.SORT_ASCENDING
+
+    def get_n_rows(self):
+        """Return the number of rows, not counting objects not yet flushed."""
+        if self.__order is not None:
+            return len(self.__order)
+        return len(self.__objects)
+
+    def get_object(self, position):
+        """Return the object displayed at the given row position."""
+        if self.__order is not None:
+            return self.__objects[self.__order[position]]
+        return self.__objects[position]
+
+    def iter_objects(self):
+        """Yield the objects in display order."""
+        self.flush()
+        if self.__order is None:
+            for obj in self.__objects:
+                yield obj
+        else:
+            objects = self.__objects
+            for idx in self.__order:
+                yield objects[idx]
+
+    def append(self, row):
+        """Append a row, given as a sequence whose only item is the object,
+        as for gtk.ListStore.append()."""
+        (obj,) = row
+        idx = len(self.__objects)
+        self.__objects.append(obj)
+        self.__rowrefs.append(idx)
+        key = id(obj)
+        prev = self.__index.get(key)
+        if prev is None:
+            self.__index[key] = idx
+        elif isinstance(prev, list):
+            prev.append(idx)
+        else:
+            self.__index[key] = [prev, idx]
+        if self.__order is None:
+            self.row_inserted((idx,), self.get_iter((idx,)))
+            return
+        self.__pending.append(idx)
+        if not self.__flush_idle_id:
+            self.__flush_idle_id = call_idle(self.__idle_flush)
+
+    @log_except(_logger)
+    def __idle_flush(self):
+        self.__flush_idle_id = 0
+        self.flush()
+
+    def flush(self):
+        """Move rows whose objects changed to where they now sort, then
+        insert the objects appended since the last flush into the sort
+        order, and signal the new rows."""
+        if self.__unsorted:
+            unsorted = self.__unsorted
+            self.__unsorted = set()
+            self.__reposition(unsorted)
+        if not self.__pending:
+            return
+        pending = self.__pending
+        self.__pending = []
+        slots = self.__merge(pending)
+        # Rows are signalled in ascending position, so all rows before each
+        # one are known to the view
+        for (i, slot) in enumerate(slots):
+            path = (slot + i,)
+            self.row_inserted(path, self.get_iter(path))
+
+    def __merge(self, idxs):
+        """Merge the rows for idxs into the sort order, returning the
+        position among the previous rows where each went, in sorted order."""
+        objects = self.__objects
+        compare = self.__compare
+        idxs.sort(lambda a, b: compare(objects[a], objects[b]))
+        order = self.__order
+        # Where each new row goes among the current rows; these are in
+        # ascending order, since the new rows are sorted
+        slots = [self.__bisect(objects[idx]) for idx in idxs]
+        merged = array.array('l')
+        prev = 0
+        for (slot, idx) in zip(slots, idxs):
+            merged.extend(order[prev:slot])
+            merged.append(idx)
+            prev = slot
+        merged.extend(order[prev:])
+        self.__order = merged
+        return slots
+
+    def __reposition(self, idxs):
+        """Restore the sort order after the objects of the rows for idxs
+        changed, signalling rows_reordered if any row moves."""
+        order = self.__order
+        objects = self.__objects
+        compare = self.__compare
+        positions = []
+        missing = set()
+        for idx in idxs:
+            position = self.__find_sorted(idx)
+            if position is None:
+                missing.add(idx)
+            else:
+                positions.append(position)
+        if missing:
+            # Rows a binary search misses are out of order; one scan finds
+            # them all
+            positions.extend([position for (position, idx) in enumerate(order) if idx in missing])
+        else:
+            # Only pairs including a changed row can be out of order
+            last = len(order) - 1
+            for position in positions:
+                obj = objects[order[position]]
+                if (position > 0 and compare(objects[order[position - 1]], obj) > 0) \
+                        or (position < last and compare(obj, objects[order[position + 1]]) > 0):
+                    break
+            else:
+                return
+        # Take out all the changed rows, leaving the others in order, and
+        # merge them back in
+        positions.sort()
+        remaining = array.array('l')
+        prev = 0
+        for position in positions:
+            remaining.extend(order[prev:position])
+            prev = position + 1
+        remaining.extend(order[prev:])
+        self.__order = remaining
+        self.__merge(list(idxs))
+        old_positions = array.array('l', [0]) * len(objects)
+        for (position, idx) in enumerate(order):
+            old_positions[idx] = position
+        _logger.debug("moving %d changed rows", len(idxs))
+        self.rows_reordered(None, None, [old_positions[idx] for idx in self.__order])
+
+    def __find_sorted(self, idx):
+        # Search by the sort order, then along any run of equal rows; None
+        # if the row is not where its object now sorts
+        order = self.__order
+        objects = self.__objects
+        obj = objects[idx]
+        position = self.__bisect(obj, after=False)
+        while position < len(order) and order[position] != idx \
+                and self.__compare(obj, objects[order[position]]) == 0:
+            position += 1
+        if position < len(order) and order[position] == idx:
+            return position
+        return None
+
+    def __get_position(self, idx):
+        if self.__order is None:
+            return idx
+        position = self.__find_sorted(idx)
+        if position is None:
+            # The object changed since it was placed, moving its sort key
+            position = self.__order.index(idx)
+        return position
+
+    def find_object(self, obj):
+        """Return the position of the first row holding obj (compared by
+        identity) in display order, or None."""
+        self.flush()
+        idxs = self.__index.get(id(obj))
+        if idxs is None:
+            return None
+        if not isinstance(idxs, list):
+            return self.__get_position(idxs)
+        return min([self.__get_position(idx) for idx in idxs])
+
+    def object_changed(self, obj):
+        """Note that the rows holding obj need redrawing.  Changes are
+        signalled together once per main loop iteration, after rows whose
+        sort order changed are moved."""
+        idxs = self.__index.get(id(obj))
+        if idxs is None:
+            return
+        if not isinstance(idxs, list):
+            idxs = [idxs]
+        self.__changed.update(idxs)
+        if self.__order is not None:
+            # Rows not yet merged, always the last appended, are placed by
+            # their current value anyway
+            merged = len(self.__objects) - len(self.__pending)
+            self.__unsorted.update([idx for idx in idxs if idx < merged])
+        if not self.__changed_idle_id:
+            self.__changed_idle_id = call_idle(self.__idle_signal_changed)
+
+    @log_except(_logger)
+    def __idle_signal_changed(self):
+        self.__changed_idle_id = 0
+        self.flush()
+        changed = self.__changed
+        self.__changed = set()
+        positions = [self.__get_position(idx) for idx in changed]
+        positions.sort()
+        _logger.debug("signalling change of %d rows", len(positions))
+        for position in positions:
+            path = (position,)
+            self.row_changed(path, self.get_iter(path))
+
+    def set_sort_func(self, sort_column_id, func):
+        """Set the comparison function for sort_column_id; it is called
+        with two objects, and returns a negative, zero or positive number
+        like cmp()."""
+        self.__sort_funcs[sort_column_id] = func
+        if sort_column_id == self.__sort_column_id:
+            self.__resort()
+
+    def get_sort_column_id(self):
+        """Return a pair (sort_column_id, order), or (None, None) if the
+        model is unsorted."""
+        if self.__sort_column_id is None:
+            return (None, None)
+        return (self.__sort_column_id, self.__sort_order)
+
+    def set_sort_column_id(self, sort_column_id, order):
+        """Sort by the function for sort_column_id in the given gtk.SortType
+        order; None for sort_column_id restores arrival order."""
+        self.__sort_column_id = sort_column_id
+        self.__sort_order = order
+        self.__resort()
+
+    def __compare(self, obj1, obj2):
+        result = self.__sort_funcs[self.__sort_column_id](obj1, obj2)
+        if self.__sort_order == gtk.SORT_DESCENDING:
+            return -result
+        return result
+
+    def __bisect(self, obj, after=True):
+        # By default the position after any equal objects, so that ties
+        # keep their arrival order as they do in a full sort.
+        objects = self.__objects
+        order = self.__order
+        compare = self.__compare
+        lo = 0
+        hi = len(order)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            result = compare(obj, objects[order[mid]])
+            if result < 0 or (result == 0 and not after):
+                hi = mid
+            else:
+                lo = mid + 1
+        return lo
+
+    def __resort(self):
+        self.flush()
+        self.__unsorted = set()
+        old_order = self.__order
+        if self.__sort_column_id is None or self.__sort_column_id not in self.__sort_funcs:
+            self.__order = None
+        else:
+            objects = self.__objects
+            compare = self.__compare
+            self.__order = array.array('l', sorted(xrange(len(objects)),
+                                                   lambda a, b: compare(objects[a], objects[b])))
+        if not self.__objects or (old_order is None and self.__order is None):
+            return
+        # rows_reordered takes, for each new position, the old position
+        if old_order is None:
+            old_positions = xrange(len(self.__objects))
+        else:
+            old_positions = array.array('l', old_order)
+            for (position, idx) in enumerate(old_order):
+                old_positions[idx] = position
+        if self.__order is None:
+            new_order = list(old_positions)
+        else:
+            new_order = [old_positions[idx] for idx in self.__order]
+        _logger.debug("reordering %d rows", len(new_order))
+        self.rows_reordered(None, None, new_order)
+
+    def on_get_flags(self):
+        return gtk.TREE_MODEL_LIST_ONLY
+
+    def on_get_n_columns(self):
+        return 1
+
+    def on_get_column_type(self, index):
+        return gobject.TYPE_PYOBJECT
+
+    def on_get_iter(self, path):
+        position = path[0]
+        if position < self.get_n_rows():
+            return self.__rowrefs[position]
+        return None
+
+    def on_get_path(self, rowref):
+        return (rowref,)
+
+    def on_get_value(self, rowref, column):
+        return self.get_object(rowref)
+
+    def on_iter_next(self, rowref):
+        position = rowref + 1
+        if position < self.get_n_rows():
+            return self.__rowrefs[position]
+        return None
+
+    def on_iter_children(self, parent):
+        if parent is None and self.get_n_rows():
+            return self.__rowrefs[0]
+        return None
+
+    def on_iter_has_child(self, rowref):
+        return False
+
+    def on_iter_n_children(self, rowref):
+        if rowref is None:
+            return self.get_n_rows()
+        return 0
+
+    def on_iter_nth_child(self, parent, n):
+        if parent is None and n < self.get_n_rows():
+            return self.__rowrefs[n]
+        return None
+
+    def on_iter_parent(self, child):
+        return None
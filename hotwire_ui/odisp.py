@@ -16,7 +16,7 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
-import os,sys,re,Queue,logging,inspect,locale
+import os,sys,re,time,Queue,logging,inspect,locale
 
 import gtk, gobject, pango
 
@@ -28,6 +28,19 @@ import hotwire_ui.widgets as hotwidgets
 
 _logger = logging.getLogger("hotwire.ui.ODisp")
 
+# Bound on the final pipeline queue which we drain from the main loop.  This
+# is larger than the inter-command default since we consume in idle chunks;
+# only the producing command thread ever waits on it, never the UI.
+SINK_CAPACITY = (50000, 128*1024*1024)
+
+# Seconds of each main loop iteration spent moving output into the display;
+# the rest is left for redrawing and input.
+OUTPUT_BUDGET = 0.010
+# Bounds on the number of objects taken from the queue at a time.
+OUTPUT_CHUNK = (16, 4096)
+# Seconds over which display and production rates are measured.
+RATE_INTERVAL = 1.0
+
 class ObjectsDisplay(gtk.VBox):
     __gsignals__ = {
         "object-input" : (gobject.SIGNAL_RUN_LAST, gobject.TYPE_NONE, (gobject.TYPE_PYOBJECT,)),
@@ -167,7 +180,7 @@ class ObjectsDisplay(gtk.VBox):
         """Return the common Python supertype inspected from the current stream."""
         return self._common_supertype
                 
-    def append_object(self, obj, fmt=None, **kwargs):
+    def __add_otype(self, obj, fmt):
         if fmt is None:
             otype = type(obj)
         # This is kind of a hack.
@@ -181,12 +194,23 @@ class ObjectsDisplay(gtk.VBox):
         # Determine common supertype so we can display it.
         if self._common_supertype is None:
             self._common_supertype = otype
-        elif self._common_supertype is not object:
+        elif self._common_supertype is not object and otype is not self._common_supertype:
             self._common_supertype = self.__get_common_superclass(otype, self._common_supertype)       
+
+    def append_object(self, obj, fmt=None, **kwargs):
+        self.__add_otype(obj, fmt)
         # Actually append.
         if fmt is not None:
             kwargs['fmt'] = fmt
         self.__display.append_obj(obj, **kwargs)
+
+    def append_objects(self, objs, fmt=None, **kwargs):
+        """Append a list of objects, which the renderer may insert as a batch."""
+        for obj in objs:
+            self.__add_otype(obj, fmt)
+        if fmt is not None:
+            kwargs['fmt'] = fmt
+        self.__display.append_objs(objs, **kwargs)
             
     def __vadjust(self, pos, full, forceuser=False):
         adjustment = self.__scroll.get_vadjustment()
@@ -247,6 +271,11 @@ class MultiObjectsDisplay(gtk.Notebook):
         self.__queues = {}
         self.__ocount = 0
         self.__do_autoswitch = True
+        # Rate measurement for the primary output; see get_rates()
+        self.__rates = None
+        self.__rate_time = time.time()
+        self.__rate_count = 0
+        self.__rate_backlog = 0
         self.__suppress_noyield = not not list(pipeline.get_status_commands())
         self.set_show_tabs(False)
 
@@ -256,8 +285,10 @@ class MultiObjectsDisplay(gtk.Notebook):
         # FIXME assume for the moment we can only input strings; also explicitly avoid allowing input for 'any'
         # Long term we might consider only allowing input for SysBuiltin.
         if intype not in (None, 'any') and Pipeline.streamtype_is_assignable(intype, str, False) and self.__pipeline.get_input_optional():
+            # We are the producer here, so this queue is left unbounded.
             self.__inputqueue = CommandQueue()
             self.__pipeline.set_input_queue(self.__inputqueue)
+        self.__pipeline.set_edge_capacity(-1, *SINK_CAPACITY)
         self.append_ostream(pipeline.get_output_type(), None, pipeline.get_output(), False)
         for aux in pipeline.get_auxstreams():
             self.append_ostream(aux.schema.otype, aux.name, aux.queue, aux.schema.merge_default)
@@ -335,6 +366,13 @@ class MultiObjectsDisplay(gtk.Notebook):
 
     def get_status_str(self):
         return self.__default_odisp and self.__default_odisp.get_status_str()
+
+    def get_rates(self):
+        """Return a pair (displayed, produced) of the rates in objects per
+        second at which the primary output was recently taken into the display
+        and put by the pipeline, or None if not yet measured.  Production
+        outpacing display means the output is piling up in its queue."""
+        return self.__rates
     
     def get_default_output_type(self):
         return self.__default_odisp and self.__default_odisp.get_output_type()
@@ -345,56 +383,88 @@ class MultiObjectsDisplay(gtk.Notebook):
     def __on_status_change(self, odisp):
         self.emit("changed")
         
+    def __append_items(self, odisp, name, items, append_kwargs):
+        if not odisp:
+            _logger.warn("Unexpected items %s from queue %s", items, name)
+            return
+        if odisp not in self.get_children():
+            self.append_page(odisp)
+            odisp.show_all()
+            self.set_tab_label_text(odisp, name or 'Default')
+            self.set_show_tabs(True)
+        odisp.append_objects(items, **append_kwargs)
+        self.__ocount += len(items)
+        if self.__do_autoswitch:
+            self.set_current_page(self.page_num(odisp))
+            self.__do_autoswitch = False
+
+    def __update_rates(self, queue, count):
+        self.__rate_count += count
+        now = time.time()
+        elapsed = now - self.__rate_time
+        if elapsed < RATE_INTERVAL:
+            return
+        # Whatever was not displayed is still in the queue
+        backlog = queue.qsize()
+        produced = self.__rate_count + backlog - self.__rate_backlog
+        self.__rates = (self.__rate_count / elapsed, produced / elapsed)
+        _logger.debug("displayed %.0f objects/s, produced %.0f objects/s", *self.__rates)
+        self.__rate_time = now
+        self.__rate_count = 0
+        self.__rate_backlog = backlog
+
     def __idle_handle_output(self, queue):
         if self.__cancelled:
             _logger.debug("cancelled")
             return False
         empty = False
-        changed = False
         (odisp, name, merged) = self.__queues[queue]
-        odisp_displayed = odisp in self.get_children()
-        active_odisp = False
-        maxitems = 100
-        i = 0
         append_kwargs = {}
         if queue.opt_type:
             append_kwargs['fmt'] = queue.opt_type
-        try:
-            while i < maxitems:
-                i += 1
-                item = queue.get(False)
-                changed = True
-                if item is None:
-                    if name is None:
-                        self.emit("primary-complete")
-                    empty = True
-                    queue.disconnect()
-                    break
-                _logger.debug("appending item: %s", item)
-                if odisp:
-                    if not odisp_displayed:
-                        self.append_page(odisp)
-                        odisp.show_all()
-                        self.set_tab_label_text(odisp, name or 'Default')
-                        self.set_show_tabs(True)
-                        odisp_displayed = True
-                    odisp.append_object(item, **append_kwargs)
-                    self.__ocount += 1
-                    if self.__do_autoswitch:
-                        self.set_current_page(self.page_num(odisp))
-                        self.__do_autoswitch = False
-                    active_odisp = True
-                else:
-                    _logger.warn("Unexpected item %s from queue %s", item, name)
-        except Queue.Empty:
-            pass
+        # Take objects in chunks sized so the last one should finish within
+        # the time budget, judging by how long the previous one took.
+        deadline = time.time() + OUTPUT_BUDGET
+        (minchunk, maxchunk) = OUTPUT_CHUNK
+        chunk = minchunk
+        count = 0
+        while True:
+            try:
+                items = queue.get_batch(False, maxitems=chunk)
+            except Queue.Empty:
+                break
+            start = time.time()
+            if items[-1] is None:
+                items.pop()
+                empty = True
+            if items:
+                self.__append_items(odisp, name, items, append_kwargs)
+                count += len(items)
+            if empty:
+                if name is None:
+                    self.emit("primary-complete")
+                queue.disconnect()
+                break
+            now = time.time()
+            if now >= deadline:
+                break
+            per_item = (now - start) / len(items)
+            if per_item > 0:
+                chunk = int(min(chunk * 2, (deadline - now) / per_item))
+            else:
+                chunk *= 2
+            chunk = max(minchunk, min(chunk, maxchunk))
+        if name is None and not empty:
+            self.__update_rates(queue, count)
         if empty:
             del self.__queues[queue]
-        if active_odisp:
+        if count and odisp:
             odisp.do_autoscroll()
-        if changed:
+        if count or empty:
             self.emit("changed")
-        readd_idle = (not empty) and (i == maxitems)
+        # Out of time with objects left; go again once pending redraws and
+        # input have been handled.
+        readd_idle = (not empty) and (not queue.is_drained())
         _logger.debug("doing idle readd: %s", readd_idle)
         return readd_idle
 
@@ -23,10 +23,15 @@ import gtk, gobject
 import hotwire
 from hotwire.externals.singletonmixin import Singleton
 from hotwire_ui.pixbufcache import PixbufCache
+from hotwire_ui.objectlist import ObjectListModel
 import hotwire_ui.widgets as hotwidgets
 
 _logger = logging.getLogger("hotwire.ui.Render")
 
+# Beyond this many rows, tables stop sizing rows and columns from their
+# contents, so that only visible rows are rendered.
+FIXED_HEIGHT_ROWS = 10000
+
 def menuitem(name=None):
     def addtypes(f):
         setattr(f, 'hotwire_menuitem', name)
@@ -67,6 +72,12 @@ class ObjectsRenderer(gobject.GObject):
     def append_obj(self, obj, **kwargs):
         raise NotImplementedError()
 
+    def append_objs(self, objs, **kwargs):
+        """Append a list of objects; renderers which can insert a batch more
+        cheaply than one object at a time should override this."""
+        for obj in objs:
+            self.append_obj(obj, **kwargs)
+
     def get_autoscroll(self):
         return False
 
@@ -95,17 +106,13 @@ class ObjectsRenderer(gobject.GObject):
         raise NotImplementedError()
 
 class TreeObjectsRenderer(ObjectsRenderer):
-    def __init__(self, context, column_types=None, **kwargs): 
+    def __init__(self, context, **kwargs): 
         super(TreeObjectsRenderer, self).__init__(context, **kwargs)
         self.__search_enabled = False
+        self.__fixed_height = False
         self._linkcolumns = []
-        if column_types:
-            ctypes = column_types
-        else:
-            ctypes = [gobject.TYPE_PYOBJECT]
         self.context = context
-        self._liststore = gtk.ListStore(*ctypes)
-        self._model = gtk.TreeModelSort(self._liststore)
+        self._model = ObjectListModel()
         self._table = gtk.TreeView(self._model)
         #self._table.unset_flags(gtk.CAN_FOCUS)        
         self._table.get_selection().set_mode(gtk.SELECTION_MULTIPLE)
@@ -139,11 +146,8 @@ class TreeObjectsRenderer(ObjectsRenderer):
         return self._table
 
     def get_objects(self):
-        iter = self._model.get_iter_first()
-        while iter:
-            val = self._model.get_value(iter, 0)
-            yield val
-            iter = self._model.iter_next(iter)
+        for obj in self._model.iter_objects():
+            yield obj
             
     def get_selected_objects(self):
         (model, rows) = self._table.get_selection().get_selected_rows()
@@ -172,13 +176,32 @@ class TreeObjectsRenderer(ObjectsRenderer):
         col.set_data('hotwire-propname', name)
         col.set_data('hotwire-proptype', proptype)
         col.set_resizable(True)
-        col.set_sort_column_id(colidx - 1)        
+        col.set_data('hotwire-sort-column-id', colidx-1)
+        col.set_clickable(True)
+        col.connect('clicked', self.__on_column_clicked)
         if sortfunc:
             self._model.set_sort_func(colidx-1, sortfunc)
         else:
-            self._model.set_sort_func(colidx-1, self._default_compare, (idx, valuefunc or (lambda x: getattr(x, name))))
+            value_func = valuefunc or (lambda x: getattr(x, name))
+            self._model.set_sort_func(colidx-1, lambda obj1, obj2: self._default_compare(obj1, obj2, value_func))
         return col        
 
+    def __on_column_clicked(self, col):
+        sort_column_id = col.get_data('hotwire-sort-column-id')
+        if self._model.get_sort_column_id() == (sort_column_id, gtk.SORT_ASCENDING):
+            order = gtk.SORT_DESCENDING
+        else:
+            order = gtk.SORT_ASCENDING
+        self._set_sort_column(sort_column_id, order)
+
+    def _set_sort_column(self, sort_column_id, order):
+        self._model.set_sort_column_id(sort_column_id, order)
+        for col in self._table.get_columns():
+            is_sort_column = (col.get_data('hotwire-sort-column-id') == sort_column_id)
+            col.set_sort_indicator(is_sort_column)
+            if is_sort_column:
+                col.set_sort_order(order)
+
     def _insert_proptext(self, name, title=None, **kwargs):
         return self._insert_column(name, proptype=unicode, title=title, renderfunc=self._render_proptext, **kwargs)
 
@@ -192,10 +215,7 @@ class TreeObjectsRenderer(ObjectsRenderer):
                 return column
         raise KeyError(name)
 
-    def _default_compare(self, model, iter1, iter2, args):
-        (idx, value_func) = args        
-        obj1 = model.get_value(iter1, idx)
-        obj2 = model.get_value(iter2, idx)
+    def _default_compare(self, obj1, obj2, value_func):
         if obj1 is None and obj2 is not None:
             return 1
         elif obj1 is not None and obj2 is None:
@@ -257,25 +277,36 @@ class TreeObjectsRenderer(ObjectsRenderer):
         return True
 
     def _findobj(self, obj, colidx=0):
-        iter = self._model.get_iter_first()
-        while iter:
-            val = self._model.get_value(iter, colidx)
-            if val == obj:
-                return iter
-            iter = self._model.iter_next(iter)
+        position = self._model.find_object(obj)
+        if position is not None:
+            return self._model.get_iter((position,))
 
     def _signal_obj_changed(self, obj, colidx=0):
-        iter = self._findobj(obj, colidx=colidx)
-        assert iter
-        _logger.debug("signaling change of %r", iter) 
-        self._model.row_changed(self._model.get_path(iter), iter)
+        _logger.debug("signaling change of %r", obj) 
+        self._model.object_changed(obj)
 
     def _render_objtext(self, col, cell, model, iter):
         obj = model.get_value(iter, 0)
         cell.set_property('text', unicode(repr(obj)))
 
     def append_obj(self, obj, **kwargs):
-        self._liststore.append((obj,))
+        self._model.append((obj,))
+
+    def append_objs(self, objs, **kwargs):
+        super(TreeObjectsRenderer, self).append_objs(objs, **kwargs)
+        self._model.flush()
+        if not self.__fixed_height and self._model.get_n_rows() >= FIXED_HEIGHT_ROWS:
+            self.__set_fixed_height()
+
+    def __set_fixed_height(self):
+        # Columns keep the widths they have now
+        self.__fixed_height = True
+        for col in self._table.get_columns():
+            width = col.get_width()
+            col.set_sizing(gtk.TREE_VIEW_COLUMN_FIXED)
+            if width > 0:
+                col.set_fixed_width(width)
+        self._table.set_fixed_height_mode(True)
 
     def __onclick(self, path, col, rel_x, rel_y):
         iter = self._model.get_iter(path)
@@ -27,9 +27,11 @@ from hotwire.command import Pipeline
 from hotwire.fs import FilePath, unix_basename, path_unabs
 from hotwire_ui.render import TreeObjectsRenderer, ClassRendererMapping, menuitem
 from hotwire.sysdep.fs import Filesystem, File
+from hotwire.builtins.du import DiskUsage
 from hotwire.sysdep.sysenv import SystemEnvironment, GnomeSystemEnvironment
 from hotwire.sysdep import is_unix, is_windows
 from hotwire.logutil import log_except
+from hotwire.gutil import call_idle
 from hotwire_ui.pixbufcache import PixbufCache
 from hotwire_ui.adaptors.editors import EditorRegistry
 from hotwire.util import format_file_size, quote_arg
@@ -40,11 +42,10 @@ _logger = logging.getLogger("hotwire.ui.render.File")
 
 class FilePathRenderer(TreeObjectsRenderer):
     def __init__(self, *args, **kwargs):
-        if not 'column_types' in kwargs.iterkeys():
-            kwargs['column_types'] = [gobject.TYPE_PYOBJECT]
         self.__fs = Filesystem.getInstance()
         self.__basedir = None
         self.__windows_basedir = None
+        self.__prefetch_pending = []
         super(FilePathRenderer, self).__init__(*args,
                                                **kwargs)
         self._table.enable_model_drag_source(gtk.gdk.BUTTON1_MASK,
@@ -65,10 +66,7 @@ class FilePathRenderer(TreeObjectsRenderer):
         # return value intentionally reversed
         return not matches
 
-    def __compare_paths(self, model, iter1, iter2):
-        ob1 = self._file_for_iter(model, iter1)
-        ob2 = self._file_for_iter(model, iter2)
-
+    def __compare_paths(self, ob1, ob2):
         # fixme: I guess this check shouldn't be necessary here
         if (ob1 == None or ob2 == None):
             return 0
@@ -109,7 +107,7 @@ class FilePathRenderer(TreeObjectsRenderer):
                             family='Monospace')
         
         # Sort on path by default
-        self._model.set_sort_column_id(1, gtk.SORT_ASCENDING)        
+        self._set_sort_column(1, gtk.SORT_ASCENDING)
         
         self.__sync_visible_columns()
 
@@ -177,12 +175,24 @@ class FilePathRenderer(TreeObjectsRenderer):
         self._signal_obj_changed(fobj, colidx=0)
 
     def _get_row(self, obj):
-        if isinstance(obj, File):
+        if isinstance(obj, (File, DiskUsage)):
             fobj = obj
         else:
             fobj = self.__fs.get_file(obj)
         dispatcher.connect(self.__handle_file_change, sender=fobj)
+        if not fobj.is_fetched('stat', 'icon'):
+            # Files from e.g. walk are lazy; fetch their attributes in the
+            # background, in one batch per mainloop iteration.
+            if not self.__prefetch_pending:
+                call_idle(self.__idle_prefetch)
+            self.__prefetch_pending.append(fobj)
         return (fobj,)
+
+    @log_except(_logger)
+    def __idle_prefetch(self):
+        pending = self.__prefetch_pending
+        self.__prefetch_pending = []
+        self.__fs.prefetch_files(pending, ('stat', 'icon'))
     
     def append_obj(self, obj, **kwargs):
         row = self._get_row(obj)
@@ -194,16 +204,16 @@ class FilePathRenderer(TreeObjectsRenderer):
                 # Windows has a more complicated notion of base directory.
                 if is_windows():
                     self.__windows_basedir = os.path.splitdrive(self.__basedir)[-1]               
-                for row in self._liststore:
-                    self._liststore.row_changed(row.path, row.iter)
+                for row in self._model:
+                    self._model.row_changed(row.path, row.iter)
             elif bn.startswith(self.__basedir):
                 pass
             else:
                 _logger.debug("basedir %s does not match %s", self.__basedir, bn)                
                 self.__basedir = False
-                for row in self._liststore:
-                    self._liststore.row_changed(row.path, row.iter)                
-        self._liststore.append(row)
+                for row in self._model:
+                    self._model.row_changed(row.path, row.iter)                
+        self._model.append(row)
 
     def _onclick_iter(self, iter):
         self.__do_open(self._file_for_iter(self._model, iter))
@@ -319,7 +329,8 @@ class FilePathRenderer(TreeObjectsRenderer):
         prefs = Preferences.getInstance()
         self.__folders_before_files = prefs.get_pref('hotwire.ui.render.File.general.foldersbeforefiles', default=True)
         # Redo sort
-        self._model.set_sort_column_id(1, gtk.SORT_ASCENDING)        
+        self._set_sort_column(1, gtk.SORT_ASCENDING)
 
 ClassRendererMapping.getInstance().register(File, FilePathRenderer)
 ClassRendererMapping.getInstance().register(FilePath, FilePathRenderer)
+ClassRendererMapping.getInstance().register(DiskUsage, FilePathRenderer)
@@ -157,7 +157,10 @@ class HelpItemRenderer(UnicodeRenderer):
         if not builtin.options:
             self._buf.insert_markup('    <i>%s</i>\n' % (_('(No options)'),))
         else:
-            argstr = '  '.join(map(lambda x: ','.join(x), builtin.options))
+            def optstr(aliases):
+                metavar = getattr(aliases, 'metavar', None)
+                return ','.join(aliases) + (metavar and (' ' + metavar) or '')
+            argstr = '  '.join(map(optstr, builtin.options))
             self._buf.insert_markup('    %s: ' % (_('Options'),))
             self._buf.insert_markup('<tt>' + gobject.markup_escape_text(argstr) + '</tt>')
             self._buf.insert_markup('\n')                
@@ -16,7 +16,7 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 
-import os,sys,logging,locale,codecs,gettext
+import os,sys,logging,locale,codecs,gettext,itertools
 
 # Older webbrowser.py didn't check gconf
 from hotwire.sysdep import is_windows
@@ -321,6 +321,15 @@ class UnicodeRenderer(ObjectsRenderer):
         else:
             self.__append_chunk(obj)
         
+    def append_objs(self, objs, fmt=None):
+        # Each run of plain strings becomes a single buffer insertion
+        for (otype, run) in itertools.groupby(objs, type):
+            if otype in (str, unicode):
+                self.append_obj(otype().join(run), fmt=fmt)
+            else:
+                for obj in run:
+                    self.append_obj(obj, fmt=fmt)
+
     def __spawn_terminal(self, fd, buf):
         # Undo terminal mode changes from sys_builtin.py
         import termios